@@ -0,0 +1,152 @@
+"""Synthetic but realistic input data of any size, for benchmarking
+
+All generators take a seed, so that the same size always gives the same data.
+"""
+import datetime
+import random
+from decimal import Decimal
+
+from sitdown.core import BankAccount, Mutation
+
+SHOPS = ["Albert Heijn", "Jumbo", "Lidl", "Aldi", "HEMA", "Kruidvat", "Etos",
+         "Blokker", "Action", "Gamma", "Praxis", "IKEA", "Bol.com", "Coolblue",
+         "Zalando", "Thuisbezorgd", "NS Reizigers", "Shell", "BP", "Esso",
+         "Bakkerij de Vries", "Slagerij Jansen", "Cafe de Zwaan", "Bar Centraal",
+         "Restaurant Vis", "Sportschool Fit", "Zwembad Noord", "Bioscoop Pathe",
+         "Boekhandel Dekker", "Apotheek West"]
+CITIES = ["AMSTERDAM", "UTRECHT", "ROTTERDAM", "DEN HAAG", "GRONINGEN", "LEIDEN"]
+BANKS = [("INGB", "INGBNL2A"), ("ABNA", "ABNANL2A"), ("RABO", "RABONL2U"),
+         ("SNSB", "SNSBNL2A"), ("TRIO", "TRIONL2U")]
+
+
+def random_iban(rng):
+    """Dutch IBAN-like account number, like NL86INGB0008435588"""
+    bank, _ = rng.choice(BANKS)
+    return f"NL{rng.randint(10, 99)}{bank}{rng.randint(0, 9999999999):010d}"
+
+
+def random_description(rng):
+    """Description in one of the styles found in ABN AMRO exports"""
+    kind = rng.random()
+    shop = rng.choice(SHOPS)
+    if kind < 0.5:
+        day = f"{rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.19"
+        return (f"BEA   NR:{rng.randint(10000000, 99999999)} {day}/"
+                f"{rng.randint(0, 23):02d}.{rng.randint(0, 59):02d} "
+                f"{shop.upper()} {rng.choice(CITIES)},PAS{rng.randint(100, 999)}")
+    bank, bic = rng.choice(BANKS)
+    iban = random_iban(rng)
+    if kind < 0.8:
+        return (f"SEPA iDEAL                       IBAN: {iban}        "
+                f"BIC: {bic}                    Naam: {shop}             "
+                f"Omschrijving: {rng.randint(10 ** 9, 10 ** 10)} Order "
+                f"#{rng.randint(10 ** 8, 10 ** 9)}")
+    return (f"SEPA Overboeking                 IBAN: {iban}        "
+            f"BIC: {bic}                    Naam: {shop}             "
+            f"Kenmerk: {rng.randint(10 ** 15, 10 ** 16)}")
+
+
+def format_amount(minor_units):
+    """ABN AMRO amount format, like -3,15"""
+    sign = "-" if minor_units < 0 else ""
+    return f"{sign}{abs(minor_units) // 100},{abs(minor_units) % 100:02d}"
+
+
+def generate_rows(n_rows, seed=1234, n_accounts=3,
+                  start_date=datetime.date(2000, 1, 1)):
+    """Rows of mutation data with consistent running balances per account
+
+    Yields
+    ------
+    Tuple[str, int, datetime.date, int, int, str]
+        account number, amount in minor units, date, balance before and balance
+        after in minor units, description. Sorted by date per account
+    """
+    rng = random.Random(seed)
+    accounts = [f"{rng.randint(100000000, 999999999)}" for _ in range(n_accounts)]
+    balances = {x: rng.randint(0, 500000) for x in accounts}
+    # on average a few mutations per day per account
+    days = max(n_rows // (3 * n_accounts), 1)
+    for i in range(n_rows):
+        account = accounts[i % n_accounts]
+        date = start_date + datetime.timedelta(days=(i * days) // n_rows)
+        amount = -rng.randint(100, 20000) if rng.random() < 0.85 \
+            else rng.randint(1000, 400000)
+        before = balances[account]
+        balances[account] = before + amount
+        yield account, amount, date, before, before + amount, random_description(rng)
+
+
+def write_tab_file(path, n_rows, seed=1234, n_accounts=3):
+    """Write an ABN AMRO style .TAB export
+
+    Parameters
+    ----------
+    path: Path or str
+    n_rows: int
+    seed: int, optional
+    n_accounts: int, optional
+
+    Returns
+    -------
+    int
+        size of the written file in bytes
+    """
+    with open(path, "w") as f:
+        for account, amount, date, before, after, description in \
+                generate_rows(n_rows, seed, n_accounts):
+            day = date.strftime("%Y%m%d")
+            f.write("\t".join([account, "EUR", day, format_amount(before),
+                               format_amount(after), day, format_amount(amount),
+                               description]) + "\n")
+        return f.tell()
+
+
+def generate_mutations(n_rows, seed=1234, n_accounts=3):
+    """Mutation objects like ABNAMROReader would create them, without parsing
+
+    Returns
+    -------
+    Set[Mutation]
+    """
+    accounts = {}
+    mutations = set()
+    for account, amount, date, before, after, description in \
+            generate_rows(n_rows, seed, n_accounts):
+        if account not in accounts:
+            accounts[account] = BankAccount(number=account)
+        mutations.add(Mutation(amount=Decimal(amount).scaleb(-2), date=date,
+                               account=accounts[account], currency="EUR",
+                               description=description,
+                               balance_before=Decimal(before).scaleb(-2),
+                               balance_after=Decimal(after).scaleb(-2)))
+    return mutations
+
+
+def write_classifier_yaml(path, n_rules, seed=1234, n_groups=10):
+    """Write a YAML classifier definition with n_rules match strings, nested in
+    n_groups top level categories with a few sub-categories each. Rules include
+    all shop names, so that most generated mutations are classified
+
+    Parameters
+    ----------
+    path: Path or str
+    n_rules: int
+    seed: int, optional
+    n_groups: int, optional
+    """
+    rng = random.Random(seed)
+    rules = list(SHOPS) + [f"Merchant {i:05d}" for i in range(n_rules - len(SHOPS))]
+    rules = rules[:n_rules]
+    rng.shuffle(rules)
+    with open(path, "w") as f:
+        for group in range(n_groups):
+            group_rules = rules[group::n_groups]
+            if not group_rules:
+                continue
+            f.write(f"group_{group}:\n")
+            n_subs = min(3, len(group_rules))
+            for sub in range(n_subs):
+                f.write(f"  - sub_{group}_{sub}:\n")
+                for rule in group_rules[sub::n_subs]:
+                    f.write(f"      - {rule}\n")
@@ -0,0 +1,65 @@
+"""Measure how long it takes to import sitdown modules in a fresh interpreter
+
+Usage:
+    python -m benchmarks.import_time [--budget-ms 100] [--runs 5]
+
+For each module, reports the best cumulative import time of several runs of
+`python -X importtime -c "import <module>"`, including everything that module
+imports. Also reports which heavy dependencies were imported as a side effect.
+Exits with code 1 if any text-only module exceeds the budget or pulls in a heavy
+dependency.
+"""
+import argparse
+import subprocess
+import sys
+
+HEAVY = ("numpy", "matplotlib", "yaml")
+
+# modules that text-only commands need. These should stay fast
+TEXT_ONLY = ("sitdown.cli", "sitdown.core", "sitdown.readers", "sitdown.filters",
+             "sitdown.classifiers", "sitdown.views", "sitdown.query",
+             "sitdown.cache")
+
+
+def time_import(module, runs):
+    """Best cumulative import time of module in seconds, in a fresh interpreter"""
+    times = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            check=True, stderr=subprocess.PIPE, universal_newlines=True).stderr
+        # lines look like 'import time:  self [us] | cumulative | imported package'
+        cumulative = [int(x.split("|")[1]) for x in output.splitlines()
+                      if x.split("|")[-1].strip() == module]
+        times.append(cumulative[-1] / 1e6)
+    return min(times)
+
+
+def heavy_imports(module):
+    """Heavy dependencies that are imported by importing module"""
+    check = (f"import sys, {module}; "
+             f"print(' '.join(x for x in {HEAVY!r} if x in sys.modules))")
+    output = subprocess.run([sys.executable, "-c", check], check=True,
+                            stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return output.split()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--budget-ms", type=float, default=100)
+    parser.add_argument("--runs", type=int, default=5)
+    parsed = parser.parse_args(args)
+
+    print(f"{'module':<24}{'import ms':>10}  heavy imports")
+    failed = False
+    for module in TEXT_ONLY:
+        elapsed = time_import(module, parsed.runs) * 1000
+        heavy = heavy_imports(module)
+        if elapsed > parsed.budget_ms or heavy:
+            failed = True
+        print(f"{module:<24}{elapsed:>10.1f}  {', '.join(heavy) or '-'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+"""Time the main sitdown operations on synthetic data of increasing size
+
+Usage:
+    python -m benchmarks.run [--sizes 1000 10000 100000] [--only reader classify]
+                             [--output results.json] [--baseline baseline.json]
+                             [--save-baseline] [--tolerance 0.25]
+
+Results are written as JSON. If a baseline file is given, each timing is compared
+to the baseline and the run exits with code 1 if anything got slower than the
+tolerance allows. --save-baseline writes the results to the baseline file instead.
+
+Sizes up to 10**7 work, but generating that many mutations takes several GB of
+memory and a few minutes.
+"""
+import argparse
+import datetime
+import json
+import platform
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from benchmarks.generators import SHOPS, generate_mutations, write_tab_file, \
+    write_classifier_yaml
+
+DEFAULT_SIZES = (10 ** 3, 10 ** 4, 10 ** 5)
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name):
+    """Register a benchmark. The decorated function is called with size and a work
+    dir, does all setup and returns a function without arguments to time"""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+class Inputs:
+    """Generated inputs, shared between benchmarks of the same size"""
+
+    mutations = {}
+    filtered = {}
+
+    @classmethod
+    def get_mutations(cls, size):
+        if size not in cls.mutations:
+            cls.mutations[size] = generate_mutations(size)
+        return cls.mutations[size]
+
+    @classmethod
+    def get_filtered(cls, size):
+        if size not in cls.filtered:
+            cls.filtered[size] = shop_filter_set().get_filtered_data_set(
+                cls.get_mutations(size))
+        return cls.filtered[size]
+
+
+def shop_filter_set():
+    from sitdown.filters import FilterSet, StringFilter, CatchAllFilter
+    return FilterSet(filters=[StringFilter(x) for x in SHOPS[:20]] +
+                     [CatchAllFilter(description="Rest")])
+
+
+@benchmark("reader")
+def reader_benchmark(size, workdir):
+    from sitdown.readers import ABNAMROReader
+    path = workdir / f"mutations_{size}.TAB"
+    if not path.exists():
+        write_tab_file(path, size)
+    reader = ABNAMROReader()
+    return lambda: reader.read(path)
+
+
+@benchmark("reader_columns")
+def reader_columns_benchmark(size, workdir):
+    from sitdown.readers import ABNAMROReader
+    path = workdir / f"mutations_{size}.TAB"
+    if not path.exists():
+        write_tab_file(path, size)
+    reader = ABNAMROReader()
+    return lambda: reader.read_columns(path)
+
+
+@benchmark("classify")
+def classify_benchmark(size, workdir):
+    from sitdown.classifiers import string_match_classifier_from_yaml
+    path = workdir / "classifier.yaml"
+    if not path.exists():
+        write_classifier_yaml(path, n_rules=300)
+    with open(path) as f:
+        classifier = string_match_classifier_from_yaml(f)
+    mutations = Inputs.get_mutations(size)
+    return lambda: [classifier.classify(x) for x in mutations]
+
+
+@benchmark("filter_set")
+def filter_set_benchmark(size, workdir):
+    filter_set = shop_filter_set()
+    mutations = Inputs.get_mutations(size)
+    return lambda: filter_set.get_filtered_data_set(mutations)
+
+
+@benchmark("month_set")
+def month_set_benchmark(size, workdir):
+    from sitdown.views import MonthSet
+    mutations = Inputs.get_mutations(size)
+    return lambda: MonthSet(mutations).sums()
+
+
+@benchmark("month_matrix")
+def month_matrix_benchmark(size, workdir):
+    from sitdown.views import MonthMatrix
+    filtered = Inputs.get_filtered(size)
+    return lambda: MonthMatrix(filtered_data_list=filtered).matrix()
+
+
+def measure(function, repeat):
+    """Best wall time of repeat calls of function, in seconds"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def run(names, sizes, workdir):
+    """Run benchmarks
+
+    Returns
+    -------
+    Dict
+        {benchmark name: {size: {'seconds': float, 'rows_per_second': float}}}.
+        If a benchmark fails, its entry is {'error': str} instead
+    """
+    results = OrderedDict()
+    for name in names:
+        results[name] = OrderedDict()
+        for size in sizes:
+            try:
+                function = BENCHMARKS[name](size, workdir)
+                seconds = measure(function, repeat=3 if size <= 10 ** 5 else 1)
+                entry = {"seconds": seconds, "rows_per_second": size / seconds}
+            except Exception as e:
+                entry = {"error": f"{type(e).__name__}: {e}"}
+            results[name][str(size)] = entry
+            print(f"{name:<14}{size:>10}  " + (
+                f"{entry['seconds']:>9.4f}s {entry['rows_per_second']:>12.0f} rows/s"
+                if "seconds" in entry else entry["error"]))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Compare results to a baseline
+
+    Returns
+    -------
+    List[str]
+        description of each timing that is slower than baseline * (1 + tolerance)
+    """
+    regressions = []
+    for name, per_size in results.items():
+        for size, entry in per_size.items():
+            old = baseline.get(name, {}).get(size, {})
+            if "seconds" not in entry or "seconds" not in old:
+                continue
+            ratio = entry["seconds"] / old["seconds"]
+            print(f"{name:<14}{size:>10}  {ratio:>6.2f}x baseline")
+            if ratio > 1 + tolerance:
+                regressions.append(f"{name} at {size} rows is {ratio:.2f}x slower")
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS),
+                        default=list(BENCHMARKS))
+    parser.add_argument("--output", type=Path, default=Path("benchmark_results.json"))
+    parser.add_argument("--baseline", type=Path, default=None)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--workdir", type=Path, default=None,
+                        help="Keep generated files here. Defaults to a temp dir")
+    parsed = parser.parse_args(args)
+
+    with tempfile.TemporaryDirectory() as temp:
+        workdir = parsed.workdir or Path(temp)
+        workdir.mkdir(parents=True, exist_ok=True)
+        results = run(parsed.only, parsed.sizes, workdir)
+
+    report = {"meta": {"date": datetime.datetime.now().isoformat(),
+                       "python": platform.python_version(),
+                       "platform": platform.platform()},
+              "results": results}
+    output = parsed.baseline if parsed.save_baseline else parsed.output
+    if output is None:
+        parser.error("--save-baseline needs --baseline")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if parsed.baseline and not parsed.save_baseline:
+        with open(parsed.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, parsed.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""Compare parsing throughput of ABN AMRO .TAB files in MB/s
+
+Usage:
+    python -m benchmarks.tab_throughput [--rows 200000] [--runs 3]
+
+Times the line by line ABNAMROReader.read() against the memory-mapped
+ABNAMROReader.read_columns(), with and without converting the columns to
+Mutation objects, on a generated file.
+"""
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.generators import write_tab_file
+
+
+def methods():
+    from sitdown.readers import ABNAMROReader
+    return {
+        "read()": lambda path: ABNAMROReader().read(path),
+        "mmap read_columns()": lambda path: ABNAMROReader().read_columns(path),
+        "mmap read_columns().mutations()":
+            lambda path: ABNAMROReader().read_columns(path).mutations(ABNAMROReader()),
+    }
+
+
+def throughput(function, path, runs):
+    """Best throughput of function(path) over runs, in MB/s"""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function(path)
+        times.append(time.perf_counter() - start)
+    return os.path.getsize(path) / min(times) / 1e6
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--runs", type=int, default=3)
+    parsed = parser.parse_args(args)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as temp:
+        path = Path(temp) / "mutations.TAB"
+        size = write_tab_file(path, parsed.rows)
+        print(f"{parsed.rows} rows, {size / 1e6:.1f} MB")
+        for name, function in methods().items():
+            try:
+                results[name] = throughput(function, path, parsed.runs)
+                print(f"{name:<34}{results[name]:>8.1f} MB/s")
+            except Exception as e:
+                print(f"{name:<34}  {type(e).__name__}: {e}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
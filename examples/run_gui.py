@@ -1,36 +1,22 @@
-from PyQt5.QtCore import QSortFilterProxyModel, QRegExp, Qt
 from PyQt5.QtWidgets import QApplication
 from sitdown.gui.mainwindow import MainAnotatorWindow, MutationsTableModel
-from sitdown.readers import ABNAMROReader
-from tests import RESOURCE_PATH
-from tests.conftest import generate_mutation_sequence
+from sitdown.readers import read_file
 import sys
 
 
-def run_gui():
-
-    # Get some mutations
-    #mutations = generate_mutation_sequence(50)
-
-    reader = ABNAMROReader()
-    path = r"C:\Users\z428172\Documents\financien\2019\transacties\TXT190210094911.TAB"
-    mutations = reader.read(path)
+def run_gui(paths):
+    """Browse and search the mutations in one or more exported files"""
+    mutations = sorted(set().union(*(read_file(x) for x in paths)), key=lambda x: x.date)
 
     app = QApplication(sys.argv)
     window = MainAnotatorWindow()
 
+    # sorts and searches by itself. A QSortFilterProxyModel would go through
+    # every row in Python for each key press
     model = MutationsTableModel(mutations)
-    proxy = QSortFilterProxyModel()
-    proxy.setSourceModel(model)
-    #proxy.sortByColumn(MutationsTableModel.column_numbers['description'], Qt.AscendingOrder)
-    regExp = QRegExp("",
-                     Qt.CaseInsensitive, QRegExp.RegExp)
-    proxy.setFilterRegExp(regExp)
-
-    window.mutationsListView.setModel(proxy)
+    window.set_model(model)
     window.show()
     sys.exit(app.exec_())
 
 
-run_gui()
-
+run_gui(sys.argv[1:])
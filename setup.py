@@ -34,12 +34,13 @@ setup(
         ],
     },
     install_requires=requirements,
+    extras_require={'arrow': ['pyarrow>=13'], 'gui': ['PyQt5>=5.12']},
     license="MIT license",
     long_description=readme + '\n\n' + history,
     include_package_data=True,
     keywords='sitdown',
     name='sitdown',
-    packages=find_packages(include=['sitdown']),
+    packages=find_packages(include=['sitdown', 'sitdown.*']),
     setup_requires=setup_requirements,
     test_suite='tests',
     tests_require=test_requirements,
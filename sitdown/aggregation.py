@@ -0,0 +1,168 @@
+"""Exact aggregation of mutation amounts
+
+Amounts come in as float (ABNAMROReader) or Decimal (most other sources). Summing
+Decimals is exact but slow, summing floats is fast but not exact. Here amounts
+are stored as int64 counts of minor currency units (cents). Sums over these are
+both exact and vectorized. Results are converted back to Decimal only when they
+are handed back to the caller.
+"""
+from decimal import Decimal, ROUND_HALF_EVEN
+
+from sitdown.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+MINOR_UNIT_EXPONENT = 2  # number of decimals in minor units. 2 means cents
+SCALE = 10 ** MINOR_UNIT_EXPONENT
+
+
+def to_minor_units(amount) -> int:
+    """Convert a single amount to an integer number of minor units
+
+    Parameters
+    ----------
+    amount: Decimal, float or int
+        amount in major units, like 12.79
+
+    Returns
+    -------
+    int
+        amount in minor units, like 1279. Rounded half-even if amount has more
+        decimals than minor units can hold
+    """
+    if isinstance(amount, Decimal):
+        return int(amount.scaleb(MINOR_UNIT_EXPONENT).to_integral_value(
+            rounding=ROUND_HALF_EVEN))
+    if isinstance(amount, int):
+        return amount * SCALE
+    # float. 12.79 * 100 is 1278.9999999999998. Rounding is exact for any
+    # realistic amount (< 2**53 minor units)
+    return int(round(amount * SCALE))
+
+
+def from_minor_units(value) -> Decimal:
+    """Convert an integer number of minor units back to an amount
+
+    Parameters
+    ----------
+    value: int or numpy.integer
+        amount in minor units, like 1279
+
+    Returns
+    -------
+    Decimal
+        amount in major units, like Decimal('12.79')
+    """
+    return Decimal(int(value)).scaleb(-MINOR_UNIT_EXPONENT)
+
+
+def to_minor_units_array(amounts) -> 'np.ndarray':
+    """Convert a sequence of amounts to an int64 array of minor units
+
+    Parameters
+    ----------
+    amounts: Sequence[Decimal, float or int]
+
+    Returns
+    -------
+    numpy.ndarray
+        int64 array of the same length as amounts
+    """
+    amounts = list(amounts)
+    if amounts and all(type(x) is float for x in amounts):
+        # fast path for reader output
+        return np.rint(np.array(amounts, dtype=float) * SCALE).astype(np.int64)
+    return np.fromiter((to_minor_units(x) for x in amounts), dtype=np.int64,
+                       count=len(amounts))
+
+
+class AmountArray:
+    """The amounts of a collection of mutations, as int64 minor units"""
+
+    def __init__(self, minor_units):
+        """
+
+        Parameters
+        ----------
+        minor_units: array-like of int
+            amounts in minor units
+        """
+        self.minor_units = np.asarray(minor_units, dtype=np.int64)
+
+    @classmethod
+    def from_amounts(cls, amounts):
+        """Create from amounts in major units
+
+        Parameters
+        ----------
+        amounts: Sequence[Decimal, float or int]
+
+        Returns
+        -------
+        AmountArray
+        """
+        return cls(to_minor_units_array(amounts))
+
+    @classmethod
+    def from_mutations(cls, mutations):
+        """Create from the amounts of the given mutations
+
+        Parameters
+        ----------
+        mutations: Iterable[Mutation]
+
+        Returns
+        -------
+        AmountArray
+        """
+        return cls.from_amounts([x.amount for x in mutations])
+
+    def __len__(self):
+        return len(self.minor_units)
+
+    def sum(self) -> Decimal:
+        """Exact sum of all amounts"""
+        return from_minor_units(self.minor_units.sum())
+
+    def sum_in(self) -> Decimal:
+        """Exact sum of all positive amounts"""
+        return from_minor_units(self.minor_units[self.minor_units > 0].sum())
+
+    def sum_out(self) -> Decimal:
+        """Exact sum of all negative amounts"""
+        return from_minor_units(self.minor_units[self.minor_units < 0].sum())
+
+    def decimals(self):
+        """All amounts as Decimal
+
+        Returns
+        -------
+        List[Decimal]
+        """
+        return [from_minor_units(x) for x in self.minor_units]
+
+    def grouped_sums(self, groups, n_groups, where=None) -> 'np.ndarray':
+        """Exact sum of amounts per group, in minor units
+
+        Parameters
+        ----------
+        groups: array-like of int
+            group index for each amount, in range [0, n_groups)
+        n_groups: int
+            number of groups in output
+        where: array-like of bool, optional
+            Only sum amounts for which this is True. Defaults to summing all
+
+        Returns
+        -------
+        numpy.ndarray
+            int64 array of length n_groups
+        """
+        groups = np.asarray(groups, dtype=np.int64)
+        values = self.minor_units
+        if where is not None:
+            where = np.asarray(where, dtype=bool)
+            groups, values = groups[where], values[where]
+        sums = np.zeros(n_groups, dtype=np.int64)
+        np.add.at(sums, groups, values)
+        return sums
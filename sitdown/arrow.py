@@ -0,0 +1,388 @@
+"""Conversion of mutations to and from Arrow tables and Parquet files
+
+For handing mutations to Arrow-based tools (pandas, polars, duckdb) without going
+through pickle or Mutation objects on their side. Requires pyarrow, which is not
+installed with sitdown. Columns are typed:
+
+    amount, balance_before, balance_after   decimal128(18, 2)
+    date                                    date32
+    account, account_description, currency,
+    opposite_account, opposite_account_description,
+    description                             dictionary<int32, string>
+    categories                              list<int32>
+
+Category ids index into a category table stored as JSON in the schema metadata
+under 'sitdown.categories', as [name, parent id] pairs. Account numbers are stored
+as strings. opposite_account_description is null for opposite accounts that are
+plain strings rather than BankAccounts.
+
+Amounts are written from and read into int64 minor units directly, never through
+Decimal objects.
+"""
+import datetime
+import json
+from itertools import islice
+
+from sitdown.aggregation import AmountArray, MINOR_UNIT_EXPONENT, from_minor_units, \
+    to_minor_units
+from sitdown.lazy import lazy_import
+
+np = lazy_import("numpy")
+pa = lazy_import("pyarrow")
+pq = lazy_import("pyarrow.parquet")
+
+CHUNK_SIZE = 100000  # mutations per Parquet row group
+CATEGORIES_KEY = b"sitdown.categories"
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+def decimal_type():
+    return pa.decimal128(18, MINOR_UNIT_EXPONENT)
+
+
+def schema(categories=()):
+    """Arrow schema of mutation tables
+
+    Parameters
+    ----------
+    categories: List[Category], optional
+        stored in the metadata. Defaults to none
+
+    Returns
+    -------
+    pyarrow.Schema
+    """
+    text = pa.dictionary(pa.int32(), pa.string())
+    fields = [("amount", decimal_type()), ("date", pa.date32()),
+              ("account", text), ("account_description", text),
+              ("currency", text), ("opposite_account", text),
+              ("opposite_account_description", text), ("description", text),
+              ("balance_before", decimal_type()), ("balance_after", decimal_type()),
+              ("categories", pa.list_(pa.int32()))]
+    return pa.schema(fields, metadata={CATEGORIES_KEY: category_table(categories)})
+
+
+def category_table(categories):
+    """categories as JSON [name, parent id] pairs. Parents come before children"""
+    return json.dumps([[x.name, categories.index(x.parent) if x.parent else None]
+                       for x in categories]).encode()
+
+
+def decimal_array(minor_units, valid=None):
+    """decimal128 array from int64 minor units, without Decimal objects
+
+    Parameters
+    ----------
+    minor_units: numpy.ndarray
+    valid: numpy.ndarray, optional
+        bool per value, False for nulls. Defaults to all valid
+
+    Returns
+    -------
+    pyarrow.Array
+    """
+    minor_units = np.asarray(minor_units, dtype=np.int64)
+    # decimal128 is the unscaled value as 16 byte little endian two's complement
+    words = np.empty((len(minor_units), 2), dtype=np.int64)
+    words[:, 0] = minor_units
+    words[:, 1] = minor_units >> 63
+    validity = None
+    if valid is not None and not valid.all():
+        validity = pa.array(valid, type=pa.bool_()).buffers()[1]
+    return pa.Array.from_buffers(decimal_type(), len(minor_units),
+                                 [validity, pa.py_buffer(words)])
+
+
+def minor_units(array):
+    """int64 minor units of a decimal array, without Decimal objects
+
+    Parameters
+    ----------
+    array: pyarrow.Array or pyarrow.ChunkedArray
+        decimal128. Values need to fit in int64 minor units
+
+    Returns
+    -------
+    Tuple[numpy.ndarray, numpy.ndarray]
+        minor units and bool valid per value. Nulls have minor units 0
+    """
+    if array.type != decimal_type():
+        array = array.cast(decimal_type())
+    chunks = array.chunks if isinstance(array, pa.ChunkedArray) else [array]
+    values = []
+    for chunk in chunks:
+        words = np.frombuffer(chunk.buffers()[1], dtype=np.int64)
+        values.append(words[2 * chunk.offset:2 * (chunk.offset + len(chunk)):2])
+    values = np.concatenate(values) if values else np.zeros(0, dtype=np.int64)
+    valid = np.asarray(array.is_valid()).astype(bool)
+    return np.where(valid, values, 0), valid
+
+
+def amount_array(table):
+    """Amounts of a mutation table for exact aggregation
+
+    Parameters
+    ----------
+    table: pyarrow.Table
+
+    Returns
+    -------
+    AmountArray
+    """
+    return AmountArray(minor_units(table.column("amount"))[0])
+
+
+def to_table(mutations):
+    """Convert mutations to an Arrow table
+
+    Parameters
+    ----------
+    mutations: Iterable[Mutation]
+
+    Returns
+    -------
+    pyarrow.Table
+    """
+    return _Encoder().table(list(mutations))
+
+
+class _Encoder:
+    """Converts batches of mutations to tables. Keeps category ids the same
+    across batches"""
+
+    def __init__(self):
+        self.categories = {}  # Category: id
+
+    def category_id(self, category):
+        if category not in self.categories:
+            if category.parent is not None:
+                self.category_id(category.parent)
+            self.categories[category] = len(self.categories)
+        return self.categories[category]
+
+    def schema(self):
+        return schema(list(self.categories))
+
+    def table(self, mutations):
+        from sitdown.core import BankAccount
+
+        def minor(values):
+            valid = np.array([x is not None for x in values], dtype=bool)
+            return decimal_array([0 if x is None else to_minor_units(x)
+                                  for x in values], valid)
+
+        def text(values):
+            return pa.array(values, type=pa.string()).dictionary_encode()
+
+        def number(account):
+            return None if account is None else str(account.number)
+
+        opposites = [x.opposite_account for x in mutations]
+        category_ids = [[self.category_id(c) for c in x.categories]
+                        for x in mutations]
+        columns = {
+            "amount": decimal_array([to_minor_units(x.amount) for x in mutations]),
+            "date": pa.Array.from_buffers(pa.date32(), len(mutations), [None, pa.py_buffer(
+                np.array([x.date.toordinal() - EPOCH_ORDINAL for x in mutations],
+                         dtype=np.int32))]),
+            "account": text([number(x.account) for x in mutations]),
+            "account_description": text([x.account and x.account.description
+                                         for x in mutations]),
+            "currency": text([x.currency for x in mutations]),
+            "opposite_account": text([number(x) if isinstance(x, BankAccount) else x
+                                      for x in opposites]),
+            "opposite_account_description": text(
+                [x.description if isinstance(x, BankAccount) else None
+                 for x in opposites]),
+            "description": text([x.description for x in mutations]),
+            "balance_before": minor([x.balance_before for x in mutations]),
+            "balance_after": minor([x.balance_after for x in mutations]),
+            "categories": pa.array(category_ids, type=pa.list_(pa.int32()))}
+        return pa.Table.from_pydict(columns, schema=self.schema())
+
+
+def columns_to_table(columns, reader):
+    """Convert parsed columns to an Arrow table, without creating Mutations.
+    Amounts, balances, dates, accounts and currencies are converted as arrays
+
+    Parameters
+    ----------
+    columns: MutationColumns
+        as returned by ABNAMROReader.read_columns()
+    reader: ABNAMROReader
+        for account descriptions and opposite accounts
+
+    Returns
+    -------
+    pyarrow.Table
+    """
+    def text(values, codes):
+        return pa.DictionaryArray.from_arrays(
+            pa.array(np.asarray(codes, dtype=np.int32)), pa.array(values, pa.string()))
+
+    descriptions = columns.descriptions()
+    accounts = [reader.get_account(account_number=x) for x in columns.accounts]
+    days = columns.dates.astype("datetime64[D]").astype(np.int32)
+    table = {
+        "amount": decimal_array(columns.amounts),
+        "date": pa.Array.from_buffers(pa.date32(), len(columns),
+                                      [None, pa.py_buffer(days)]),
+        "account": text([str(x.number) for x in accounts], columns.account_codes),
+        "account_description": text([x.description for x in accounts],
+                                    columns.account_codes),
+        "currency": text(columns.currencies, columns.currency_codes),
+        "opposite_account": pa.array([reader.find_iban(x) for x in descriptions],
+                                     pa.string()).dictionary_encode(),
+        "opposite_account_description": pa.nulls(
+            len(columns), pa.string()).dictionary_encode(),
+        "description": pa.array(descriptions, pa.string()).dictionary_encode(),
+        "balance_before": decimal_array(columns.balances_before),
+        "balance_after": decimal_array(columns.balances_after),
+        "categories": pa.array([[]] * len(columns), type=pa.list_(pa.int32()))}
+    return pa.Table.from_pydict(table, schema=schema())
+
+
+def categories_of(table):
+    """The categories that category ids in table refer to
+
+    Returns
+    -------
+    List[Category]
+    """
+    from sitdown.classifiers import Category
+
+    categories = []
+    for name, parent in json.loads((table.schema.metadata or {}).get(
+            CATEGORIES_KEY, b"[]")):
+        categories.append(Category(name, parent=None if parent is None
+                                   else categories[parent]))
+    return categories
+
+
+def from_table(table):
+    """Convert an Arrow table made by to_table() back to mutations
+
+    Parameters
+    ----------
+    table: pyarrow.Table
+
+    Returns
+    -------
+    Set[Mutation]
+    """
+    from sitdown.core import BankAccount, Mutation
+
+    categories = categories_of(table)
+    accounts = {}
+
+    def account(number, description):
+        if number is None:
+            return None
+        if (number, description) not in accounts:
+            accounts[number, description] = BankAccount(number, description)
+        return accounts[number, description]
+
+    def decimals(name):
+        values, valid = minor_units(table.column(name))
+        return [from_minor_units(x) if ok else None
+                for x, ok in zip(values.tolist(), valid.tolist())]
+
+    def column(name):
+        return table.column(name).to_pylist()
+
+    rows = zip(decimals("amount"), column("date"), column("account"),
+               column("account_description"), column("currency"),
+               column("opposite_account"), column("opposite_account_description"),
+               column("description"), decimals("balance_before"),
+               decimals("balance_after"), column("categories"))
+    return {Mutation(amount=amount, date=date,
+                     account=account(number, description), currency=currency,
+                     opposite_account=opposite if opposite_description is None
+                     else account(opposite, opposite_description),
+                     description=text, balance_before=before, balance_after=after,
+                     categories={categories[i] for i in category_ids})
+            for amount, date, number, description, currency, opposite,
+            opposite_description, text, before, after, category_ids in rows}
+
+
+def write_parquet(mutations, path, chunk_size=CHUNK_SIZE):
+    """Write mutations to a Parquet file, one row group per chunk. Only one chunk
+    is converted at a time. Sort mutations by date first to make date filters on
+    reading skip most row groups
+
+    Parameters
+    ----------
+    mutations: Iterable[Mutation]
+    path: Path or str
+    chunk_size: int, optional
+        mutations per row group. Defaults to CHUNK_SIZE
+
+    Returns
+    -------
+    int
+        number of mutations written
+    """
+    encoder = _Encoder()
+    mutations = iter(mutations)
+    written = 0
+    with pq.ParquetWriter(str(path), schema().remove_metadata()) as writer:
+        while True:
+            chunk = list(islice(mutations, chunk_size))
+            if not chunk:
+                break
+            table = encoder.table(chunk)
+            writer.write_table(table.replace_schema_metadata(None),
+                               row_group_size=chunk_size)
+            written += len(chunk)
+        # all categories are known only now
+        writer.add_key_value_metadata(
+            {CATEGORIES_KEY: category_table(list(encoder.categories))})
+    return written
+
+
+def read_table(path, from_date=None, to_date=None, accounts=None, columns=None):
+    """Read a Parquet file written by write_parquet(). Filters are pushed down:
+    row groups that can not match are skipped without reading them
+
+    Parameters
+    ----------
+    path: Path or str
+    from_date: datetime.date, optional
+        only mutations on or after this date. Defaults to no lower bound
+    to_date: datetime.date, optional
+        only mutations before this date. Defaults to no upper bound
+    accounts: Iterable[BankAccount or str], optional
+        only mutations on these accounts, or account numbers. Defaults to all
+    columns: List[str], optional
+        only read these columns. Defaults to all
+
+    Returns
+    -------
+    pyarrow.Table
+    """
+    filters = []
+    if from_date is not None:
+        filters.append(("date", ">=", from_date))
+    if to_date is not None:
+        filters.append(("date", "<", to_date))
+    if accounts is not None:
+        filters.append(("account", "in", [str(getattr(x, "number", x))
+                                          for x in accounts]))
+    table = pq.read_table(str(path), columns=columns, filters=filters or None)
+    # filtered reads drop the file metadata, which holds the categories
+    metadata = pq.read_metadata(str(path)).metadata or {}
+    return table.replace_schema_metadata(
+        {CATEGORIES_KEY: metadata.get(CATEGORIES_KEY, b"[]")})
+
+
+def read_parquet(path, from_date=None, to_date=None, accounts=None):
+    """Read mutations from a Parquet file written by write_parquet()
+
+    Parameters are as for read_table()
+
+    Returns
+    -------
+    Set[Mutation]
+    """
+    return from_table(read_table(path, from_date=from_date, to_date=to_date,
+                                 accounts=accounts))
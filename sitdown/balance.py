@@ -0,0 +1,270 @@
+"""Reconstructing account balances over time from mutations
+
+Each mutation may carry the account balance before and after it. Chaining these
+gives the balance of an account over time. If the balance before a mutation does
+not match the balance after the previous one, mutations are missing in between.
+"""
+from collections import OrderedDict, defaultdict
+from typing import Dict, List
+
+from sitdown.aggregation import to_minor_units, to_minor_units_array, \
+    from_minor_units, SCALE
+from sitdown.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+
+class BalanceGap:
+    """A break in the chain of balances of an account. Means that one or more
+    mutations are missing between two consecutive known mutations"""
+
+    def __init__(self, account, after, before, missing_amount):
+        """
+
+        Parameters
+        ----------
+        account: BankAccount
+            account on which the gap occurs
+        after: Mutation
+            last mutation before the gap
+        before: Mutation
+            first mutation after the gap
+        missing_amount: Decimal
+            Summed amount of the missing mutations
+        """
+        self.account = account
+        self.after = after
+        self.before = before
+        self.missing_amount = missing_amount
+
+    def __str__(self):
+        return (f"Gap of {self.missing_amount} on {self.account} between "
+                f"{self.after.date} and {self.before.date}")
+
+
+class BalanceSeries:
+    """End-of-day balances for a single account, as compact arrays"""
+
+    def __init__(self, account, dates, balances, gaps=None):
+        """
+
+        Parameters
+        ----------
+        account: BankAccount
+            the account these balances are for
+        dates: numpy.ndarray
+            datetime64[D] array, sorted ascending
+        balances: numpy.ndarray
+            int64 array of balances in minor units at the end of each date
+        gaps: List[BalanceGap], optional
+            Discontinuities found when reconstructing. Defaults to empty list
+        """
+        self.account = account
+        self.dates = dates
+        self.balances = balances
+        self.gaps = gaps if gaps is not None else []
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __str__(self):
+        return f"BalanceSeries for {self.account} ({len(self)} days)"
+
+    @property
+    def is_continuous(self):
+        """True if no mutations seem to be missing"""
+        return not self.gaps
+
+    def values(self):
+        """Balances in major units as float. For plotting
+
+        Returns
+        -------
+        numpy.ndarray
+        """
+        return self.balances / SCALE
+
+    def at(self, date):
+        """Balance at the end of the given date
+
+        Parameters
+        ----------
+        date: datetime.date
+
+        Returns
+        -------
+        Decimal or None
+            None if date is before the first known balance
+        """
+        index = np.searchsorted(self.dates, np.datetime64(date, 'D'), side='right')
+        if index == 0:
+            return None
+        return from_minor_units(self.balances[index - 1])
+
+    def daily(self):
+        """Balance for every calendar day between first and last date. Days
+        without mutations carry the balance of the day before
+
+        Returns
+        -------
+        BalanceSeries
+        """
+        if not len(self):
+            return self
+        days = np.arange(self.dates[0], self.dates[-1] + 1, dtype='datetime64[D]')
+        index = np.searchsorted(self.dates, days, side='right') - 1
+        return BalanceSeries(account=self.account, dates=days,
+                             balances=self.balances[index], gaps=self.gaps)
+
+
+def _order_same_day(mutations, previous_balance):
+    """Order mutations that happened on the same day by chaining their balances
+
+    Parameters
+    ----------
+    mutations: List[Mutation]
+        all on the same day and the same account
+    previous_balance: int or None
+        balance in minor units at the end of the previous day, if known
+
+    Returns
+    -------
+    List[Mutation]
+        Chained order where possible. Mutations that do not fit the chain are
+        appended in their original order
+    """
+    def minor(value):
+        return None if value is None else to_minor_units(value)
+
+    by_before = defaultdict(list)
+    for mutation in mutations:
+        by_before[minor(mutation.balance_before)].append(mutation)
+    afters = {minor(x.balance_after) for x in mutations}
+
+    if previous_balance in by_before:
+        current = by_before[previous_balance][0]
+    else:
+        # start with a mutation that does not follow any other
+        current = next((x for x in mutations
+                        if minor(x.balance_before) not in afters), mutations[0])
+
+    ordered = []
+    remaining = set(range(len(mutations)))
+    position = {id(x): i for i, x in enumerate(mutations)}
+    while current is not None:
+        ordered.append(current)
+        remaining.discard(position[id(current)])
+        candidates = [x for x in by_before.get(minor(current.balance_after), [])
+                      if position[id(x)] in remaining]
+        current = candidates[0] if candidates else None
+    ordered.extend(mutations[i] for i in sorted(remaining))
+    return ordered
+
+
+def _order(mutations):
+    """Sort mutations of a single account by date, then by balance chain"""
+    mutations = sorted(mutations, key=lambda x: x.date)
+    ordered = []
+    previous_balance = None
+    start = 0
+    while start < len(mutations):
+        end = start + 1
+        while end < len(mutations) and mutations[end].date == mutations[start].date:
+            end += 1
+        day = mutations[start:end]
+        if len(day) > 1:
+            day = _order_same_day(day, previous_balance)
+        ordered.extend(day)
+        last = day[-1].balance_after
+        previous_balance = None if last is None else to_minor_units(last)
+        start = end
+    return ordered
+
+
+def reconstruct(account, mutations):
+    """Reconstruct end-of-day balances of a single account
+
+    Parameters
+    ----------
+    account: BankAccount
+    mutations: Iterable[Mutation]
+        all on the given account
+
+    Returns
+    -------
+    BalanceSeries
+    """
+    ordered = _order(mutations)
+    if not ordered:
+        return BalanceSeries(account=account,
+                             dates=np.zeros(0, dtype='datetime64[D]'),
+                             balances=np.zeros(0, dtype=np.int64))
+
+    dates = np.array([x.date for x in ordered], dtype='datetime64[D]')
+    amounts = to_minor_units_array([x.amount for x in ordered])
+    known = np.array([x.balance_before is not None and x.balance_after is not None
+                      for x in ordered])
+
+    if known.all():
+        before = to_minor_units_array([x.balance_before for x in ordered])
+        after = to_minor_units_array([x.balance_after for x in ordered])
+    else:
+        # Fill in missing balances by running amounts from the first known one.
+        running = np.cumsum(amounts)
+        first = int(np.argmax(known)) if known.any() else None
+        if first is None:
+            start = 0
+        else:
+            start = to_minor_units(ordered[first].balance_before) - \
+                (running[first] - amounts[first])
+        after = start + running
+        before = after - amounts
+        for i in np.flatnonzero(known):
+            before[i] = to_minor_units(ordered[i].balance_before)
+            after[i] = to_minor_units(ordered[i].balance_after)
+
+    breaks = np.flatnonzero(before[1:] != after[:-1]) + 1
+    gaps = [BalanceGap(account=account, after=ordered[i - 1], before=ordered[i],
+                       missing_amount=from_minor_units(before[i] - after[i - 1]))
+            for i in breaks]
+
+    # the last mutation of each day gives the end-of-day balance
+    end_of_day = np.append(dates[1:] != dates[:-1], True)
+    return BalanceSeries(account=account, dates=dates[end_of_day],
+                         balances=after[end_of_day], gaps=gaps)
+
+
+def balance_series(mutations) -> Dict['BankAccount', BalanceSeries]:
+    """Reconstruct end-of-day balances for every account in mutations
+
+    Parameters
+    ----------
+    mutations: Iterable[Mutation]
+        mutations on one or more accounts
+
+    Returns
+    -------
+    OrderedDict[BankAccount, BalanceSeries]
+        Series per account, ordered by account description
+    """
+    per_account = defaultdict(list)
+    for mutation in mutations:
+        per_account[mutation.account].append(mutation)
+
+    return OrderedDict((account, reconstruct(account, per_account[account]))
+                       for account in sorted(per_account, key=str))
+
+
+def find_gaps(mutations) -> List[BalanceGap]:
+    """All places in mutations where mutations seem to be missing
+
+    Parameters
+    ----------
+    mutations: Iterable[Mutation]
+
+    Returns
+    -------
+    List[BalanceGap]
+    """
+    return [gap for series in balance_series(mutations).values()
+            for gap in series.gaps]
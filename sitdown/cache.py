@@ -0,0 +1,401 @@
+"""Persistent on-disk cache of parsed and classified mutations
+
+Parsing and classifying large exports takes time. Results are stored per input
+file content: a blake2b hash of the file plus anything else that influences the
+result, like the classifier used. Unchanged inputs are served from the cache,
+and so are copies and renamed versions of them.
+
+Hashing a large file still means reading it, so the content hash of each file is
+remembered in a small index, keyed on path, size and modification time. A file
+that was not touched is not read at all.
+
+Entries are stored in a compact binary format (see encode_mutations()). When the
+cache grows beyond its maximum size, least recently used entries are removed.
+Several processes can use the same cache at once: entries are written atomically
+and eviction is serialised with a lock file.
+"""
+import datetime
+import gc
+import hashlib
+import marshal
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows. Writes are still atomic, eviction is not locked
+    fcntl = None
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "sitdown"
+DEFAULT_MAX_SIZE = 2 ** 30  # bytes
+FORMAT_HEADER = b"sitdown-mutations-2\n"
+HASH_BLOCK_SIZE = 2 ** 20
+
+
+def default_cache_dir():
+    """Cache dir from environment variable SITDOWN_CACHE_DIR, or the default"""
+    return Path(os.environ.get("SITDOWN_CACHE_DIR", DEFAULT_CACHE_DIR))
+
+
+def file_key(input_file, *extra):
+    """Key that changes whenever input_file or any of extra changes. Based on
+    path, size and modification time, so the file is not read
+
+    Parameters
+    ----------
+    input_file: Path or str
+    extra: str
+        anything else that influences the cached result
+
+    Returns
+    -------
+    str
+    """
+    path = Path(input_file).resolve()
+    stat = path.stat()
+    parts = [str(path), str(stat.st_size), str(stat.st_mtime_ns)] + list(extra)
+    return hashlib.blake2b("\0".join(parts).encode(), digest_size=16).hexdigest()
+
+
+def content_hash(input_file):
+    """blake2b hash of the contents of input_file
+
+    Returns
+    -------
+    str
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(input_file, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@contextmanager
+def paused_gc():
+    """Pause the cyclic garbage collector. Creating many objects that do not form
+    cycles, like when decoding, otherwise triggers many useless collections"""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def encode_mutations(mutations):
+    """Encode mutations to bytes. Much faster to write and read back than pickle,
+    because only plain values are stored and accounts and categories are stored
+    once. Fingerprints are stored too, so they are not computed again on reading
+
+    Parameters
+    ----------
+    mutations: Iterable[Mutation]
+
+    Returns
+    -------
+    bytes
+    """
+    from sitdown.core import BankAccount
+
+    accounts, categories = {}, {}
+
+    def account(value):
+        if value not in accounts:
+            accounts[value] = len(accounts)
+        return accounts[value]
+
+    def opposite(value):
+        # usually a plain IBAN string, sometimes a BankAccount
+        return (account(value),) if isinstance(value, BankAccount) else value
+
+    def category(value):
+        if value not in categories:
+            parent = -1 if value.parent is None else category(value.parent)
+            categories[value] = (len(categories), value.name, parent)
+        return categories[value][0]
+
+    def number(value):
+        return str(value) if isinstance(value, Decimal) else value
+
+    with paused_gc():
+        rows = [(number(x.amount), x.date.toordinal(), account(x.account), x.currency,
+                 opposite(x.opposite_account), x.description,
+                 number(x.balance_before), number(x.balance_after),
+                 tuple(category(c) for c in x.categories), x.fingerprint())
+                for x in mutations]
+    table = {"accounts": [(x.number, x.description) for x in accounts],
+             "categories": [x[1:] for x in categories.values()],
+             "rows": rows}
+    return FORMAT_HEADER + marshal.dumps(table)
+
+
+def decode_mutations(data):
+    """Decode output of encode_mutations()
+
+    Returns
+    -------
+    Set[Mutation]
+
+    Raises
+    ------
+    ValueError
+        if data was not made by encode_mutations()
+    """
+    from sitdown.classifiers import Category
+    from sitdown.core import BankAccount, Mutation
+
+    if not data.startswith(FORMAT_HEADER):
+        raise ValueError("Not encoded mutations")
+    try:
+        with paused_gc():
+            table = marshal.loads(data[len(FORMAT_HEADER):])
+    except (EOFError, TypeError):
+        raise ValueError("Corrupt encoded mutations")
+    accounts = [BankAccount(number=number, description=description)
+                for number, description in table["accounts"]]
+    categories = []
+    for name, parent in table["categories"]:
+        categories.append(Category(name, parent=categories[parent]
+                                   if parent >= 0 else None))
+
+    def opposite(value):
+        return accounts[value[0]] if isinstance(value, tuple) else value
+
+    def number(value):
+        return Decimal(value) if isinstance(value, str) else value
+
+    def mutation(amount, date, account_index, currency, opposite_value,
+                 description, before, after, category_indices, fingerprint):
+        decoded = Mutation(amount=number(amount), date=from_ordinal(date),
+                           account=accounts[account_index], currency=currency,
+                           opposite_account=opposite(opposite_value),
+                           description=description,
+                           balance_before=number(before), balance_after=number(after),
+                           categories={categories[i] for i in category_indices})
+        decoded.__dict__["_fingerprint"] = fingerprint
+        return decoded
+
+    from_ordinal = datetime.date.fromordinal
+    with paused_gc():
+        return {mutation(*row) for row in table["rows"]}
+
+
+class MutationCache:
+    """Stores sets of mutations on disk, one file per key"""
+
+    SUFFIX = ".mutations"
+
+    def __init__(self, path=None, max_size=None):
+        """
+
+        Parameters
+        ----------
+        path: Path or str, optional
+            directory to store cache files in. Created if it does not exist.
+            Defaults to default_cache_dir()
+        max_size: int, optional
+            Maximum total size of entries in bytes. Least recently used entries
+            are removed beyond this. Defaults to environment variable
+            SITDOWN_CACHE_MAX_SIZE, or DEFAULT_MAX_SIZE
+        """
+        self.path = Path(path) if path else default_cache_dir()
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.path / "index"
+        self.index_path.mkdir(exist_ok=True)
+        if max_size is None:
+            max_size = int(os.environ.get("SITDOWN_CACHE_MAX_SIZE", DEFAULT_MAX_SIZE))
+        self.max_size = max_size
+
+    def _entry(self, key):
+        return self.path / (key + self.SUFFIX)
+
+    @contextmanager
+    def _lock(self):
+        """Exclusive lock on this cache dir, shared with other processes"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.path / ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write(self, path, data):
+        """Write data to path atomically: readers never see half a file"""
+        handle, temp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as f:
+                f.write(data)
+            os.replace(temp, path)
+        except BaseException:
+            os.unlink(temp)
+            raise
+
+    def content_hash(self, input_file):
+        """Content hash of input_file. From the index if the file has not been
+        touched since it was last hashed
+
+        Returns
+        -------
+        str
+        """
+        index_entry = self.index_path / file_key(input_file)
+        try:
+            return index_entry.read_text()
+        except OSError:
+            pass
+        digest = content_hash(input_file)
+        self._write(index_entry, digest.encode())
+        return digest
+
+    def key(self, input_file, *extra):
+        """Cache key for results of input_file. Depends on the file contents
+        only, not on its name or location
+
+        Parameters
+        ----------
+        input_file: Path or str
+        extra: str
+            anything else that influences the result
+
+        Returns
+        -------
+        str
+        """
+        parts = [self.content_hash(input_file)] + list(extra)
+        return hashlib.blake2b("\0".join(parts).encode(), digest_size=16).hexdigest()
+
+    def get(self, key):
+        """Cached mutations for key, or None if not cached
+
+        Returns
+        -------
+        Set[Mutation] or None
+        """
+        entry = self._entry(key)
+        try:
+            with open(entry, "rb") as f:
+                data = f.read()
+            os.utime(entry)  # mark as recently used
+            return decode_mutations(data)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, mutations):
+        """Store mutations under key. Evicts old entries if the cache gets too
+        large
+
+        Parameters
+        ----------
+        key: str
+        mutations: Set[Mutation]
+        """
+        self._write(self._entry(key), encode_mutations(mutations))
+        self.evict()
+
+    def read(self, input_file, reader, *extra):
+        """Mutations in input_file. From cache if unchanged, otherwise read with
+        reader and cache the result
+
+        Parameters
+        ----------
+        input_file: Path or str
+        reader: object with read(input_file) method, like ABNAMROReader
+        extra: str
+            anything else that influences the result
+
+        Returns
+        -------
+        Tuple[Set[Mutation], bool]
+            mutations and whether they came from the cache
+        """
+        key = self.key(input_file, type(reader).__name__, *extra)
+        mutations = self.get(key)
+        if mutations is not None:
+            return mutations, True
+        mutations = reader.read(input_file)
+        self.put(key, mutations)
+        return mutations, False
+
+    def entries(self):
+        """All cache files
+
+        Returns
+        -------
+        List[Path]
+        """
+        return sorted(self.path.glob("*" + self.SUFFIX))
+
+    def size(self):
+        """Total size of all cache files in bytes"""
+        return sum(x.stat().st_size for x in self.entries())
+
+    def evict(self, max_size=None):
+        """Remove least recently used entries until the cache fits in max_size
+
+        Parameters
+        ----------
+        max_size: int, optional
+            Defaults to the max_size of this cache
+
+        Returns
+        -------
+        int
+            number of entries removed
+        """
+        max_size = self.max_size if max_size is None else max_size
+        with self._lock():
+            stats = []
+            for entry in self.entries():
+                try:
+                    stats.append((entry, entry.stat()))
+                except FileNotFoundError:  # removed by another process
+                    continue
+            total = sum(x.st_size for _, x in stats)
+            removed = 0
+            for entry, stat in sorted(stats, key=lambda x: x[1].st_mtime_ns):
+                if total <= max_size:
+                    break
+                try:
+                    entry.unlink()
+                except FileNotFoundError:
+                    pass
+                total -= stat.st_size
+                removed += 1
+            self._clean_index()
+        return removed
+
+    def _clean_index(self, max_age=30 * 24 * 3600):
+        """Remove index entries that were not written for max_age seconds. They
+        are cheap to rebuild"""
+        limit = time.time() - max_age
+        for entry in self.index_path.iterdir():
+            try:
+                if entry.stat().st_mtime < limit:
+                    entry.unlink()
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        """Remove all cache files
+
+        Returns
+        -------
+        int
+            number of entries removed
+        """
+        with self._lock():
+            entries = self.entries()
+            for entry in entries:
+                entry.unlink()
+            for entry in self.index_path.iterdir():
+                entry.unlink()
+        return len(entries)
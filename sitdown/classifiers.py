@@ -10,10 +10,16 @@ as much as possible, so that filters later on do not have to deal with it.
 """
 import abc
 import re
+from collections import defaultdict
 from abc import abstractmethod
 from typing import Dict, List, Optional, Set, Union
-from yaml import load
-from yaml.loader import Loader
+
+from sitdown.profiling import stage
+
+
+def normalise(string):
+    """Remove double spaces, make lower case. Just remove some weirdness"""
+    return re.sub(' +', ' ', string).lower()
 
 
 class Classifier(metaclass=abc.ABCMeta):
@@ -136,9 +142,6 @@ class StringMatchClassifier(Classifier):
     def classify(self, mutation) -> Set[Category]:
         """Match all strings in mapping to mutation description case (insensitive).
          Removes excess spaces from description"""
-        def normalise(string):
-            """Remove double spaces, make lower case. Just remove some weirdness"""
-            return re.sub(' +', ' ', string).lower()
         return {cat for string, cat in self.mapping.items()
                 if normalise(string) in normalise(mutation.description)}
 
@@ -162,6 +165,9 @@ def string_match_classifier_from_yaml(f) -> StringMatchClassifier:
     Is equivalent to
 
     """
+    from yaml import load  # yaml is slow to import and only needed here
+    from yaml.loader import Loader
+
     content = load(f, Loader=Loader)
     mapping = {}
 
@@ -184,3 +190,144 @@ def string_match_classifier_from_yaml(f) -> StringMatchClassifier:
         mapping.update(parse_category(name=x, items=y))
 
     return StringMatchClassifier(mapping=mapping)
+
+
+class RulesDiff:
+    """What changed between two versions of a StringMatchClassifier
+
+    Patterns are compared after normalising, like classify() does. A pattern that
+    is still there but assigns a different category has moved
+    """
+
+    def __init__(self, old, new):
+        """
+        Parameters
+        ----------
+        old: StringMatchClassifier
+            classifier that the current categories of mutations came from
+        new: StringMatchClassifier
+        """
+        self.old = old
+        self.new = new
+        before = {normalise(x): cat for x, cat in old.mapping.items()}
+        after = {normalise(x): cat for x, cat in new.mapping.items()}
+        self.added = {x: cat for x, cat in after.items() if x not in before}
+        self.removed = {x: cat for x, cat in before.items() if x not in after}
+        self.moved = {x: (before[x], cat) for x, cat in after.items()
+                      if x in before and not self._same(before[x], cat)}
+
+    @staticmethod
+    def _same(category, other):
+        """Equal including the names of all parents"""
+        while category is not None and other is not None:
+            if category.name != other.name:
+                return False
+            category, other = category.parent, other.parent
+        return category is None and other is None
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.moved)
+
+    def __str__(self):
+        lines = [f"+ {x} ({cat})" for x, cat in self.added.items()] + \
+                [f"- {x} ({cat})" for x, cat in self.removed.items()] + \
+                [f"~ {x} ({old} -> {new})" for x, (old, new) in self.moved.items()]
+        return "\n".join(lines) or "no changes"
+
+    def patterns(self):
+        """All normalised patterns whose matches need to be classified again"""
+        return set(self.added) | set(self.removed) | set(self.moved)
+
+    def apply(self, index):
+        """Update the categories of all mutations in index that match a changed
+        pattern, in place. Categories not assigned by the old classifier, like
+        transfer tags, are kept
+
+        Parameters
+        ----------
+        index: DescriptionIndex
+            of the mutations classified with the old classifier
+
+        Returns
+        -------
+        List[Mutation]
+            mutations whose categories changed
+        """
+        candidates = {}
+        for pattern in self.patterns():
+            for mutation in index.matching(pattern):
+                candidates[id(mutation)] = mutation
+        changed = []
+        with stage("RulesDiff.apply", rows=len(candidates)):
+            for mutation in candidates.values():
+                categories = (mutation.categories - self.old.classify(mutation)) | \
+                    self.new.classify(mutation)
+                if categories != mutation.categories:
+                    mutation.categories = categories
+                    changed.append(mutation)
+        return changed
+
+
+class DescriptionIndex:
+    """Trigram index of mutation descriptions, to quickly find the mutations a
+    classifier pattern can match without scanning all of them
+
+    Each distinct normalised description is indexed once. A pattern can only be
+    in a description that contains all of its trigrams, so the posting lists of
+    those trigrams are intersected and only the remaining descriptions are checked
+    """
+
+    def __init__(self, mutations=()):
+        """
+        Parameters
+        ----------
+        mutations: Iterable[Mutation], optional
+            Defaults to an empty index
+        """
+        self.descriptions = {}  # normalised description: id
+        self.texts = []  # normalised description per id
+        self.mutations = []  # List[Mutation] per description id
+        self.trigrams = defaultdict(set)  # trigram: description ids
+        self.add(mutations)
+
+    @staticmethod
+    def trigrams_of(string):
+        return {string[i:i + 3] for i in range(len(string) - 2)}
+
+    def add(self, mutations):
+        """Add mutations to the index"""
+        for mutation in mutations:
+            description = normalise(mutation.description)
+            index = self.descriptions.get(description)
+            if index is None:
+                index = self.descriptions[description] = len(self.mutations)
+                self.texts.append(description)
+                self.mutations.append([])
+                for trigram in self.trigrams_of(description):
+                    self.trigrams[trigram].add(index)
+            self.mutations[index].append(mutation)
+
+    def __len__(self):
+        return sum(len(x) for x in self.mutations)
+
+    def matching(self, pattern):
+        """All mutations whose description contains pattern, as in
+        StringMatchClassifier.classify()
+
+        Parameters
+        ----------
+        pattern: str
+
+        Returns
+        -------
+        List[Mutation]
+        """
+        pattern = normalise(pattern)
+        trigrams = self.trigrams_of(pattern)
+        if trigrams:
+            postings = sorted((self.trigrams.get(x, set()) for x in trigrams), key=len)
+            ids = set(postings[0]).intersection(*postings[1:])
+        else:  # too short to index, check every description
+            ids = range(len(self.texts))
+        return [mutation for x in sorted(ids) if pattern in self.texts[x]
+                for mutation in self.mutations[x]]
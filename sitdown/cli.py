@@ -1,17 +1,327 @@
 # -*- coding: utf-8 -*-
 
 """Console script for sitdown."""
+import hashlib
 import sys
+import time
+from contextlib import contextmanager
+
 import click
 
+from sitdown.cache import MutationCache
+from sitdown.profiling import stage
+
+READER_KEY = "detected"  # part of cache keys for parsed files. Change to invalidate
+
+
+class CLIContext:
+    """Things shared between all sitdown commands"""
+
+    def __init__(self, cache=None, processes=None):
+        """
+
+        Parameters
+        ----------
+        cache: MutationCache, optional
+            Cache parsed and classified mutations here. Defaults to None,
+            meaning no caching
+        processes: int, optional
+            Number of processes for parsing files. Defaults to None, meaning
+            the number of CPUs
+        """
+        self.cache = cache
+        self.processes = processes
+
+
+@contextmanager
+def timed(description):
+    """Print how long the enclosed block took to stderr"""
+    start = time.perf_counter()
+    yield
+    click.echo(f"{description} took {time.perf_counter() - start:.3f}s", err=True)
+
+
+def load_mutations(context, input_files):
+    """Mutations in all input files. Unchanged files come from cache, the rest is
+    parsed in parallel
+
+    Returns
+    -------
+    Set[Mutation]
+    """
+    return set().union(*load_per_file(context, input_files).values())
+
+
+def load_per_file(context, input_files):
+    """Mutations in each input file. Unchanged files come from cache, the rest is
+    parsed in parallel
+
+    Returns
+    -------
+    Dict[str, Set[Mutation]]
+        mutations per input file
+    """
+    from sitdown.readers import read_files
+
+    results = {}
+    keys = {}
+    if context.cache:
+        for input_file in input_files:
+            keys[input_file] = context.cache.key(input_file, READER_KEY)
+            cached = context.cache.get(keys[input_file])
+            if cached is not None:
+                results[input_file] = cached
+
+    to_parse = [x for x in input_files if x not in results]
+    for input_file, mutations in read_files(to_parse, processes=context.processes).items():
+        results[input_file] = mutations
+        if context.cache:
+            context.cache.put(keys[input_file], mutations)
+
+    click.echo(f"Read {len(input_files)} file(s), "
+               f"{len(input_files) - len(to_parse)} from cache", err=True)
+    return results
+
+
+def load_classified(context, input_files, classifier_file):
+    """Mutations in all input files, classified with the given YAML classifier.
+    Results for unchanged files and classifier come from cache
+
+    Returns
+    -------
+    Set[Mutation]
+    """
+    from sitdown.classifiers import string_match_classifier_from_yaml
+
+    with open(classifier_file, "rb") as f:
+        classifier_hash = hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+
+    keys = {x: context.cache.key(x, READER_KEY, "classified", classifier_hash)
+            for x in input_files} if context.cache else {}
+    results = {}
+    for input_file, key in keys.items():
+        cached = context.cache.get(key)
+        if cached is not None:
+            results[input_file] = cached
+
+    uncached = [x for x in input_files if x not in results]
+    if uncached:
+        with open(classifier_file, "r") as f:
+            classifier = string_match_classifier_from_yaml(f)
+        # parse all files in one go, so they are read in parallel
+        parsed = load_per_file(context, uncached)
+        with stage(f"{type(classifier).__name__}.classify",
+                   rows=sum(len(x) for x in parsed.values())):
+            for mutations in parsed.values():
+                for mutation in mutations:
+                    mutation.categories = classifier.classify(mutation)
+        for input_file, mutations in parsed.items():
+            if context.cache:
+                context.cache.put(keys[input_file], mutations)
+            results[input_file] = mutations
+    return set().union(*results.values())
+
+
+def category_path(category):
+    """Full name of category including parents, like 'sports/gym'"""
+    if category.parent:
+        return category_path(category.parent) + "/" + category.name
+    return category.name
+
+
+def format_table(header, rows):
+    """Simple fixed-width text table
+
+    Parameters
+    ----------
+    header: List[str]
+    rows: List[List]
+
+    Returns
+    -------
+    str
+    """
+    rows = [[str(x) for x in row] for row in rows]
+    widths = [max([len(header[i])] + [len(row[i]) for row in rows])
+              for i in range(len(header))]
+    lines = [header] + [["-" * x for x in widths]] + rows
+    return "\n".join("  ".join(cell.rjust(width) if i else cell.ljust(width)
+                               for i, (cell, width) in enumerate(zip(line, widths)))
+                     for line in lines)
+
+
+input_files_argument = click.argument(
+    "input_files", nargs=-1, required=True,
+    type=click.Path(exists=True, dir_okay=False))
+classifier_argument = click.argument(
+    "classifier_file", type=click.Path(exists=True, dir_okay=False))
+rates_option = click.option(
+    "--rates", default=None, type=click.Path(exists=True, dir_okay=False),
+    help="CSV file with columns date, currency and rate. Convert all amounts into "
+         "one currency with these. Without rates, each currency gets its own rows")
+
+
+@click.group()
+@click.option("--cache-dir", type=click.Path(file_okay=False), default=None,
+              help="Where to cache parsed files. Defaults to ~/.cache/sitdown or "
+                   "$SITDOWN_CACHE_DIR")
+@click.option("--no-cache", is_flag=True, help="Do not read or write the cache")
+@click.option("-p", "--processes", type=int, default=None,
+              help="Number of processes for parsing. Defaults to number of CPUs")
+@click.option("--profile", is_flag=True,
+              help="Print time, rows and peak memory per stage to stderr")
+@click.pass_context
+def main(ctx, cache_dir, no_cache, processes, profile):
+    """For when you need to sit down and look at your finances."""
+    cache = None if no_cache else MutationCache(cache_dir)
+    ctx.obj = CLIContext(cache=cache, processes=processes)
+    if profile:
+        from sitdown.profiling import Profiler
+        profiler = Profiler()
+        # callbacks run last-in first-out, so the profiler stops before printing
+        ctx.call_on_close(lambda: click.echo(profiler.format_report(), err=True))
+        ctx.with_resource(profiler)
+
+
+@main.command()
+@input_files_argument
+@click.pass_obj
+def ingest(context, input_files):
+    """Parse bank export files and cache the results"""
+    with timed("ingest"):
+        mutations = load_mutations(context, input_files)
+        per_account = {}
+        for mutation in mutations:
+            account = str(mutation.account)
+            per_account[account] = per_account.get(account, 0) + 1
+        click.echo(format_table(["account", "mutations"],
+                                sorted(per_account.items())))
+        click.echo(f"{len(mutations)} mutations in total")
+
+
+@main.command()
+@classifier_argument
+@input_files_argument
+@click.pass_obj
+def classify(context, classifier_file, input_files):
+    """Classify mutations with a YAML classifier and cache the results"""
+    with timed("classify"):
+        mutations = load_classified(context, input_files, classifier_file)
+        counts = {}
+        for mutation in mutations:
+            names = [category_path(x) for x in mutation.categories] or \
+                ["<unclassified>"]
+            for name in names:
+                counts[name] = counts.get(name, 0) + 1
+        click.echo(format_table(["category", "mutations"], sorted(counts.items())))
+
+
+@main.group()
+def report():
+    """Print summaries of mutations"""
+    pass
+
+
+def load_rates(rates_file):
+    """RateTable from file, or None if no file given"""
+    if rates_file is None:
+        return None
+    from sitdown.currency import RateTable
+    return RateTable.load(rates_file)
+
+
+@report.command()
+@input_files_argument
+@click.option("--account", default=None, help="Only include this account number")
+@rates_option
+@click.pass_obj
+def monthly(context, input_files, account, rates):
+    """Incoming, outgoing and total amount per month"""
+    from sitdown.query import Query
+
+    with timed("report monthly"):
+        query = Query(load_mutations(context, input_files), rates=load_rates(rates))
+        if account:
+            query = query.where(lambda x: x.account.number == account)
+        currencies = [None] if rates else query.currencies()
+        per_currency = len(currencies) > 1
+        rows = []
+        for currency in currencies:
+            grouped = (query.in_currency(currency) if per_currency
+                       else query).group_by_month()
+            sum_in, sum_out = grouped.sum_in(), grouped.sum_out()
+            sums, counts = grouped.sum(), grouped.count()
+            rows += [[month] + ([currency] if per_currency else []) +
+                     [sum_in[month], sum_out[month], sums[month], counts[month]]
+                     for month in sums]
+        rows = [[str(x[0])] + x[1:] for x in sorted(rows, key=lambda x: x[:2])]
+        header = ["month"] + (["currency"] if per_currency else []) + \
+            ["in", "out", "total", "mutations"]
+        click.echo(format_table(header, rows))
+
+
+@report.command()
+@classifier_argument
+@input_files_argument
+@rates_option
+@click.pass_obj
+def categories(context, classifier_file, input_files, rates):
+    """Total amount per category"""
+    from sitdown.currency import amounts_in_one_currency, normalize_currency, \
+        sums_per_currency
+
+    with timed("report categories"):
+        mutations = load_classified(context, input_files, classifier_file)
+        rates = load_rates(rates)
+        per_currency = rates is None and \
+            len({normalize_currency(x.currency) for x in mutations}) > 1
+        per_category = {}
+        for mutation in mutations:
+            names = [category_path(x) for x in mutation.categories] or \
+                ["<unclassified>"]
+            for name in names:
+                per_category.setdefault(name, []).append(mutation)
+        rows = []
+        for name, in_category in sorted(per_category.items()):
+            if per_currency:
+                rows += [[name, currency, total,
+                          sum(normalize_currency(x.currency) == currency
+                              for x in in_category)]
+                         for currency, total in sums_per_currency(in_category).items()]
+            else:
+                rows.append([name, amounts_in_one_currency(in_category, rates).sum(),
+                             len(in_category)])
+        header = ["category"] + (["currency"] if per_currency else []) + \
+            ["total", "mutations"]
+        click.echo(format_table(header, rows))
+
+
+@main.group()
+def cache():
+    """Inspect or clear the cache"""
+    pass
+
+
+@cache.command()
+@click.pass_obj
+def info(context):
+    """Show cache location and size"""
+    if not context.cache:
+        click.echo("Cache is disabled")
+        return
+    click.echo(f"Cache dir: {context.cache.path}")
+    click.echo(f"{len(context.cache.entries())} entries, "
+               f"{context.cache.size() / 1024:.1f} kB")
+
 
-@click.command()
-def main(args=None):
-    """Console script for sitdown."""
-    click.echo("Replace this message by putting your code into "
-               "sitdown.cli.main")
-    click.echo("See click documentation at http://click.pocoo.org/")
-    return 0
+@cache.command()
+@click.pass_obj
+def clear(context):
+    """Remove all cached results"""
+    if not context.cache:
+        click.echo("Cache is disabled")
+        return
+    click.echo(f"Removed {context.cache.clear()} entries")
 
 
 if __name__ == "__main__":
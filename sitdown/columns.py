@@ -0,0 +1,514 @@
+"""Mutations stored as columns of numpy arrays instead of Mutation objects
+
+Parsing millions of lines into Mutation objects costs time and memory that many
+tasks, like summing per month, do not need. MutationColumns holds one array per
+field. Descriptions stay in the original file buffer as (start, end) offsets and
+are decoded only when asked for.
+
+The parse_ functions here work on a whole buffer of bytes at once, vectorized
+over all fields of the same kind.
+"""
+from sitdown.aggregation import AmountArray, MINOR_UNIT_EXPONENT, from_minor_units, \
+    to_minor_units_array
+from sitdown.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+MAX_NUMBER_WIDTH = 24  # longest amount field in bytes, including sign and separators
+
+
+def field_bytes(buffer, starts, ends, width):
+    """Gather fields of at most width bytes into a 2D array, padded with zeros
+
+    Parameters
+    ----------
+    buffer: numpy.ndarray
+        uint8 view of the file contents
+    starts: numpy.ndarray
+        int64 start offset of each field
+    ends: numpy.ndarray
+        int64 end offset (exclusive) of each field
+    width: int
+
+    Returns
+    -------
+    Tuple[numpy.ndarray, numpy.ndarray]
+        uint8 array of shape (fields, width) and boolean mask of valid bytes
+    """
+    index = starts[:, None] + np.arange(width)
+    valid = index < ends[:, None]
+    chars = buffer[np.minimum(index, len(buffer) - 1)]
+    chars[~valid] = 0
+    return chars, valid
+
+
+def parse_minor_units(buffer, starts, ends, decimal_separator=b","):
+    """Parse amount fields like '-1.234,56' to int64 minor units, all at once
+
+    Parameters
+    ----------
+    buffer: numpy.ndarray
+        uint8 view of the file contents
+    starts: numpy.ndarray
+        int64 start offset of each field
+    ends: numpy.ndarray
+        int64 end offset (exclusive) of each field
+    decimal_separator: bytes, optional
+        The other one of ',' and '.' is taken as thousands separator and
+        ignored. Defaults to ','
+
+    Returns
+    -------
+    Tuple[numpy.ndarray, numpy.ndarray]
+        int64 minor units, and boolean array that is True for fields that could
+        not be parsed. Those have value 0
+    """
+    thousands = b"." if decimal_separator == b"," else b","
+    width = int(min(MAX_NUMBER_WIDTH, (ends - starts).max(initial=1)))
+    chars, valid = field_bytes(buffer, starts, ends, width)
+    is_digit = (chars >= ord("0")) & (chars <= ord("9"))
+    is_separator = chars == ord(decimal_separator)
+    is_minus = chars == ord("-")
+    is_space = chars == ord(" ")
+    known = is_digit | is_separator | is_minus | is_space | (chars == ord(thousands))
+    n_digits = is_digit.sum(axis=1)
+    bad = (valid & ~known).any(axis=1) | (is_separator.sum(axis=1) > 1) | \
+        (n_digits == 0) | (n_digits > 17) | (ends - starts > MAX_NUMBER_WIDTH)
+
+    # weight of each digit is 10 ** (number of digits to its right)
+    digits_right = np.cumsum(is_digit[:, ::-1], axis=1)[:, ::-1] - is_digit
+    values = np.where(is_digit, (chars - ord("0")).astype(np.int64), 0)
+    powers = 10 ** np.arange(18, dtype=np.int64)
+    value = (values * powers[np.minimum(digits_right, 17)]).sum(axis=1)
+
+    # digits after the separator are decimals
+    after_separator = np.cumsum(is_separator, axis=1) > 0
+    decimals = (is_digit & after_separator).sum(axis=1)
+    shift = MINOR_UNIT_EXPONENT - decimals
+    bad |= shift < 0  # more decimals than minor units can hold
+    value = value * powers[np.clip(shift, 0, 17)]
+
+    # a sign is only allowed as the first or last non-blank byte, like '-3,15'
+    # or '3,15-'. Not in between, like '1-00'
+    filled = valid & ~is_space
+    first = filled.argmax(axis=1)
+    last = width - 1 - filled[:, ::-1].argmax(axis=1)
+    rows = np.arange(len(chars))
+    n_minus = is_minus.sum(axis=1)
+    bad |= (n_minus > 1) | ((n_minus == 1) & ~is_minus[rows, first] & ~is_minus[rows, last])
+
+    value = np.where(n_minus > 0, -value, value)
+    value[bad] = 0
+    return value, bad
+
+
+def parse_yyyymmdd(buffer, starts):
+    """Parse 8-digit date fields like '20160715' to datetime64[D], all at once
+
+    Returns
+    -------
+    Tuple[numpy.ndarray, numpy.ndarray]
+        dates, and boolean array that is True for fields that are not a date
+    """
+    chars, _ = field_bytes(buffer, starts, starts + 8, 8)
+    digits = chars.astype(np.int64) - ord("0")
+    bad = ((digits < 0) | (digits > 9)).any(axis=1)
+    digits[bad] = 0
+    year = digits[:, :4] @ np.array([1000, 100, 10, 1])
+    month = digits[:, 4:6] @ np.array([10, 1])
+    day = digits[:, 6:8] @ np.array([10, 1])
+    bad |= (month < 1) | (month > 12) | (day < 1) | (day > 31)
+    year, month, day = np.where(bad, 1970, year), np.where(bad, 1, month), \
+        np.where(bad, 1, day)
+    months = (year - 1970) * 12 + month - 1
+    dates = months.astype("datetime64[M]").astype("datetime64[D]") + (day - 1)
+    # days beyond the end of the month, like 20160231, roll over. Catch those
+    bad |= dates.astype("datetime64[M]") != months.astype("datetime64[M]")
+    return dates, bad
+
+
+def categories(buffer, starts, ends):
+    """Categorical codes for short text fields like account numbers
+
+    Parameters
+    ----------
+    buffer: numpy.ndarray
+        uint8 view of the file contents
+    starts: numpy.ndarray
+        int64 start offset of each field
+    ends: numpy.ndarray
+        int64 end offset (exclusive) of each field
+
+    Returns
+    -------
+    Tuple[numpy.ndarray, List[str]]
+        int32 code per field and the decoded value of each code, in order of
+        first appearance
+    """
+    width = int((ends - starts).max(initial=1)) or 1
+    chars, _ = field_bytes(buffer, starts, ends, width)
+    rows = np.ascontiguousarray(chars).view(np.dtype((np.void, width))).ravel()
+    unique, first, codes = np.unique(rows, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    renumber = np.empty_like(order)
+    renumber[order] = np.arange(len(order))
+    values = [bytes(x).rstrip(b"\0").decode() for x in unique[order]]
+    return renumber[codes.ravel()].astype(np.int32), values
+
+
+def line_chunks(raw, chunk_size):
+    """Split raw into (start, end) ranges of about chunk_size bytes that end
+    just after a newline, or at the end of raw
+
+    Parameters
+    ----------
+    raw: bytes-like
+        with a find() method, like bytes or mmap
+    chunk_size: int
+
+    Returns
+    -------
+    Iterator[Tuple[int, int]]
+        at least one range, (0, 0) for empty raw
+    """
+    start = 0
+    while True:
+        end = min(start + chunk_size, len(raw))
+        if end < len(raw):
+            newline = raw.find(b"\n", end)
+            end = len(raw) if newline < 0 else newline + 1
+        yield start, end
+        if end >= len(raw):
+            return
+        start = end
+
+
+def tab_fields(view, start, end, n_fields):
+    """Offsets of the tab separated fields of each line in view[start:end]. The
+    last field runs to the end of the line, tabs and all. Empty lines are
+    skipped
+
+    Parameters
+    ----------
+    view: numpy.ndarray
+        uint8 view of the file contents
+    start: int
+    end: int
+    n_fields: int
+
+    Returns
+    -------
+    Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray]
+        field starts and field ends, both int64 arrays of shape (lines, n_fields),
+        offset of each line start and a boolean array that is True for lines
+        with fewer than n_fields fields. Fields of those lines are empty
+    """
+    if end <= start:
+        empty = np.zeros((0, n_fields), dtype=np.int64)
+        return empty, empty, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=bool)
+    chunk = view[start:end]
+    newlines = np.flatnonzero(chunk == ord("\n")) + start
+    line_starts = np.concatenate(([start], newlines + 1))
+    line_ends = np.concatenate((newlines, [end]))
+    # windows line endings
+    has_cr = (line_ends > line_starts) & \
+        (view[np.maximum(line_ends - 1, 0)] == ord("\r"))
+    line_ends = line_ends - has_cr
+    keep = line_ends > line_starts
+    line_starts, line_ends = line_starts[keep], line_ends[keep]
+
+    tabs = np.flatnonzero(chunk == ord("\t")) + start
+    index = np.searchsorted(tabs, line_starts)[:, None] + np.arange(n_fields - 1)
+    found = index < len(tabs)
+    positions = tabs[np.minimum(index, len(tabs) - 1)] if len(tabs) else \
+        np.zeros(index.shape, dtype=np.int64)
+    found &= positions < line_ends[:, None]
+    bad = ~found.all(axis=1)
+
+    starts = np.column_stack([line_starts, positions + 1])
+    ends = np.column_stack([positions, line_ends])
+    starts[bad] = line_starts[bad, None]
+    ends[bad] = line_starts[bad, None]
+    return starts, ends, line_starts, bad
+
+
+class MutationColumns:
+    """Fields of many mutations as arrays of equal length"""
+
+    def __init__(self, accounts, account_codes, currencies, currency_codes, dates,
+                 amounts, balances_before, balances_after, buffer,
+                 description_starts, description_ends, encoding="utf-8"):
+        """
+
+        Parameters
+        ----------
+        accounts: List[str]
+            account numbers, indexed by account_codes
+        account_codes: numpy.ndarray
+            int32 index into accounts per mutation
+        currencies: List[str]
+            currency codes, indexed by currency_codes
+        currency_codes: numpy.ndarray
+            int32 index into currencies per mutation
+        dates: numpy.ndarray
+            datetime64[D]
+        amounts: numpy.ndarray
+            int64 minor units
+        balances_before: numpy.ndarray
+            int64 minor units
+        balances_after: numpy.ndarray
+            int64 minor units
+        buffer: bytes-like
+            original file contents. Descriptions are read from here
+        description_starts: numpy.ndarray
+            int64 offsets into buffer
+        description_ends: numpy.ndarray
+            int64 offsets into buffer, exclusive
+        encoding: str, optional
+            encoding of descriptions in buffer. Defaults to 'utf-8'
+        """
+        self.accounts = accounts
+        self.account_codes = account_codes
+        self.currencies = currencies
+        self.currency_codes = currency_codes
+        self.dates = dates
+        self.amounts = amounts
+        self.balances_before = balances_before
+        self.balances_after = balances_after
+        self.buffer = buffer
+        self.description_starts = description_starts
+        self.description_ends = description_ends
+        self.encoding = encoding
+
+    @classmethod
+    def from_mutations(cls, mutations, encoding="utf-8"):
+        """Columns holding the fields of Mutation objects. Descriptions are joined
+        into a new buffer. Missing balances become 0
+
+        Parameters
+        ----------
+        mutations: Sequence[Mutation]
+        encoding: str, optional
+            Defaults to 'utf-8'
+
+        Returns
+        -------
+        MutationColumns
+        """
+        accounts, currencies = {}, {}
+        account_codes = np.fromiter(
+            (accounts.setdefault(str(getattr(x.account, "number", x.account)),
+                                 len(accounts)) for x in mutations),
+            dtype=np.int32, count=len(mutations))
+        currency_codes = np.fromiter(
+            (currencies.setdefault(x.currency, len(currencies)) for x in mutations),
+            dtype=np.int32, count=len(mutations))
+        encoded = [(x.description or "").encode(encoding) for x in mutations]
+        lengths = np.fromiter((len(x) for x in encoded), dtype=np.int64,
+                              count=len(encoded))
+        ends = np.cumsum(lengths)
+        return cls(accounts=list(accounts), account_codes=account_codes,
+                   currencies=list(currencies), currency_codes=currency_codes,
+                   dates=np.array([x.date for x in mutations], dtype="datetime64[D]"),
+                   amounts=to_minor_units_array([x.amount for x in mutations]),
+                   balances_before=to_minor_units_array(
+                       [x.balance_before or 0 for x in mutations]),
+                   balances_after=to_minor_units_array(
+                       [x.balance_after or 0 for x in mutations]),
+                   buffer=b"".join(encoded), description_starts=ends - lengths,
+                   description_ends=ends, encoding=encoding)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __str__(self):
+        return f"MutationColumns ({len(self)} mutations)"
+
+    def description(self, index):
+        """Description of a single mutation, decoded from the buffer"""
+        start, end = self.description_starts[index], self.description_ends[index]
+        return bytes(self.buffer[start:end]).decode(self.encoding, errors="replace")
+
+    def descriptions(self):
+        """All descriptions, decoded
+
+        Returns
+        -------
+        List[str]
+        """
+        return [self.description(i) for i in range(len(self))]
+
+    def amount_array(self):
+        """Amounts for exact aggregation
+
+        Returns
+        -------
+        AmountArray
+        """
+        return AmountArray(self.amounts)
+
+    def mutations(self, reader):
+        """Convert to Mutation objects. Amounts and balances are exact Decimals,
+        like those of the other readers. ABNAMROReader.read() gives floats for the
+        same file, for backwards compatibility
+
+        Parameters
+        ----------
+        reader: ABNAMROReader
+            for linking accounts and finding opposite accounts
+
+        Returns
+        -------
+        List[Mutation]
+        """
+        from sitdown.core import Mutation
+
+        accounts = [reader.get_account(account_number=x) for x in self.accounts]
+        dates = self.dates.astype(object)  # datetime.date
+        mutations = []
+        for i in range(len(self)):
+            description = self.description(i)
+            mutations.append(Mutation(
+                amount=from_minor_units(self.amounts[i]),
+                date=dates[i],
+                account=accounts[self.account_codes[i]],
+                currency=self.currencies[self.currency_codes[i]],
+                opposite_account=reader.find_iban(description),
+                description=description,
+                balance_before=from_minor_units(self.balances_before[i]),
+                balance_after=from_minor_units(self.balances_after[i])))
+        return mutations
+
+    @classmethod
+    def concatenate(cls, parts):
+        """Join several MutationColumns over the same buffer into one"""
+        if len(parts) == 1:
+            return parts[0]
+        accounts, account_codes = merge_categories(
+            [(x.accounts, x.account_codes) for x in parts])
+        currencies, currency_codes = merge_categories(
+            [(x.currencies, x.currency_codes) for x in parts])
+
+        def join(name):
+            return np.concatenate([getattr(x, name) for x in parts])
+
+        return cls(accounts=accounts, account_codes=account_codes,
+                   currencies=currencies, currency_codes=currency_codes,
+                   dates=join("dates"), amounts=join("amounts"),
+                   balances_before=join("balances_before"),
+                   balances_after=join("balances_after"),
+                   buffer=parts[0].buffer,
+                   description_starts=join("description_starts"),
+                   description_ends=join("description_ends"),
+                   encoding=parts[0].encoding)
+
+
+def merge_categories(parts):
+    """Combine categorical columns that each have their own list of values
+
+    Parameters
+    ----------
+    parts: List[Tuple[List[str], numpy.ndarray]]
+        values and codes of each part
+
+    Returns
+    -------
+    Tuple[List[str], numpy.ndarray]
+        values and codes of all parts joined
+    """
+    index = {}
+    all_codes = []
+    for values, codes in parts:
+        mapping = np.array([index.setdefault(x, len(index)) for x in values] or [0],
+                           dtype=np.int32)
+        all_codes.append(mapping[codes])
+    return list(index), np.concatenate(all_codes)
+
+
+class DescriptionSearch:
+    """Case insensitive substring search in the descriptions of MutationColumns
+
+    A new pattern is found with a vectorized scan over the description bytes.
+    Typing on is incremental: when a pattern extends one searched before, only
+    the matches of that earlier pattern are checked for the extra characters.
+    Upper and lower case are only folded for ASCII letters
+    """
+
+    HISTORY = 32  # number of recent patterns to keep matches for
+
+    def __init__(self, columns):
+        """
+        Parameters
+        ----------
+        columns: MutationColumns
+        """
+        self.encoding = columns.encoding
+        self.text = np.frombuffer(bytes(columns.buffer).lower(), dtype=np.uint8)
+        # rows ordered by start offset, to find the row of a match position
+        self.order = np.argsort(columns.description_starts, kind="stable")
+        self.starts = np.asarray(columns.description_starts)[self.order]
+        self.ends = np.asarray(columns.description_ends)[self.order]
+        self._history = {}  # pattern: match positions, oldest first
+
+    def _scan(self, pattern):
+        """Start positions of pattern anywhere in the buffer"""
+        n = len(self.text) - len(pattern) + 1
+        if n <= 0:
+            return np.zeros(0, dtype=np.int64)
+        found = self.text[:n] == pattern[0]
+        for i in range(1, len(pattern)):
+            found &= self.text[i:n + i] == pattern[i]
+        return np.flatnonzero(found)
+
+    def _extend(self, positions, pattern, known):
+        """Positions where the first known bytes of pattern already match and the
+        rest of pattern matches too"""
+        positions = positions[positions + len(pattern) <= len(self.text)]
+        for i in range(known, len(pattern)):
+            positions = positions[self.text[positions + i] == pattern[i]]
+        return positions
+
+    def positions(self, text):
+        """Start positions of text in the buffer, also across descriptions
+
+        Returns
+        -------
+        numpy.ndarray
+            sorted int64 offsets
+        """
+        pattern = text.encode(self.encoding).lower()
+        if pattern in self._history:
+            return self._history[pattern]
+        base = max((x for x in self._history if pattern.startswith(x)),
+                   key=len, default=b"")
+        if base:
+            positions = self._extend(self._history[base], pattern, len(base))
+        else:
+            head = min(len(pattern), 3)  # narrow the rest down incrementally
+            positions = self._extend(self._scan(pattern[:head]), pattern, head)
+        self._history[pattern] = positions
+        if len(self._history) > self.HISTORY:
+            del self._history[next(iter(self._history))]
+        return positions
+
+    def find(self, text):
+        """Rows whose description contains text
+
+        Parameters
+        ----------
+        text: str
+
+        Returns
+        -------
+        numpy.ndarray
+            sorted int64 row indices
+        """
+        if not text:
+            return np.arange(len(self.order))
+        positions = self.positions(text)
+        rows = np.searchsorted(self.starts, positions, side="right") - 1
+        end = positions + len(text.encode(self.encoding))
+        rows = rows[(rows >= 0) & (end <= self.ends[np.maximum(rows, 0)])]
+        # positions are sorted, so rows are too and duplicates are adjacent
+        rows = rows[np.concatenate(([True], rows[1:] != rows[:-1]))] if len(rows) else rows
+        return np.sort(self.order[rows])
@@ -1,10 +1,12 @@
 # -*- coding: utf-8 -*-
 
 """Main module."""
+import hashlib
 import pickle
 from abc import ABCMeta, abstractmethod
 from typing import Set
 
+from sitdown.aggregation import to_minor_units
 from sitdown.classifiers import Category
 
 
@@ -12,9 +14,16 @@ class Mutation:
     """An increase or decrease of money on an account. Basic object for most things
     in sitdown.
 
-    Is sortable by date by default
+    Is sortable by date by default. Two mutations are equal if their identity
+    fields are equal, with amounts compared in minor units. Hashing uses
+    fingerprint(), which is the same in every process
     """
 
+    # fields that make up the identity of a mutation. Categories are not included
+    IDENTITY_FIELDS = frozenset(("amount", "date", "account", "currency",
+                                 "opposite_account", "description", "balance_before",
+                                 "balance_after"))
+
     def __init__(
         self,
         amount,
@@ -50,18 +59,13 @@ class Mutation:
         categories: Set[Category], optional
             categories to which this mutation belongs. Defaults to empty set
         """
-
-        self.amount = amount
-        self.date = date
-        self.account = account
-        self.currency = currency
-        self.opposite_account = opposite_account
-        self.description = description
-        self.balance_before = balance_before
-        self.balance_after = balance_after
         if categories is None:
             categories = set()
-        self.categories = categories
+        # straight into __dict__, there is no fingerprint to invalidate yet
+        self.__dict__.update(amount=amount, date=date, account=account,
+                             currency=currency, opposite_account=opposite_account,
+                             description=description, balance_before=balance_before,
+                             balance_after=balance_after, categories=categories)
 
     def __str__(self):
         return f"Mutation of {self.amount} on {self.date}"
@@ -69,13 +73,56 @@ class Mutation:
     def __lt__(self, other):
         return self.date < other.date
 
+    def __setattr__(self, name, value):
+        if name in self.IDENTITY_FIELDS:
+            self.__dict__.pop("_fingerprint", None)
+        super().__setattr__(name, value)
+
+    def identity(self):
+        """Identity fields in canonical form: amounts as int minor units and
+        accounts as account number strings
+
+        Returns
+        -------
+        Tuple
+        """
+        def minor(amount):
+            return None if amount is None else to_minor_units(amount)
+
+        def number(account):
+            return account.number if isinstance(account, BankAccount) else account
+
+        return (minor(self.amount), self.date.isoformat(), str(number(self.account)),
+                self.currency, number(self.opposite_account), self.description,
+                minor(self.balance_before), minor(self.balance_after))
+
+    def fingerprint(self):
+        """Stable 128-bit content fingerprint of the identity fields. The same
+        across processes and Python versions, so it can be stored and shared.
+        Computed once, until an identity field is changed
+
+        Returns
+        -------
+        bytes
+            16 bytes
+        """
+        try:
+            return self.__dict__["_fingerprint"]
+        except KeyError:
+            encoded = "\x1f".join("\x1e" if x is None else str(x)
+                                   for x in self.identity()).encode()
+            fingerprint = hashlib.blake2b(encoded, digest_size=16).digest()
+            self.__dict__["_fingerprint"] = fingerprint
+            return fingerprint
+
     def __eq__(self, other):
-        return self.__hash__() == other.__hash__()
+        if not isinstance(other, Mutation):
+            return NotImplemented
+        return self.fingerprint() == other.fingerprint() and \
+            self.identity() == other.identity()
 
     def __hash__(self):
-        return hash((self.amount, self.date, str(self.account), self.currency,
-                     self.opposite_account, self.description, self.balance_before,
-                     self.balance_after))
+        return int.from_bytes(self.fingerprint()[:8], "little")
 
 
 class BankAccount:
@@ -0,0 +1,396 @@
+"""Sums and counts of mutations per account, category and month, in any combination
+
+A MutationCube is built in a single pass over the mutations. It stores one cell for
+each (account, category, month) that has mutations, holding the sum of amounts, the
+sum of incoming and outgoing amounts and the number of mutations. Every other slice
+is rolled up from these cells without going back to the mutations:
+
+    cube = MutationCube(mutations)
+    cube.group(by=("category", "period"), category_level=0, period="year")
+    cube.total(account=checking, category=Category("shopping"))
+
+Cells are keyed on the most specific categories of a mutation, and rolling up to a
+parent category adds up its subcategories. A mutation with several categories is
+allocated over them as in CategoryMatrix, split evenly by default. Mutations without
+category are in UNCLASSIFIED. Slices that are not per category come from separate
+per-mutation cells, so there each mutation counts exactly once. Per category, a
+mutation counts once in each category it is allocated to.
+"""
+import datetime
+from collections import OrderedDict
+
+from sitdown.aggregation import from_minor_units
+from sitdown.classifiers import Category
+from sitdown.currency import amounts_in_one_currency
+from sitdown.lazy import lazy_import
+from sitdown.profiling import stage
+
+np = lazy_import("numpy")
+
+UNCLASSIFIED = Category("<unclassified>")
+DIMENSIONS = ("account", "category", "period")
+PERIODS = {"month": 1, "quarter": 3, "year": 12}  # length in months
+LAYERS = ("sum", "in", "out", "count")
+ALLOCATIONS = ("split", "each", "first")
+
+
+def period_label(key, period):
+    """Human readable label for a period key, like '2019/3', '2019 Q2' or '2019'"""
+    months = PERIODS[period]
+    year, index = divmod(key * months, 12)
+    if period == "month":
+        return f"{year}/{index + 1}"
+    if period == "quarter":
+        return f"{year} Q{index // 3 + 1}"
+    return str(year)
+
+
+def most_specific(categories):
+    """categories without those that are a parent of another one of them"""
+    parents = set()
+    for category in categories:
+        parent = category.parent
+        while parent is not None:
+            parents.add(parent)
+            parent = parent.parent
+    return [x for x in categories if x not in parents]
+
+
+def allocated_categories(categories, allocation="split"):
+    """The categories a mutation is allocated to, sorted by name
+
+    Parameters
+    ----------
+    categories: Set[Category]
+        categories of the mutation
+    allocation: str, optional
+        one of ALLOCATIONS. 'first' keeps only the first category by name.
+        Defaults to 'split'
+
+    Returns
+    -------
+    Sequence[Category]
+        most specific categories, or only UNCLASSIFIED if there are none
+    """
+    if len(categories) > 1:
+        categories = sorted(most_specific(categories), key=lambda x: x.name)
+        if allocation == "first":
+            categories = categories[:1]
+    return categories or (UNCLASSIFIED,)
+
+
+def allocate(minor_units, shares, parts):
+    """Share number shares of amounts divided into parts. Shares add up to the
+    amount exactly; remaining minor units go to the first shares
+
+    Parameters
+    ----------
+    minor_units: numpy.ndarray
+        int64 amount of the mutation each share is of
+    shares: numpy.ndarray
+        int64 number of each share, in range(parts)
+    parts: numpy.ndarray
+        int64 number of shares each amount is divided into
+
+    Returns
+    -------
+    numpy.ndarray
+        int64 minor units of each share
+    """
+    quotient, remainder = np.divmod(np.abs(minor_units), parts)
+    return np.sign(minor_units) * (quotient + (shares < remainder))
+
+
+def check_allocation(allocation):
+    if allocation not in ALLOCATIONS:
+        raise ValueError(f"Unknown allocation '{allocation}'. Options are {ALLOCATIONS}")
+
+
+class MutationCube:
+    """Sparse (account, category, month) aggregates of mutations"""
+
+    def __init__(self, mutations, rates=None, allocation="split"):
+        """
+
+        Parameters
+        ----------
+        mutations: Iterable[Mutation]
+        rates: RateTable, optional
+            Convert amounts with these rates. Defaults to None, in which case all
+            mutations should be in the same currency
+        allocation: str, optional
+            How to allocate a mutation with several categories, one of
+            ALLOCATIONS as for CategoryMatrix. Defaults to 'split'
+
+        Raises
+        ------
+        ValueError
+            When allocation is not one of ALLOCATIONS
+        """
+        check_allocation(allocation)
+        mutations = list(mutations)
+        with stage("MutationCube", rows=len(mutations)):
+            self.accounts = {}  # BankAccount: id
+            self.categories = {}  # Category: id
+            account_ids, months = [], []
+            rows, category_ids, shares, parts = [], [], [], []
+            for row, mutation in enumerate(mutations):
+                account_ids.append(self.accounts.setdefault(mutation.account,
+                                                            len(self.accounts)))
+                months.append(mutation.date.year * 12 + mutation.date.month - 1)
+                assigned = allocated_categories(mutation.categories, allocation)
+                for share, category in enumerate(assigned):
+                    rows.append(row)
+                    category_ids.append(self._category_id(category))
+                    shares.append(share)
+                    parts.append(len(assigned) if allocation == "split" else 1)
+
+            amounts = amounts_in_one_currency(mutations, rates).minor_units
+            account_ids = np.array(account_ids, dtype=np.int64)
+            months = np.array(months, dtype=np.int64)
+            # one cell per (account, month) with each mutation counted once
+            base, self.base_values = self._aggregate(
+                np.stack([account_ids, months]), self._layers(amounts))
+            self.base_accounts, self.base_months = base
+
+            rows = np.array(rows, dtype=np.int64)
+            allocated = allocate(amounts[rows], np.array(shares, dtype=np.int64),
+                                 np.array(parts, dtype=np.int64))
+            cells, self.values = self._aggregate(
+                np.stack([account_ids[rows], np.array(category_ids, dtype=np.int64),
+                          months[rows]]), self._layers(allocated))
+            self.cell_accounts, self.cell_categories, self.cell_months = cells
+
+        self.allocation = allocation
+        self.account_list = list(self.accounts)
+        self.category_list = list(self.categories)
+        # parent id of each category, -1 for top level
+        self.parents = np.array([self.categories[x.parent] if x.parent is not None
+                                 else -1 for x in self.category_list], dtype=np.int64)
+        self.depths = np.zeros(len(self.category_list), dtype=np.int64)
+        for i, category in enumerate(self.category_list):
+            parent = category.parent
+            while parent is not None:
+                self.depths[i] += 1
+                parent = parent.parent
+        self._rolled = {}
+
+    def _category_id(self, category):
+        """id of category, adding it and its parents if new"""
+        if category not in self.categories:
+            if category.parent is not None:
+                self._category_id(category.parent)
+            self.categories[category] = len(self.categories)
+        return self.categories[category]
+
+    @staticmethod
+    def _layers(minor_units):
+        """Values to sum for each of LAYERS"""
+        return {"sum": minor_units, "in": np.where(minor_units > 0, minor_units, 0),
+                "out": np.where(minor_units < 0, minor_units, 0),
+                "count": np.ones(len(minor_units), dtype=np.int64)}
+
+    @staticmethod
+    def _aggregate(keys, layers):
+        """Sum each layer per unique key column
+
+        Parameters
+        ----------
+        keys: numpy.ndarray
+            int64 array of shape (dimensions, n)
+        layers: Dict[str, numpy.ndarray]
+            int64 values of length n
+
+        Returns
+        -------
+        Tuple[numpy.ndarray, Dict[str, numpy.ndarray]]
+            unique keys of shape (dimensions, cells), and each layer per cell
+        """
+        if keys.shape[1] == 0:
+            return keys, {name: np.zeros(0, dtype=np.int64) for name in layers}
+        unique, inverse = np.unique(keys, axis=1, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        sums = {}
+        for name, values in layers.items():
+            sums[name] = np.zeros(unique.shape[1], dtype=np.int64)
+            np.add.at(sums[name], inverse, values)
+        return unique, sums
+
+    def __len__(self):
+        """Number of non-empty (account, category, month) cells"""
+        return len(self.cell_months)
+
+    def __str__(self):
+        return (f"MutationCube ({len(self.account_list)} accounts, "
+                f"{len(self.category_list)} categories, {len(self)} cells)")
+
+    def ancestors(self, level):
+        """Category id of the ancestor of each category at level. Categories
+        at or above level map to themselves
+
+        Parameters
+        ----------
+        level: int
+            0 for top-level categories
+
+        Returns
+        -------
+        numpy.ndarray
+            int64 category id, indexed by category id
+        """
+        ids = np.arange(len(self.category_list))
+        for _ in range(int(self.depths.max(initial=0))):
+            deeper = self.depths[ids] > level
+            ids = np.where(deeper, self.parents[ids], ids)
+        return ids
+
+    def members(self, category):
+        """Which categories are in category, by Category.is_in(), as a bool mask
+        indexed by category id"""
+        return np.array([x.is_in(category) for x in self.category_list], dtype=bool)
+
+    def _cells(self, per_category):
+        """Accounts, categories, months and values of the (account, category,
+        month) cells, or of the per-mutation (account, month) cells"""
+        if per_category:
+            return self.cell_accounts, self.cell_categories, self.cell_months, \
+                self.values
+        return self.base_accounts, None, self.base_months, self.base_values
+
+    def _cell_mask(self, per_category, account=None, category=None, start=None,
+                   end=None):
+        accounts, categories, months, _ = self._cells(per_category)
+        mask = np.ones(len(months), dtype=bool)
+        if account is not None:
+            if account not in self.accounts:
+                return np.zeros(len(months), dtype=bool)
+            mask &= accounts == self.accounts[account]
+        if category is not None:
+            mask &= self.members(category)[categories]
+        if start is not None:
+            mask &= months >= start.year * 12 + start.month - 1
+        if end is not None:
+            mask &= months < end.year * 12 + end.month - 1
+        return mask
+
+    @staticmethod
+    def _layer(values, layer):
+        if layer not in LAYERS:
+            raise ValueError(f"Unknown layer '{layer}'. Options are {LAYERS}")
+        return values[layer]
+
+    @staticmethod
+    def _value(layer, total):
+        return int(total) if layer == "count" else from_minor_units(int(total))
+
+    def total(self, account=None, category=None, start=None, end=None, layer="sum"):
+        """Single total over all cells in a slice
+
+        Parameters
+        ----------
+        account: BankAccount, optional
+            only this account. Defaults to all
+        category: Category, optional
+            only this category and its subcategories. Defaults to all
+        start: datetime.date, optional
+            only from the month of this date on. Defaults to no lower bound
+        end: datetime.date, optional
+            only months before the month of this date. Defaults to no upper bound
+        layer: str, optional
+            one of LAYERS. Defaults to 'sum'
+
+        Returns
+        -------
+        Decimal or int
+            int for layer 'count'
+        """
+        per_category = category is not None
+        values = self._layer(self._cells(per_category)[3], layer)
+        mask = self._cell_mask(per_category, account, category, start, end)
+        return self._value(layer, values[mask].sum())
+
+    def _rollup(self, per_category, by, category_level, period):
+        """Cells rolled up to category_level and period, grouped by the
+        dimensions in by. Cached
+
+        Returns
+        -------
+        Tuple[numpy.ndarray, numpy.ndarray]
+            unique keys of shape (len(by), groups), and the group of each cell
+        """
+        cache_key = (per_category, by, category_level, period)
+        if cache_key not in self._rolled:
+            accounts, categories, months, _ = self._cells(per_category)
+            columns = {"account": accounts,
+                       "category": categories if category_level is None or
+                       categories is None else self.ancestors(category_level)[categories],
+                       "period": months // PERIODS[period]}
+            keys = np.stack([columns[x] for x in by]) if by else \
+                np.zeros((1, len(months)), dtype=np.int64)
+            if len(months):
+                unique, inverse = np.unique(keys, axis=1, return_inverse=True)
+                inverse = inverse.reshape(-1)
+            else:
+                unique, inverse = keys, np.zeros(0, dtype=np.int64)
+            self._rolled[cache_key] = unique, inverse
+        return self._rolled[cache_key]
+
+    def group(self, by=DIMENSIONS, category_level=None, period="month", account=None,
+              category=None, start=None, end=None, layer="sum"):
+        """Totals per combination of the dimensions in by
+
+        Parameters
+        ----------
+        by: Sequence[str], optional
+            any of DIMENSIONS: 'account', 'category' and 'period'. Defaults to all
+        category_level: int, optional
+            roll categories up to this depth, 0 being top level categories.
+            Defaults to None, meaning the most specific categories
+        period: str, optional
+            'month', 'quarter' or 'year'. Defaults to 'month'
+        account, category, start, end: optional
+            only include this slice, as for total()
+        layer: str, optional
+            one of LAYERS. Defaults to 'sum'
+
+        Returns
+        -------
+        OrderedDict[Tuple, Decimal or int]
+            keys are tuples of BankAccount, Category and period label, in the
+            order of by. Sorted by account, category and period id
+        """
+        by = tuple(by)
+        if any(x not in DIMENSIONS for x in by):
+            raise ValueError(f"Can only group by {DIMENSIONS}, not {by}")
+        if period not in PERIODS:
+            raise ValueError(f"Unknown period '{period}'. Options are {tuple(PERIODS)}")
+        per_category = "category" in by or category is not None
+        values = self._layer(self._cells(per_category)[3], layer)
+        unique, inverse = self._rollup(per_category, by, category_level, period)
+        mask = self._cell_mask(per_category, account, category, start, end)
+        sums = np.zeros(unique.shape[1], dtype=np.int64)
+        np.add.at(sums, inverse[mask], values[mask])
+        present = np.zeros(unique.shape[1], dtype=bool)
+        present[inverse[mask]] = True
+
+        labels = {"account": lambda x: self.account_list[x],
+                  "category": lambda x: self.category_list[x],
+                  "period": lambda x: period_label(x, period)}
+        result = OrderedDict()
+        for column in np.flatnonzero(present):
+            key = tuple(labels[name](int(unique[i, column])) for i, name in enumerate(by))
+            result[key] = self._value(layer, sums[column])
+        return result
+
+    def month_range(self):
+        """First and last month with mutations
+
+        Returns
+        -------
+        Tuple[datetime.date, datetime.date] or None
+        """
+        if not len(self.base_months):
+            return None
+        first, last = int(self.base_months.min()), int(self.base_months.max())
+        return (datetime.date(first // 12, first % 12 + 1, 1),
+                datetime.date(last // 12, last % 12 + 1, 1))
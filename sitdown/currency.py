@@ -0,0 +1,258 @@
+"""Amounts in more than one currency
+
+Sums over mutations in different currencies are meaningless unless the amounts are
+first converted into one reporting currency. A RateTable holds daily exchange rates
+into that currency, read from a local CSV file:
+
+    date,currency,rate
+    2020-01-02,USD,0.8932
+    2020-01-02,GBP,1.1754
+
+Each rate is the value of one unit of currency in the reporting currency. Amounts
+are converted with the most recent rate on or before their date, so weekends and
+holidays use the last known rate. Lookups are an as-of join on sorted date arrays,
+one searchsorted call per currency instead of a lookup per mutation. Tables are
+read once per file and kept in memory.
+"""
+import csv
+import datetime
+
+from sitdown.aggregation import AmountArray
+from sitdown.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+ALIASES = {"EURO": "EUR", "EUROS": "EUR", "€": "EUR", "$": "USD", "£": "GBP"}
+
+_loaded = {}  # RateTables read from file, by file_key()
+
+
+def normalize_currency(code):
+    """ISO 4217 code for a currency as written in exports, like 'EURO' -> 'EUR'"""
+    code = str(code).strip().upper()
+    return ALIASES.get(code, code)
+
+
+class CurrencyError(ValueError):
+    """Amounts in different currencies can not be combined as asked"""
+
+
+class RateTable:
+    """Daily exchange rates of several currencies into one reporting currency"""
+
+    def __init__(self, base="EUR", rates=None):
+        """
+
+        Parameters
+        ----------
+        base: str, optional
+            reporting currency that all rates convert into. Defaults to 'EUR'
+        rates: Dict[str, List[Tuple[datetime.date, float]]], optional
+            per currency, value of one unit in base currency from each date on.
+            Defaults to no rates
+        """
+        self.base = normalize_currency(base)
+        self.dates = {}  # currency: sorted int64 date ordinals
+        self.rates = {}  # currency: float64 rate per date
+        for currency, values in (rates or {}).items():
+            values = sorted(values)
+            currency = normalize_currency(currency)
+            self.dates[currency] = np.array([x.toordinal() for x, _ in values],
+                                            dtype=np.int64)
+            self.rates[currency] = np.array([x for _, x in values], dtype=float)
+
+    @classmethod
+    def from_csv(cls, path, base="EUR"):
+        """Read rates from a CSV file with columns date, currency and rate
+
+        Returns
+        -------
+        RateTable
+        """
+        rates = {}
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                rates.setdefault(row["currency"], []).append(
+                    (datetime.date.fromisoformat(row["date"]), float(row["rate"])))
+        return cls(base=base, rates=rates)
+
+    @classmethod
+    def load(cls, path, base="EUR"):
+        """Same as from_csv(), but each file is read only once while it does not
+        change
+
+        Returns
+        -------
+        RateTable
+        """
+        from sitdown.cache import file_key
+
+        key = file_key(path, base)
+        if key not in _loaded:
+            _loaded[key] = cls.from_csv(path, base=base)
+        return _loaded[key]
+
+    def currencies(self):
+        """All currencies this table can convert, including the base currency"""
+        return sorted(set(self.dates) | {self.base})
+
+    def rate(self, currency, dates):
+        """Rates for currency on each date, as-of: the most recent rate on or
+        before each date
+
+        Parameters
+        ----------
+        currency: str
+        dates: numpy.ndarray
+            int date ordinals
+
+        Returns
+        -------
+        numpy.ndarray
+            float rate per date
+
+        Raises
+        ------
+        CurrencyError
+            if there is no rate for currency on or before some date
+        """
+        currency = normalize_currency(currency)
+        dates = np.asarray(dates, dtype=np.int64)
+        if currency == self.base:
+            return np.ones(len(dates))
+        if currency not in self.dates:
+            raise CurrencyError(f"No rates for {currency} into {self.base}")
+        index = np.searchsorted(self.dates[currency], dates, side="right") - 1
+        if len(index) and index.min() < 0:
+            first = datetime.date.fromordinal(int(self.dates[currency][0]))
+            raise CurrencyError(f"No rate for {currency} before {first}")
+        return self.rates[currency][index]
+
+    def convert(self, minor_units, currencies, dates):
+        """Convert amounts into the base currency, rounded to whole minor units
+
+        Parameters
+        ----------
+        minor_units: numpy.ndarray
+            int64 amounts in minor units of their own currency
+        currencies: Sequence[str]
+            currency of each amount
+        dates: numpy.ndarray
+            int date ordinal of each amount
+
+        Returns
+        -------
+        numpy.ndarray
+            int64 minor units of the base currency
+        """
+        names, codes = currency_codes(currencies)
+        return self._convert(minor_units, names, codes, dates)
+
+    def _convert(self, minor_units, names, codes, dates):
+        """convert() with currencies already as names and codes"""
+        dates = np.asarray(dates, dtype=np.int64)
+        rates = np.empty(len(codes))
+        for code, name in enumerate(names):
+            where = codes == code
+            rates[where] = self.rate(name, dates[where])
+        return np.rint(np.asarray(minor_units) * rates).astype(np.int64)
+
+
+def currency_codes(currencies):
+    """Normalized currencies as a list of names and an int code per value
+
+    Returns
+    -------
+    Tuple[List[str], numpy.ndarray]
+    """
+    index = {}
+    codes = np.fromiter((index.setdefault(x, len(index)) for x in currencies),
+                        dtype=np.int64)
+    # normalize each distinct value once. 'EUR' and 'EURO' become one code
+    names = {}
+    mapping = np.array([names.setdefault(normalize_currency(x), len(names))
+                        for x in index] or [0], dtype=np.int64)
+    return list(names), mapping[codes]
+
+
+def amounts_in_one_currency(mutations, rates=None):
+    """Amounts of mutations, all in the same currency
+
+    Parameters
+    ----------
+    mutations: Sequence[Mutation]
+    rates: RateTable, optional
+        convert amounts into the base currency of this table. Defaults to None,
+        meaning amounts are not converted
+
+    Returns
+    -------
+    AmountArray
+
+    Raises
+    ------
+    CurrencyError
+        if there are several currencies and no rates to convert them
+    """
+    return in_one_currency(AmountArray.from_mutations(mutations),
+                           [x.currency for x in mutations],
+                           (x.date for x in mutations), rates)
+
+
+def in_one_currency(amounts, currencies, dates, rates=None):
+    """amounts_in_one_currency() for fields that are already separate
+
+    Parameters
+    ----------
+    amounts: AmountArray
+    currencies: Sequence[str]
+        currency of each amount
+    dates: Iterable[datetime.date]
+        date of each amount. Only read when converting
+    rates: RateTable, optional
+        Defaults to None, meaning amounts are not converted
+
+    Returns
+    -------
+    AmountArray
+    """
+    names, codes = currency_codes(currencies)
+    check_single_currency(names, rates)
+    if rates is None or names == [rates.base]:
+        return amounts
+    dates = np.fromiter((x.toordinal() for x in dates), dtype=np.int64,
+                        count=len(amounts))
+    return AmountArray(rates._convert(amounts.minor_units, names, codes, dates))
+
+
+def check_single_currency(names, rates=None):
+    """Raise CurrencyError if amounts in currencies names can not be added
+
+    Parameters
+    ----------
+    names: Sequence[str]
+        normalized currencies
+    rates: RateTable, optional
+        amounts will be converted with these rates. Defaults to None
+    """
+    if rates is None and len(names) > 1:
+        raise CurrencyError(f"Can not add amounts in {', '.join(names)}. "
+                            f"Sum per currency, or give rates to convert")
+
+
+def sums_per_currency(mutations):
+    """Exact sum of amounts for each currency
+
+    Parameters
+    ----------
+    mutations: Sequence[Mutation]
+
+    Returns
+    -------
+    Dict[str, Decimal]
+        sorted by currency
+    """
+    names, codes = currency_codes(x.currency for x in mutations)
+    sums = AmountArray.from_mutations(mutations).grouped_sums(codes, len(names))
+    decimals = AmountArray(sums).decimals()
+    return dict(sorted(zip(names, decimals)))
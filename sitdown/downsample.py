@@ -0,0 +1,245 @@
+"""Reducing the number of points to plot to what can actually be seen
+
+A decade of per-mutation balances has far more points than an axes has pixels.
+Plotting all of them is slow and makes the figure unreadable. The functions here
+select a subset of points that looks the same at the available resolution.
+"""
+from collections import OrderedDict
+
+from sitdown.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+METHODS = ("minmax", "lttb")
+
+
+def pixel_width(ax):
+    """Width of the given axes in pixels
+
+    Parameters
+    ----------
+    ax: matplotlib.Axes
+
+    Returns
+    -------
+    int
+    """
+    return max(int(ax.get_window_extent().width), 1)
+
+
+def _as_float(x):
+    """Numeric version of x. Dates are converted to days since epoch"""
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[D]').astype(np.int64).astype(float)
+    if x.dtype == object:  # datetime.date objects
+        return np.array(x, dtype='datetime64[D]').astype(np.int64).astype(float)
+    return x.astype(float)
+
+
+def minmax_indices(y, n_bins):
+    """Indices of the minimum and maximum value in each of n_bins equal bins.
+
+    Keeps all peaks and troughs, so the envelope of the plotted line stays the same
+
+    Parameters
+    ----------
+    y: array-like
+    n_bins: int
+
+    Returns
+    -------
+    numpy.ndarray
+        sorted indices into y, at most 2 * n_bins
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n <= 2 * n_bins:
+        return np.arange(n)
+    edges = np.linspace(0, n, n_bins + 1).astype(np.int64)
+    bins = np.repeat(np.arange(n_bins), np.diff(edges))
+    # within each bin, sort by value. First is min, last is max
+    order = np.lexsort((y, bins))
+    selected = np.concatenate([order[edges[:-1]], order[edges[1:] - 1]])
+    return np.unique(selected)
+
+
+def lttb_indices(x, y, n_out):
+    """Indices selected by the Largest-Triangle-Three-Buckets algorithm
+
+    Keeps the visual shape of a line better than min/max for smooth data.
+    See Steinarsson, 'Downsampling time series for visual representation' (2013)
+
+    Parameters
+    ----------
+    x: array-like
+        x values, sorted ascending. May be dates
+    y: array-like
+    n_out: int
+        number of points to select
+
+    Returns
+    -------
+    numpy.ndarray
+        sorted indices into x and y, n_out long
+    """
+    x = _as_float(x)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # first and last points are always kept. The rest is divided in n_out - 2 buckets
+    edges = (np.arange(n_out - 1) * ((n - 2) / (n_out - 2))).astype(np.int64) + 1
+    edges[-1] = n - 1
+
+    indices = np.zeros(n_out, dtype=np.int64)
+    indices[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) -
+                      (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+
+
+def downsample(x, y, n_out, method="minmax"):
+    """Select at most n_out points of x, y to plot
+
+    Parameters
+    ----------
+    x: array-like
+    y: array-like
+    n_out: int
+        maximum number of points in the output
+    method: str, optional
+        One of METHODS. Defaults to 'minmax'
+
+    Returns
+    -------
+    Tuple[numpy.ndarray, numpy.ndarray]
+        x, y
+
+    Raises
+    ------
+    ValueError
+        When method is not one of METHODS
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if method == "minmax":
+        indices = minmax_indices(y, max(n_out // 2, 1))
+    elif method == "lttb":
+        indices = lttb_indices(x, y, n_out)
+    else:
+        raise ValueError(f"Unknown method '{method}'. Options are {METHODS}")
+    return x[indices], y[indices]
+
+
+def bucket_edges(n, n_buckets):
+    """Start index of each of n_buckets consecutive buckets over n items
+
+    Returns
+    -------
+    numpy.ndarray
+        int64 array of length min(n, n_buckets)
+    """
+    return np.unique(np.linspace(0, n, min(n, n_buckets) + 1).astype(np.int64)[:-1])
+
+
+def thinned_ticks(n, max_ticks):
+    """Indices of at most max_ticks evenly spaced ticks out of n
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+    step = max(int(np.ceil(n / max(max_ticks, 1))), 1)
+    return np.arange(0, n, step)
+
+
+class PlotCache:
+    """Small least-recently-used cache for prepared plot arrays"""
+
+    def __init__(self, max_size=16):
+        """
+
+        Parameters
+        ----------
+        max_size: int, optional
+            Keep at most this many entries. Defaults to 16
+        """
+        self.max_size = max_size
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, compute):
+        """Cached value for key, computing and storing it if not present
+
+        Parameters
+        ----------
+        key: Hashable
+        compute: Callable[[], Any]
+            Called without arguments when key is not cached
+
+        Returns
+        -------
+        Any
+        """
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        value = compute()
+        self.entries[key] = value
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return value
+
+
+class DownsampledLine:
+    """A line in a matplotlib axes that only holds as many points as the axes is
+    wide. Points are selected again when the figure is resized. Selections per
+    width are cached, so redrawing at a known size does not recompute
+    """
+
+    def __init__(self, ax, x, y, method="minmax", **kwargs):
+        """
+
+        Parameters
+        ----------
+        ax: matplotlib.Axes
+            plot into this axes
+        x: array-like
+        y: array-like
+        method: str, optional
+            One of METHODS. Defaults to 'minmax'
+        kwargs:
+            passed to ax.plot()
+        """
+        self.ax = ax
+        self.x = np.asarray(x)
+        self.y = np.asarray(y)
+        self.method = method
+        self.cache = PlotCache()
+        self.line, = ax.plot(*self.prepared(), **kwargs)
+        # matplotlib keeps only weak references to bound methods. A closure is
+        # kept, and with it this line, as long as the canvas exists
+        self.cid = ax.figure.canvas.mpl_connect(
+            'resize_event', lambda event: self.update(event))
+
+    def prepared(self):
+        """x, y to plot at the current width of the axes"""
+        width = pixel_width(self.ax)
+        return self.cache.get(
+            width, lambda: downsample(self.x, self.y, width, self.method))
+
+    def update(self, event=None):
+        """Select points again for the current width of the axes"""
+        self.line.set_data(*self.prepared())
@@ -2,7 +2,9 @@ import abc
 from abc import abstractmethod
 from typing import List
 
-from sitdown.core import MutationSet
+from sitdown.aggregation import to_minor_units
+from sitdown.core import BankAccount, MutationSet
+from sitdown.profiling import stage
 
 
 class Filter(metaclass=abc.ABCMeta):
@@ -10,6 +12,9 @@ class Filter(metaclass=abc.ABCMeta):
 
     """
 
+    # Mutation attributes that this filter reads. Used for query planning
+    fields = ()
+
     def __init__(self, parent=None, description="filter"):
         """
 
@@ -33,9 +38,88 @@ class Filter(metaclass=abc.ABCMeta):
             result of applying this filter and its parents to the given mutations
 
         """
+        if hasattr(mutations, "select"):  # a MutationStore, filters in the database
+            return mutations.select(self)
         if self.parent:
             mutations = self.parent.apply(mutations)
-        return self._filter(mutations)
+        with stage(f"{type(self).__name__} '{self.description}'",
+                   rows=len(mutations)):
+            return self._filter(mutations)
+
+    def chain(self):
+        """This filter and all its parents, outermost parent first
+
+        Returns
+        -------
+        List[Filter]
+        """
+        if self.parent:
+            return self.parent.chain() + [self]
+        else:
+            return [self]
+
+    def chain_fields(self):
+        """All mutation attributes read by this filter and its parents
+
+        Returns
+        -------
+        Set[str]
+        """
+        return {field for fltr in self.chain() for field in fltr.fields}
+
+    def to_sql(self):
+        """This filter as an SQL condition on the mutations table of a
+        MutationStore. Parents are not taken into account. Child classes should
+        override this if they can be expressed in SQL
+
+        Returns
+        -------
+        Tuple[str, Tuple] or None
+            condition and its parameters, or None if this filter can only be
+            checked in python
+        """
+        return None
+
+    def chain_to_sql(self):
+        """This filter and all its parents as a single SQL condition
+
+        Returns
+        -------
+        Tuple[str, Tuple] or None
+            None if any filter in the chain can not be expressed in SQL
+        """
+        conditions = [fltr.to_sql() for fltr in self.chain()]
+        if any(x is None for x in conditions):
+            return None
+        return (" AND ".join(f"({sql})" for sql, _ in conditions),
+                tuple(param for _, params in conditions for param in params))
+
+    def matches(self, mutation):
+        """Does this single mutation pass this filter? Parents are not taken into
+        account. Child classes should override this with a cheaper check
+
+        Parameters
+        ----------
+        mutation: Mutation
+
+        Returns
+        -------
+        bool
+        """
+        return bool(self._filter({mutation}))
+
+    def matches_chain(self, mutation):
+        """Does this single mutation pass this filter and all its parents?
+
+        Parameters
+        ----------
+        mutation: Mutation
+
+        Returns
+        -------
+        bool
+        """
+        return all(fltr.matches(mutation) for fltr in self.chain())
 
     def get_filtered_data(self, mutations_in):
         """Apply this filter to these mutations and return as MutationSet.
@@ -72,6 +156,8 @@ class StringFilter(Filter):
 
     """
 
+    fields = ("description",)
+
     def __init__(self, string_to_match, description=None, **kwargs):
         """
 
@@ -95,6 +181,13 @@ class StringFilter(Filter):
         filtered = {x for x in mutations if self.string_to_match.lower() in x.description.lower()}
         return filtered
 
+    def matches(self, mutation):
+        return self.string_to_match.lower() in mutation.description.lower()
+
+    def to_sql(self):
+        # sqlite lower() only handles ascii. The store registers python's
+        return "instr(py_lower(description), ?) > 0", (self.string_to_match.lower(),)
+
 
 class CatchAllFilter(Filter):
     """A filter that matches everything. Useful at the end of a FilterSet to model the 'rest' category
@@ -120,12 +213,20 @@ class CatchAllFilter(Filter):
     def _filter(self, mutations):
         return mutations
 
+    def matches(self, mutation):
+        return True
+
+    def to_sql(self):
+        return "1", ()
+
 
 class AccountFilter(Filter):
     """A filter that matches only the given account to and from
 
     """
 
+    fields = ("account", "opposite_account")
+
     def __init__(self, from_account=None, to_account=None, description=None, **kwargs):
         """
 
@@ -168,12 +269,36 @@ class AccountFilter(Filter):
             filtered = {x for x in filtered if x.opposite_account == self.to_account}
         return filtered
 
+    def matches(self, mutation):
+        if self.from_account and not mutation.account == self.from_account:
+            return False
+        if self.to_account and not mutation.opposite_account == self.to_account:
+            return False
+        return True
+
+    def to_sql(self):
+        conditions, params = ["1"], []
+        if self.from_account:
+            conditions.append("account_id IN (SELECT id FROM accounts "
+                              "WHERE number = ? AND description = ?)")
+            params += [self.from_account.number, self.from_account.description]
+        if isinstance(self.to_account, BankAccount):
+            conditions.append("opposite_account_id IN (SELECT id FROM accounts "
+                              "WHERE number = ? AND description = ?)")
+            params += [self.to_account.number, self.to_account.description]
+        elif self.to_account:
+            conditions.append("opposite_account = ?")
+            params.append(self.to_account)
+        return " AND ".join(conditions), tuple(params)
+
 
 class AmountFilter(Filter):
     """A filter that matches a range of amounts
 
     """
 
+    fields = ("amount",)
+
     def __init__(
         self,
         from_amount=None,
@@ -222,6 +347,70 @@ class AmountFilter(Filter):
             filtered = {x for x in filtered if x.amount < self.to_amount}
         return filtered
 
+    def matches(self, mutation):
+        if self.from_amount is not None and not mutation.amount >= self.from_amount:
+            return False
+        if self.to_amount is not None and not mutation.amount < self.to_amount:
+            return False
+        return True
+
+    def to_sql(self):
+        # amounts are stored in minor units
+        conditions, params = ["1"], []
+        if self.from_amount is not None:
+            conditions.append("amount >= ?")
+            params.append(to_minor_units(self.from_amount))
+        if self.to_amount is not None:
+            conditions.append("amount < ?")
+            params.append(to_minor_units(self.to_amount))
+        return " AND ".join(conditions), tuple(params)
+
+
+class CategoryFilter(Filter):
+    """A filter that matches mutations in a category, or in any of its
+    subcategories. Or, with exclude, all mutations that are not
+
+    """
+
+    fields = ("categories",)
+
+    def __init__(self, category, exclude=False, description=None, **kwargs):
+        """
+
+        Parameters
+        ----------
+        category: Category
+            Pass mutations with a category that is in this category
+        exclude: bool, optional
+            Pass only mutations that are not in category instead. Defaults to False
+        description: str, optional
+            description for this filter. Defaults to category name
+        """
+        super().__init__(**kwargs)
+        self.category = category
+        self.exclude = exclude
+        if not description:
+            description = f"not {category.name}" if exclude else category.name
+        self.description = description
+
+    def __str__(self):
+        return f"CategoryFilter '{self.description}'"
+
+    def _filter(self, mutations):
+        return {x for x in mutations if self.matches(x)}
+
+    def matches(self, mutation):
+        return any(x.is_in(self.category) for x in mutation.categories) != self.exclude
+
+    def to_sql(self):
+        # like Category.is_in(), categories are compared by name
+        return (("id NOT IN" if self.exclude else "id IN") +
+                " (SELECT mutation_id FROM mutation_categories WHERE category_id IN ("
+                "WITH RECURSIVE inside(id) AS (SELECT id FROM categories WHERE name = ? "
+                "UNION SELECT categories.id FROM categories JOIN inside "
+                "ON categories.parent_id = inside.id) SELECT id FROM inside))",
+                (self.category.name,))
+
 
 class FilterSet(Filter):
     """A collection of several Filters. Can be used as a regular filter but has extra
@@ -244,6 +433,23 @@ class FilterSet(Filter):
         super().__init__(**kwargs)
         self.filters = filters
 
+    @property
+    def fields(self):
+        return {field for fltr in self.filters for field in fltr.chain_fields()}
+
+    def matches(self, mutation):
+        """A mutation passes a filter set if it passes any of its filters"""
+        return any(fltr.matches_chain(mutation) for fltr in self.filters)
+
+    def to_sql(self):
+        conditions = [fltr.chain_to_sql() for fltr in self.filters]
+        if any(x is None for x in conditions):
+            return None
+        if not conditions:
+            return "0", ()
+        return (" OR ".join(f"({sql})" for sql, _ in conditions),
+                tuple(param for _, params in conditions for param in params))
+
     def _filter(self, mutations):
         """Apply each filter in this set
 
@@ -274,6 +480,8 @@ class FilterSet(Filter):
         List[MutationSet]:
             Filtered mutations for each filter
         """
+        if hasattr(mutations, "scan"):  # a MutationStore. Fetch the union only once
+            mutations = set(mutations.scan(filters=[self]))
         dfs = []
         data = mutations
         for fltr in self.filters:
@@ -0,0 +1 @@
+"""Qt user interface for looking through and annotating mutations. Needs PyQt5"""
@@ -0,0 +1,233 @@
+"""Main window of the annotation GUI and the table model behind it
+
+MutationsTableModel serves rows straight from MutationColumns. Qt only asks for the
+cells that are visible, so only those are formatted. Sorting uses one index
+permutation per column, computed on first use and kept. Searching uses a
+DescriptionSearch and gives a permutation of matching rows. Neither touches
+all rows in Python, so this stays interactive with millions of mutations:
+
+    model = MutationsTableModel(mutations)
+    window = MainAnotatorWindow()
+    window.set_model(model)
+    window.show()
+"""
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt
+from PyQt5.QtWidgets import QLabel, QLineEdit, QMainWindow, QTableView, QVBoxLayout, \
+    QWidget
+
+from sitdown.aggregation import from_minor_units
+from sitdown.columns import DescriptionSearch, MutationColumns
+from sitdown.lazy import lazy_import
+from sitdown.profiling import stage
+
+np = lazy_import("numpy")
+
+
+class MutationsTableModel(QAbstractTableModel):
+    """Read-only table of mutations, with fast sorting and description search"""
+
+    columns = ["date", "account", "amount", "description", "categories"]
+    column_numbers = {name: i for i, name in enumerate(columns)}
+
+    def __init__(self, mutations, parent=None):
+        """
+        Parameters
+        ----------
+        mutations: Iterable[Mutation] or MutationColumns
+            MutationColumns have no categories, the categories column is then
+            empty
+        parent: QObject, optional
+        """
+        super().__init__(parent)
+        if isinstance(mutations, MutationColumns):
+            self.mutations = None
+            self.data_columns = mutations
+        else:
+            self.mutations = list(mutations)
+            self.data_columns = MutationColumns.from_mutations(self.mutations)
+        self.search = DescriptionSearch(self.data_columns)
+        self._permutations = {}  # column: indices of all rows sorted on column
+        self.sort_column = None
+        self.sort_order = Qt.AscendingOrder
+        self.filter_text = ""
+        self.matching = None  # rows matching filter_text, None for all rows
+        self.rows = np.arange(len(self.data_columns))  # source row of each row
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.columns[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            return self.value(self.source_row(index.row()), self.columns[index.column()])
+        if role == Qt.TextAlignmentRole and index.column() == self.column_numbers["amount"]:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        return None
+
+    def source_row(self, row):
+        """Index in the underlying mutations of the given table row"""
+        return int(self.rows[row])
+
+    def mutation(self, row):
+        """Mutation shown in table row, None when made from MutationColumns"""
+        return self.mutations[self.source_row(row)] if self.mutations else None
+
+    def value(self, source_row, column):
+        """Display text for a single cell
+
+        Parameters
+        ----------
+        source_row: int
+            index in the underlying mutations
+        column: str
+            one of columns
+
+        Returns
+        -------
+        str
+        """
+        data = self.data_columns
+        if column == "date":
+            return str(data.dates[source_row])
+        if column == "account":
+            return data.accounts[data.account_codes[source_row]]
+        if column == "amount":
+            return f"{from_minor_units(data.amounts[source_row])} " \
+                   f"{data.currencies[data.currency_codes[source_row]]}"
+        if column == "description":
+            return data.description(source_row)
+        if self.mutations is None:
+            return ""
+        return ", ".join(sorted(x.name for x in self.mutations[source_row].categories))
+
+    def permutation(self, column):
+        """Indices of all rows sorted ascending on column. Computed once per column
+
+        Returns
+        -------
+        numpy.ndarray
+        """
+        if column not in self._permutations:
+            name = self.columns[column]
+            with stage("MutationsTableModel.permutation", rows=len(self.data_columns)):
+                data = self.data_columns
+                if name == "date":
+                    keys = data.dates
+                elif name == "account":
+                    ranks = np.argsort(np.argsort(data.accounts, kind="stable"))
+                    keys = ranks[data.account_codes] if len(ranks) else data.account_codes
+                elif name == "amount":
+                    keys = data.amounts
+                elif name == "description":  # lower case bytes, already in search
+                    text = self.search.text.tobytes()
+                    keys = [text[start:end] for start, end in
+                            zip(data.description_starts.tolist(),
+                                data.description_ends.tolist())]
+                else:
+                    keys = [self.value(i, name).lower() for i in range(len(data))]
+                if isinstance(keys, list):  # sorted() is faster on Python objects
+                    permutation = np.array(sorted(range(len(keys)), key=keys.__getitem__),
+                                           dtype=np.int64)
+                else:
+                    permutation = np.argsort(keys, kind="stable")
+                self._permutations[column] = permutation
+        return self._permutations[column]
+
+    def presort(self):
+        """Compute the sort permutation of every column in advance"""
+        for column in range(len(self.columns)):
+            self.permutation(column)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """Sort rows on column. A column of -1 restores the original order"""
+        self.layoutAboutToBeChanged.emit()
+        self.sort_column = column if column >= 0 else None
+        self.sort_order = order
+        self._update_rows()
+        self.layoutChanged.emit()
+
+    def set_filter(self, text):
+        """Only show mutations whose description contains text, ignoring case
+
+        Parameters
+        ----------
+        text: str
+            show all mutations when empty
+        """
+        self.beginResetModel()
+        self.filter_text = text
+        self.matching = self.search.find(text) if text else None
+        self._update_rows()
+        self.endResetModel()
+
+    def _update_rows(self):
+        if self.sort_column is None:
+            rows = np.arange(len(self.data_columns))
+        else:
+            rows = self.permutation(self.sort_column)
+            if self.sort_order == Qt.DescendingOrder:
+                rows = rows[::-1]
+        if self.matching is not None:
+            visible = np.zeros(len(self.data_columns), dtype=bool)
+            visible[self.matching] = True
+            rows = rows[visible[rows]]
+        self.rows = rows
+
+
+class MainAnotatorWindow(QMainWindow):
+    """Window with a search box above a table of mutations"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("sitdown")
+        self.searchEdit = QLineEdit()
+        self.searchEdit.setPlaceholderText("Search descriptions")
+        self.searchEdit.setClearButtonEnabled(True)
+        self.mutationsListView = QTableView()
+        self.mutationsListView.setSortingEnabled(True)
+        self.mutationsListView.setSelectionBehavior(QTableView.SelectRows)
+        self.mutationsListView.verticalHeader().hide()
+        self.mutationsListView.horizontalHeader().setStretchLastSection(True)
+        self.statusLabel = QLabel()
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.searchEdit)
+        layout.addWidget(self.mutationsListView)
+        layout.addWidget(self.statusLabel)
+        central = QWidget()
+        central.setLayout(layout)
+        self.setCentralWidget(central)
+        self.resize(1000, 700)
+
+        self.searchEdit.textChanged.connect(self.search)
+
+    def set_model(self, model):
+        """Show mutations from model
+
+        Parameters
+        ----------
+        model: MutationsTableModel
+        """
+        self.mutationsListView.setModel(model)
+        self.mutationsListView.sortByColumn(-1, Qt.AscendingOrder)
+        self.update_status()
+
+    def search(self, text):
+        model = self.mutationsListView.model()
+        if model is not None:
+            model.set_filter(text)
+            self.update_status()
+
+    def update_status(self):
+        model = self.mutationsListView.model()
+        self.statusLabel.setText(f"{model.rowCount()} of {len(model.data_columns)} "
+                                 f"mutations")
@@ -0,0 +1,54 @@
+"""Deferring imports of heavy dependencies until they are actually used
+
+matplotlib alone takes over half a second to import. Most of sitdown does not
+need it, or numpy, for most tasks. Modules bind these dependencies with
+lazy_import() instead of import, so that importing sitdown stays fast:
+
+    np = lazy_import("numpy")
+
+    def function():
+        return np.zeros(3)  # numpy is imported here, on first attribute access
+"""
+import importlib
+import sys
+
+
+class LazyModule:
+    """Stands in for a module. Imports the module on first attribute access"""
+
+    def __init__(self, name):
+        """
+
+        Parameters
+        ----------
+        name: str
+            full module name, like 'matplotlib.pyplot'
+        """
+        self.__dict__["_name"] = name
+
+    def __getattr__(self, attribute):
+        module = importlib.import_module(self._name)
+        # bind directly, so that later lookups do not pass through here
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attribute)
+
+    def __repr__(self):
+        return f"<lazy module '{self._name}'>"
+
+
+def lazy_import(name):
+    """Module name if already imported, otherwise a stand-in that imports it on
+    first use
+
+    Parameters
+    ----------
+    name: str
+        full module name, like 'numpy'
+
+    Returns
+    -------
+    module or LazyModule
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
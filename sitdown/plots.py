@@ -1,48 +1,174 @@
-""" Different ways of plotting mutations. Just some examples"""
+""" Different ways of plotting mutations. Just some examples
+
+Each plot is split in a prepare_ function that does all computation on mutations
+and returns plain arrays, and a draw_ function that only draws those arrays into
+a given axes. This way the batch renderer in sitdown.reports can compute once and
+draw in other processes.
+"""
 from datetime import datetime
 from typing import List
 
-import matplotlib.pyplot as plt
-
+from sitdown.balance import balance_series
 from sitdown.core import Mutation
+from sitdown.downsample import DownsampledLine, downsample as downsample_points
+from sitdown.lazy import lazy_import
 from sitdown.views import MonthSeries, MonthSet
 
+plt = lazy_import("matplotlib.pyplot")
+
+
+def prepare_balance(mutations: List[Mutation], width=None, downsample=None):
+    """End-of-day balance per account, ready for draw_balance()
+
+    Parameters
+    ----------
+    mutations: List[Mutation]
+        mutations on one or more accounts. Not modified
+    width: int, optional
+        Width of the target axes in pixels. Needed for downsample. Defaults to None
+    downsample: str, optional
+        'minmax' or 'lttb'. If given together with width, keep only as many
+        points as fit in width. Defaults to None, meaning keep all points
 
-def plot_balance(mutations: List[Mutation]):
-    """Plot balance over time. List of mutations should come from a single account"""
-    mutations.sort()
+    Returns
+    -------
+    List[Tuple[str, numpy.ndarray, numpy.ndarray]]
+        label, dates and balances for each account
+    """
+    prepared = [(str(account), series.dates, series.values())
+                for account, series in balance_series(mutations).items()]
+    return downsample_balance(prepared, width=width, downsample=downsample)
+
+
+def downsample_balance(prepared, width=None, downsample=None):
+    """Keep only as many points of each prepare_balance() line as fit in width
 
-    _, ax = plt.subplots(figsize=(12, 12))
-    ax.grid(b=True, which='both', color='0.65', linestyle='-')
-    ax.plot([x.date for x in mutations], [x.balance_after for x in mutations])
+    Parameters
+    ----------
+    prepared: List[Tuple[str, numpy.ndarray, numpy.ndarray]]
+        output of prepare_balance() without downsampling. Not modified
+    width: int, optional
+        Width of the target axes in pixels. Defaults to None, meaning keep all
+    downsample: str, optional
+        'minmax' or 'lttb'. Defaults to None, meaning keep all points
+
+    Returns
+    -------
+    List[Tuple[str, numpy.ndarray, numpy.ndarray]]
+    """
+    if not (downsample and width):
+        return prepared
+    return [(label, *downsample_points(dates, values, width, downsample))
+            for label, dates, values in prepared]
+
+
+def draw_balance(ax, prepared):
+    """Draw output of prepare_balance() into ax
+
+    Returns
+    -------
+    matplotlib.Axes
+    """
+    ax.grid(True, which='both', color='0.65', linestyle='-')
+    for label, dates, values in prepared:
+        ax.plot(dates, values, label=label)
+    ax.legend()
     return ax
 
 
-def in_out(mutations: List[Mutation]):
-    """Plot incoming / outgoing total per month for given mutations
+def plot_balance(mutations: List[Mutation], ax=None, downsample=None):
+    """Plot end-of-day balance over time, one line per account
 
-    Call plt.show() to actually render this plot
+    Parameters
+    ----------
+    mutations: List[Mutation]
+        mutations on one or more accounts. Not modified
+    ax: matplotlib.Axes, optional
+        plot into this axes. Defaults to None, in which case a new axes will be
+        created for this plot
+    downsample: str, optional
+        'minmax' or 'lttb'. If given, plot only as many points per account as the
+        axes is wide, selected with this method. Points are selected again when
+        the figure is resized. Defaults to None, meaning plot all points
+
+    Returns
+    -------
+    matplotlib.Axes
     """
-    ax = None
     if not ax:
         _, ax = plt.subplots(figsize=(12, 12))
+    if not downsample:
+        return draw_balance(ax, prepare_balance(mutations))
 
-    incoming = MonthSeries([x for x in mutations if x.amount > 0])
-    outgoing = MonthSeries([x for x in mutations if x.amount <= 0])
+    ax.grid(True, which='both', color='0.65', linestyle='-')
+    for label, dates, values in prepare_balance(mutations):
+        DownsampledLine(ax, dates, values, method=downsample, label=label)
+    ax.legend()
+    return ax
 
-    all = MonthSet(mutations)
 
-    plt.xticks(rotation=70)
-    incoming.plot(ax)
-    outgoing.plot(ax)
-    all.plot(ax)
+def prepare_in_out(mutations: List[Mutation], width=None):
+    """Incoming, outgoing and total per month, ready for draw_in_out()
 
-    diff_text = [f"{x.date} - {x.sum():.1f}" for x in all.bins()]
-    print("\n".join(diff_text))
+    Parameters
+    ----------
+    mutations: List[Mutation]
+    width: int, optional
+        Width of the target axes in pixels. If given, downsample months to fit.
+        Defaults to None
 
-    diff_text = [f"{x.date} - {x.sum():.1f}" for x in all.bins()]
+    Returns
+    -------
+    List[Tuple[str, Tuple]]
+        description and MonthSet.prepare_plot() output for incoming, outgoing
+        and all mutations
+    """
+    return [(x.description, x.prepare_plot(width)) for x in in_out_series(mutations)]
+
+
+def in_out_series(mutations: List[Mutation]):
+    """Incoming, outgoing and all mutations binned per month
+
+    Returns
+    -------
+    Tuple[MonthSeries, MonthSeries, MonthSet]
+        described 'in', 'out' and 'total'
+    """
+    incoming = MonthSeries([x for x in mutations if x.amount > 0],
+                           description="in")
+    outgoing = MonthSeries([x for x in mutations if x.amount <= 0],
+                           description="out")
+    return incoming, outgoing, MonthSet(mutations, description="total")
+
+
+def draw_in_out(ax, prepared):
+    """Draw output of prepare_in_out() into ax
+
+    Returns
+    -------
+    matplotlib.Axes
+    """
+    for description, bars in prepared:
+        MonthSet.draw(ax, bars, description)
+    ax.tick_params(axis="x", labelrotation=70)
+    ax.set_ylabel("amount (Euro)")
+    ax.grid(True, which="both", color="0.65", linestyle="-")
+    return ax
+
+
+def in_out(mutations: List[Mutation], ax=None):
+    """Plot incoming / outgoing total per month for given mutations
+
+    Call plt.show() to actually render this plot
+
+    Returns
+    -------
+    matplotlib.Axes
+    """
+    if not ax:
+        _, ax = plt.subplots(figsize=(12, 12))
 
-    ax.grid(b=True, which="both", color="0.65", linestyle="-")
+    draw_in_out(ax, prepare_in_out(mutations))
     ax.set_ylim([-6000, 6000])
 
     return ax
@@ -0,0 +1,265 @@
+"""Opt-in timing of pipeline stages
+
+Reading, classifying, filtering and binning mutations are instrumented as stages.
+Outside a Profiler nothing is recorded and the cost of a stage is a single check.
+Inside a Profiler, wall time, number of rows and peak memory are recorded for each
+stage, nested stages under the stage that called them:
+
+    with Profiler() as profiler:
+        mutations = ABNAMROReader().read(path)
+        MonthSet(mutations)
+    print(profiler.format_report())
+
+Only the thread that entered the profiler should run stages while it is active.
+Stages that run in other processes are not recorded.
+"""
+import functools
+import time
+import tracemalloc
+
+_active = None  # the Profiler currently recording, if any
+
+
+class StageStats:
+    """Totals for all calls of one stage at one place in the stage tree"""
+
+    def __init__(self, name, path):
+        """
+
+        Parameters
+        ----------
+        name: str
+            name of the stage, like 'ABNAMROReader.read'
+        path: Tuple[str]
+            names of all enclosing stages, outermost first, ending with name
+        """
+        self.name = name
+        self.path = path
+        self.calls = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.peak_memory = 0
+
+    @property
+    def depth(self):
+        return len(self.path) - 1
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else None
+
+    def as_dict(self):
+        return {"name": self.name, "path": list(self.path), "calls": self.calls,
+                "seconds": self.seconds, "rows": self.rows,
+                "peak_memory": self.peak_memory}
+
+    def __str__(self):
+        return (f"{self.name}: {self.calls} call(s), {self.seconds:.4f}s, "
+                f"{self.rows} rows")
+
+
+class Stage:
+    """A single running stage. Set rows while running to record the number of
+    rows handled"""
+
+    def __init__(self, profiler, name, rows=0):
+        self.profiler = profiler
+        self.name = name
+        self.rows = rows
+        self.peak_memory = 0  # highest seen by this stage and its children
+        self.start = None
+
+    def __enter__(self):
+        self.profiler._enter(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        self.profiler._exit(self, seconds)
+        return False
+
+
+class _NoStage:
+    """Stands in for Stage when not profiling. Does nothing"""
+
+    rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+NO_STAGE = _NoStage()
+
+
+class Profiler:
+    """Records stage statistics while active. Use as a context manager"""
+
+    def __init__(self, memory=True):
+        """
+
+        Parameters
+        ----------
+        memory: bool, optional
+            Also record peak memory per stage with tracemalloc. This slows down
+            everything considerably. Defaults to True
+        """
+        self.memory = memory
+        self.stats = {}  # path: StageStats, in order of first call
+        self._stack = []
+        self._previous = None
+        self._started_tracemalloc = False
+        self.seconds = 0.0
+        self._start = None
+
+    def __enter__(self):
+        global _active
+        self._previous = _active
+        _active = self
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        global _active
+        self.seconds += time.perf_counter() - self._start
+        _active = self._previous
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        return False
+
+    def _peak(self):
+        """Peak traced memory since last reset, then reset"""
+        if not self.memory:
+            return 0
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        return peak
+
+    def _enter(self, stage):
+        # the peak so far belongs to the enclosing stage
+        peak = self._peak()
+        if self._stack:
+            parent = self._stack[-1]
+            parent.peak_memory = max(parent.peak_memory, peak)
+        self._stack.append(stage)
+
+    def _exit(self, stage, seconds):
+        stage.peak_memory = max(stage.peak_memory, self._peak())
+        path = tuple(x.name for x in self._stack)
+        self._stack.pop()
+        if self._stack:
+            parent = self._stack[-1]
+            parent.peak_memory = max(parent.peak_memory, stage.peak_memory)
+
+        stats = self.stats.get(path)
+        if stats is None:
+            stats = self.stats[path] = StageStats(name=stage.name, path=path)
+        stats.calls += 1
+        stats.seconds += seconds
+        stats.rows += stage.rows
+        stats.peak_memory = max(stats.peak_memory, stage.peak_memory)
+
+    def report(self):
+        """Statistics for all recorded stages, each directly followed by the stages
+        it called
+
+        Returns
+        -------
+        List[StageStats]
+        """
+        children = {}
+        for path in self.stats:
+            children.setdefault(path[:-1], []).append(path)
+
+        ordered = []
+
+        def add(parent):
+            for path in children.get(parent, []):
+                ordered.append(self.stats[path])
+                add(path)
+        add(())
+        return ordered
+
+    def as_dict(self):
+        """Report as plain types, for storing as JSON"""
+        return {"seconds": self.seconds,
+                "stages": [x.as_dict() for x in self.report()]}
+
+    def format_report(self):
+        """Report as a text table, nested stages indented
+
+        Returns
+        -------
+        str
+        """
+        lines = [f"{'stage':<50}{'calls':>8}{'seconds':>10}{'rows':>10}"
+                 f"{'rows/s':>12}{'peak MB':>10}"]
+        for stats in self.report():
+            name = "  " * stats.depth + stats.name
+            rate = stats.rows_per_second
+            lines.append(f"{name[:50]:<50}{stats.calls:>8}{stats.seconds:>10.4f}"
+                         f"{stats.rows:>10}{rate or 0:>12.0f}"
+                         f"{stats.peak_memory / 2 ** 20:>10.1f}")
+        lines.append(f"total {self.seconds:.4f}s")
+        return "\n".join(lines)
+
+
+def is_profiling():
+    """Is a Profiler recording right now?"""
+    return _active is not None
+
+
+def stage(name, rows=0):
+    """Context manager that records the enclosed block as a stage, if profiling
+
+    Parameters
+    ----------
+    name: str
+    rows: int, optional
+        number of rows handled. Can also be set on the returned stage later
+
+    Returns
+    -------
+    Stage
+    """
+    if _active is None:
+        return NO_STAGE
+    return Stage(_active, name, rows)
+
+
+def profiled(name=None, rows=None):
+    """Decorator that records each call of a function as a stage
+
+    Parameters
+    ----------
+    name: str, optional
+        stage name. Defaults to the qualified name of the function
+    rows: Callable, optional
+        called with the result of the function to get the number of rows.
+        Defaults to None, meaning rows are not counted
+    """
+    def decorate(function):
+        stage_name = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return function(*args, **kwargs)
+            with Stage(_active, stage_name) as running:
+                result = function(*args, **kwargs)
+                if rows is not None:
+                    running.rows = rows(result)
+            return result
+        wrapper.__wrapped_stage__ = stage_name
+        return wrapper
+    return decorate
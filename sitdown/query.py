@@ -0,0 +1,447 @@
+"""Lazy, chainable queries over mutations
+
+Composing filters by hand materialises a new set at every level of a filter chain.
+A Query only records what should happen. All steps are executed in a single pass
+over the mutations when a result is requested:
+
+    >>> Query(mutations).where(StringFilter("albert heijn"))\
+    ...     .where(AmountFilter(to_amount=0))\
+    ...     .group_by_month().sum()
+    OrderedDict([(Month(2019/1), Decimal('-123.45')), ...])
+
+Predicates from all where() calls, including the parents of each filter, are
+fused into one check per mutation. Aggregations only read the mutation fields they
+need. Stores that implement scan(fields) are asked for just those fields. Stores
+that can filter themselves, like MutationStore, are handed the leading filters of
+the query and compute monthly aggregates themselves where they can.
+"""
+import datetime
+
+from collections import OrderedDict
+from operator import attrgetter
+
+from sitdown.aggregation import AmountArray
+from sitdown.core import MutationSet
+from sitdown.currency import check_single_currency, in_one_currency, normalize_currency
+from sitdown.filters import Filter
+from sitdown.lazy import lazy_import
+from sitdown.profiling import NO_STAGE, stage
+from sitdown.views import Month, MonthSet
+
+np = lazy_import("numpy")
+
+
+class Predicate:
+    """A single check on a mutation inside a query plan"""
+
+    def __init__(self, function, fields=None, description="predicate", source=None):
+        """
+
+        Parameters
+        ----------
+        function: Callable[[Mutation], bool]
+            Returns True if the mutation passes
+        fields: Iterable[str], optional
+            Mutation attributes read by function. Defaults to None, meaning
+            unknown. The query will then not project mutations
+        description: str, optional
+            Human readable description. Defaults to 'predicate'
+        source: Filter, optional
+            The filter this predicate was made from, if any. Defaults to None
+        """
+        self.function = function
+        self.fields = None if fields is None else set(fields)
+        self.description = description
+        self.source = source
+
+    @classmethod
+    def from_filter(cls, fltr):
+        """Predicate for a single filter, not taking its parents into account
+
+        Parameters
+        ----------
+        fltr: Filter
+
+        Returns
+        -------
+        Predicate
+        """
+        return cls(function=fltr.matches, fields=fltr.fields,
+                   description=str(fltr), source=fltr)
+
+    def __str__(self):
+        return self.description
+
+
+class Classification:
+    """Assign categories to each mutation passing through a query plan"""
+
+    # Classification reads descriptions and writes categories. Needs full mutations
+    fields = None
+
+    def __init__(self, classifier):
+        """
+
+        Parameters
+        ----------
+        classifier: Classifier
+        """
+        self.classifier = classifier
+
+    def __call__(self, mutation):
+        mutation.categories = mutation.categories | \
+            self.classifier.classify(mutation)
+        return True
+
+    def __str__(self):
+        return f"Classify with {type(self.classifier).__name__}"
+
+
+class Query:
+    """Lazy query over mutations. Each method returns a new Query, the original
+    is not changed. Nothing is executed until mutations(), count(), sum() or a
+    grouped aggregate is called
+
+    Like views, sums refuse to add amounts in different currencies unless rates
+    are given to convert them
+    """
+
+    def __init__(self, store, steps=(), rates=None):
+        """
+
+        Parameters
+        ----------
+        store: Iterable[Mutation] or MutationSet
+            Mutations to query. If this has a scan(fields) method, aggregations
+            will call that with only the fields they need
+        steps: Tuple[Predicate or Classification], optional
+            Plan steps so far. Defaults to empty
+        rates: RateTable, optional
+            Convert amounts with these rates before summing. Defaults to None, in
+            which case sums need all mutations to be in the same currency
+        """
+        if isinstance(store, MutationSet):
+            store = store.mutations
+        self.store = store
+        self.steps = tuple(steps)
+        self.rates = rates
+
+    def __str__(self):
+        return "Query: " + " -> ".join(str(x) for x in self.steps)
+
+    def _extend(self, *steps):
+        return Query(store=self.store, steps=self.steps + steps, rates=self.rates)
+
+    def where(self, condition):
+        """Only keep mutations that pass condition
+
+        Parameters
+        ----------
+        condition: Filter or Callable[[Mutation], bool]
+            When Filter, the filter and all its parents need to pass.
+
+        Returns
+        -------
+        Query
+        """
+        if isinstance(condition, Filter):
+            present = {id(x.source) for x in self.steps
+                       if isinstance(x, Predicate) and x.source is not None}
+            # filters shared between chains, like a common parent, are checked once
+            new = [Predicate.from_filter(x) for x in condition.chain()
+                   if id(x) not in present]
+            return self._extend(*new)
+        return self._extend(Predicate(condition))
+
+    def classify(self, classifier):
+        """Add categories to each mutation passing the query up to this point
+
+        Parameters
+        ----------
+        classifier: Classifier
+
+        Returns
+        -------
+        Query
+        """
+        return self._extend(Classification(classifier))
+
+    def group_by_month(self):
+        """Group results per month. Aggregate with methods of the returned object
+
+        Returns
+        -------
+        MonthGroupedQuery
+        """
+        return MonthGroupedQuery(self)
+
+    def fields(self):
+        """All mutation attributes read by this query, or None if unknown
+
+        Returns
+        -------
+        Set[str] or None
+        """
+        fields = set()
+        for step in self.steps:
+            if step.fields is None:
+                return None
+            fields |= step.fields
+        return fields
+
+    def _pushed_filters(self):
+        """Filters at the start of the plan that the store can apply itself, like
+        a MutationStore does in SQL
+
+        Returns
+        -------
+        List[Filter]
+        """
+        if not hasattr(self.store, 'select'):
+            return []
+        filters = []
+        for step in self.steps:
+            if not isinstance(step, Predicate) or step.source is None:
+                break
+            filters.append(step.source)
+        return filters
+
+    def _scan(self, fields=None, filters=()):
+        """Iterate over store, projecting to fields if store supports that"""
+        if filters:
+            return self.store.scan(fields, filters)
+        if fields is not None and hasattr(self.store, 'scan'):
+            return self.store.scan(fields)
+        return self.store
+
+    def _execute(self, extra_fields=None):
+        """Run all steps in a single pass.
+
+        Parameters
+        ----------
+        extra_fields: Iterable[str], optional
+            Fields needed after the plan has run. Defaults to None, meaning full
+            mutations are needed
+
+        Returns
+        -------
+        Iterator[Mutation]
+            mutations, or rows with at least the requested fields
+        """
+        fields = self.fields()
+        if fields is not None and extra_fields is not None:
+            fields |= set(extra_fields)
+        else:
+            fields = None
+
+        pushed = self._pushed_filters()
+        checks = [x.function if isinstance(x, Predicate) else x
+                  for x in self.steps[len(pushed):]]
+        # classification is fused with the other steps. The whole pass is one
+        # stage, timing each classify() call would cost more than classifying
+        classifications = [str(x) for x in checks if isinstance(x, Classification)]
+        with stage(", ".join(classifications)) if classifications else NO_STAGE \
+                as running:
+            for mutation in self._scan(fields, pushed):
+                running.rows += 1
+                for check in checks:
+                    if not check(mutation):
+                        break
+                else:
+                    yield mutation
+
+    def mutations(self):
+        """Execute query
+
+        Returns
+        -------
+        Set[Mutation]
+        """
+        return set(self._execute())
+
+    def mutation_set(self, description="Query result"):
+        """Execute query and return result as MutationSet
+
+        Returns
+        -------
+        MutationSet
+        """
+        return MutationSet(mutations=self.mutations(), description=description)
+
+    def count(self):
+        """Number of mutations in query result"""
+        return sum(1 for _ in self._execute(extra_fields=()))
+
+    def currencies(self):
+        """Distinct normalized currencies in query result
+
+        Returns
+        -------
+        List[str]
+            sorted
+        """
+        pushed = self._pushed_filters()
+        if hasattr(self.store, "currencies") and len(pushed) == len(self.steps) \
+                and self.store.translates(pushed):
+            return self.store.currencies(pushed)
+        return sorted({normalize_currency(x.currency)
+                       for x in self._execute(extra_fields=("currency",))})
+
+    def in_currency(self, currency):
+        """Only keep mutations in currency
+
+        Parameters
+        ----------
+        currency: str
+            like 'EUR'. Aliases like 'EURO' are the same currency
+
+        Returns
+        -------
+        Query
+        """
+        currency = normalize_currency(currency)
+        return self._extend(Predicate(
+            lambda x: normalize_currency(x.currency) == currency, fields=("currency",),
+            description=f"In {currency}"))
+
+    def _rows(self):
+        """Date, amount and currency of each mutation in query result
+
+        Returns
+        -------
+        Tuple[Tuple[datetime.date], AmountArray, Tuple[str]]
+        """
+        get = attrgetter("date", "amount", "currency")
+        rows = [get(x) for x in self._execute(
+            extra_fields=("date", "amount", "currency"))]
+        if not rows:
+            return (), AmountArray([]), ()
+        dates, amounts, currencies = zip(*rows)
+        amounts = in_one_currency(AmountArray.from_amounts(amounts), currencies, dates,
+                                  self.rates)
+        return dates, amounts, currencies
+
+    def sum(self):
+        """Exact sum of amounts in query result
+
+        Returns
+        -------
+        Decimal
+
+        Raises
+        ------
+        CurrencyError
+            if there are several currencies and no rates to convert them
+        """
+        return self._rows()[1].sum()
+
+
+class MonthGroupedQuery:
+    """Query result grouped per month. Only aggregates are computed, MonthBins are
+    not created unless month_set() is called"""
+
+    def __init__(self, query):
+        """
+
+        Parameters
+        ----------
+        query: Query
+            query to group
+        """
+        self.query = query
+
+    def _aggregate(self, sign=None):
+        """Sum amounts per month in one vectorized pass, or in the store if it can
+
+        Parameters
+        ----------
+        sign: int, optional
+            1 to only sum incoming amounts, -1 for only outgoing. Defaults to
+            None, meaning all amounts
+
+        Returns
+        -------
+        Tuple[List[Month], numpy.ndarray, numpy.ndarray]
+            Sorted months, exact sums in minor units per month, counts per month
+
+        Raises
+        ------
+        CurrencyError
+            if there are several currencies and no rates to convert them
+        """
+        query, store = self.query, self.query.store
+        pushed = query._pushed_filters()
+        if hasattr(store, "month_totals") and len(pushed) == len(query.steps) \
+                and store.translates(pushed):
+            currencies = store.currencies(pushed)
+            check_single_currency(currencies, query.rates)
+            if query.rates is None or currencies in ([], [query.rates.base]):
+                dates, sums, counts = store.month_totals(pushed, sign=sign)
+                return [Month(x) for x in dates], sums, counts
+
+        dates, amounts, _ = query._rows()
+        if not dates:
+            return [], np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        keys = np.fromiter((x.year * 12 + x.month - 1 for x in dates),
+                           dtype=np.int64, count=len(dates))
+        unique, groups = np.unique(keys, return_inverse=True)
+        mask = None if sign is None else np.sign(amounts.minor_units) == sign
+        sums = amounts.grouped_sums(groups, len(unique), where=mask)
+        counts = np.bincount(groups, minlength=len(unique))
+        months = [Month(datetime.date(year=x // 12, month=x % 12 + 1, day=1))
+                  for x in unique]
+        return months, sums, counts
+
+    def _to_dict(self, months, values):
+        return OrderedDict(zip(months, values))
+
+    def sum(self):
+        """Exact sum of amounts per month
+
+        Returns
+        -------
+        OrderedDict[Month, Decimal]
+            Sorted by month. Only months with mutations are included
+        """
+        months, sums, _ = self._aggregate()
+        return self._to_dict(months, AmountArray(sums).decimals())
+
+    def sum_in(self):
+        """Exact sum of incoming amounts per month
+
+        Returns
+        -------
+        OrderedDict[Month, Decimal]
+        """
+        months, sums, _ = self._aggregate(sign=1)
+        return self._to_dict(months, AmountArray(sums).decimals())
+
+    def sum_out(self):
+        """Exact sum of outgoing amounts per month
+
+        Returns
+        -------
+        OrderedDict[Month, Decimal]
+        """
+        months, sums, _ = self._aggregate(sign=-1)
+        return self._to_dict(months, AmountArray(sums).decimals())
+
+    def count(self):
+        """Number of mutations per month
+
+        Returns
+        -------
+        OrderedDict[Month, int]
+        """
+        months, _, counts = self._aggregate()
+        return self._to_dict(months, [int(x) for x in counts])
+
+    def month_set(self, description="Query result"):
+        """Execute query and bin full mutations per month
+
+        Returns
+        -------
+        MonthSet
+        """
+        return MonthSet(mutations=list(self.query._execute()),
+                        description=description)
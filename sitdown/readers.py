@@ -1,35 +1,56 @@
 """Reading in financial mutations
+
+Each supported export format has a Reader. Readers recognise their own format
+from the first few KB of a file and parse a binary stream into a stream of
+Mutation objects. Registered readers are picked automatically by read_file():
+
+    mutations = read_file('export.csv')          # any registered format
+    per_file = read_files(paths, processes=4)    # mixed formats, in parallel
 """
+import abc
+import csv
+import io
+import mmap
+import os
 import re
-from csv import DictReader
+from abc import abstractmethod
 from datetime import datetime
-from locale import setlocale, LC_NUMERIC, atof
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
 
 from sitdown.core import Mutation, BankAccount
+from sitdown.lazy import lazy_import
+from sitdown.profiling import stage
 
+np = lazy_import("numpy")
 
-class ABNAMROReader:
-    """Reads in mutations downloaded from ABN AMRO website as 'text'
+SNIFF_SIZE = 4096  # bytes read from the start of a file to detect its format
+READERS = []  # registered Reader classes
 
-    Example content lines:
 
-    665481173	EUR	20160715	12,79   249,79	20160715	116,00	socks.com socks
-    665481173	EUR	20160725	753,40	749,25	20160725	-3,15	something expensive
-    etc..
+def register_reader(reader_class):
+    """Make reader_class available for format detection. Can be used as class
+    decorator
+
+    Parameters
+    ----------
+    reader_class: Type[Reader]
 
+    Returns
+    -------
+    Type[Reader]
     """
+    if reader_class not in READERS:
+        READERS.append(reader_class)
+    return reader_class
 
-    LOCALE = 'nl_NL'  # Any locale that uses comma as decimal place indicator
-    HEADER_NAMES = [
-        "account",
-        "currency",
-        "date",
-        "balance_before",
-        "balance_after",
-        "interest_date",
-        "amount",
-        "description",
-    ]
+
+class Reader(metaclass=abc.ABCMeta):
+    """Reads mutations from one kind of bank export
+
+    """
+
+    encoding = "utf-8"
 
     def __init__(self, accounts=None):
         """
@@ -43,31 +64,62 @@ class ABNAMROReader:
             accounts = []
         self.accounts = accounts
 
+    @classmethod
+    @abstractmethod
+    def sniff(cls, head, name=""):
+        """How sure is this reader that it can read a file starting with head?
+
+        Parameters
+        ----------
+        head: bytes
+            first SNIFF_SIZE bytes of the file, or all of it if shorter
+        name: str, optional
+            file name. Only a hint, content is what counts. Defaults to ""
+
+        Returns
+        -------
+        float
+            0 for 'cannot read this' up to 1 for 'certainly my format'
+        """
+        pass
+
+    @abstractmethod
+    def iter_mutations(self, stream):
+        """Parse mutations one by one
+
+        Parameters
+        ----------
+        stream: BinaryIO
+            file opened in binary mode, positioned at the start
+
+        Returns
+        -------
+        Iterator[Mutation]
+        """
+        pass
+
     def read(self, input_file):
-        """Try to read ABN AMRO input file and parse contents as mutations
+        """Read input file and parse contents as mutations
 
         Parameters
         ----------
-        input_file: Path
-            path to abn amro mutations file
+        input_file: Path or str
 
         Returns
         -------
         Set[Mutation]
 
         """
-        setlocale(LC_NUMERIC, self.LOCALE)
-
-        mutations = set()
-        with open(input_file, "r") as tabfile:
-            reader = DictReader(tabfile, delimiter="\t", fieldnames=self.HEADER_NAMES)
-            for line in reader:
-                try:
-                    mutations.add(self.parse_to_mutation(line))
-                except ValueError as e:
-                    raise ReaderException(f"Error reading line '{line}': {e}")
+        with stage(f"{type(self).__name__}.read") as running:
+            with open(input_file, "rb") as stream:
+                mutations = set(self.iter_mutations(stream))
+            running.rows = len(mutations)
         return mutations
 
+    def text(self, stream):
+        """Text view on binary stream, in the encoding of this format"""
+        return io.TextIOWrapper(stream, encoding=self.encoding, newline="")
+
     def get_account(self, account_number):
         """Return a known account if possible, otherwise create a new account and memorize that
         Parameters
@@ -86,18 +138,249 @@ class ABNAMROReader:
             self.accounts.append(new)
             return new
 
+
+@register_reader
+class ABNAMROReader(Reader):
+    """Reads in mutations downloaded from ABN AMRO website as 'text'
+
+    Example content lines:
+
+    665481173	EUR	20160715	12,79   249,79	20160715	116,00	socks.com socks
+    665481173	EUR	20160725	753,40	749,25	20160725	-3,15	something expensive
+    etc..
+
+    """
+
+    HEADER_NAMES = [
+        "account",
+        "currency",
+        "date",
+        "balance_before",
+        "balance_after",
+        "interest_date",
+        "amount",
+        "description",
+    ]
+    LINE_PATTERN = re.compile(rb"[^\t\r\n]*\t[A-Z]{3}\t\d{8}\t-?[\d.]+,\d+\t")
+    CHUNK_SIZE = 64 * 2 ** 20  # bytes parsed at once by read_columns()
+
+    @classmethod
+    def sniff(cls, head, name=""):
+        first_line = head.lstrip().split(b"\n", 1)[0]
+        return 0.9 if cls.LINE_PATTERN.match(first_line) else 0
+
+    def iter_mutations(self, stream, report=None):
+        """Parse mutations one by one
+
+        Parameters
+        ----------
+        stream: BinaryIO
+            file opened in binary mode. Parsing starts at the current position
+        report: ReadReport, optional
+            If given, read tolerantly: bad lines are recorded in report instead
+            of raising, and report tracks the offset to resume from. Defaults
+            to None, meaning raise ReaderException on the first bad line
+
+        Returns
+        -------
+        Iterator[Mutation]
+        """
+        offset = stream.tell()
+        line_number = report.line_number if report is not None else 0
+        for raw in stream:
+            line_number += 1
+            try:
+                if raw.strip():
+                    yield self.parse_line(raw)
+            except ValueError as e:
+                if report is None:
+                    line = raw.decode(self.encoding, errors="replace").rstrip()
+                    raise ReaderException(f"Error reading line {line_number} "
+                                          f"'{line}': {e}")
+                report.errors.append(LineError(line_number=line_number,
+                                               offset=offset, raw=raw,
+                                               reason=str(e)))
+            offset += len(raw)
+            if report is not None:
+                report.offset, report.line_number = offset, line_number
+
+    def parse_line(self, raw):
+        """Parse a single raw line to a Mutation
+
+        Parameters
+        ----------
+        raw: bytes
+
+        Returns
+        -------
+        Mutation
+
+        Raises
+        ------
+        ValueError
+            If line cannot be parsed
+        """
+        values = raw.decode(self.encoding).rstrip("\r\n").split("\t", 7)
+        if len(values) != len(self.HEADER_NAMES):
+            raise ValueError(f"Expected {len(self.HEADER_NAMES)} tab separated "
+                             f"fields, found {len(values)}")
+        return self.parse_to_mutation(dict(zip(self.HEADER_NAMES, values)))
+
+    def read_tolerant(self, input_file, resume=None):
+        """Read all lines that can be read, report the ones that cannot
+
+        Parameters
+        ----------
+        input_file: Path or str
+            path to abn amro mutations file
+        resume: ReadReport, optional
+            report of an earlier, interrupted read of this file or of a file
+            that has grown since. Continue where that read stopped and add to
+            that report. Defaults to None, meaning read from the start
+
+        Returns
+        -------
+        Tuple[Set[Mutation], ReadReport]
+        """
+        report = resume if resume is not None else ReadReport(input_file)
+        with stage(f"{type(self).__name__}.read_tolerant") as running:
+            with open(input_file, "rb") as stream:
+                stream.seek(report.offset)
+                mutations = set(self.iter_mutations(stream, report=report))
+            running.rows = len(mutations)
+        return mutations, report
+
+    def reparse(self, input_file, report):
+        """Parse only the lines in report that failed before, for example after
+        fixing them in the file. Lines that now parse are removed from
+        report.errors, offsets are updated for lines whose length changed
+
+        Parameters
+        ----------
+        input_file: Path or str
+        report: ReadReport
+            from read_tolerant() on this file
+
+        Returns
+        -------
+        Set[Mutation]
+            mutations from lines that parse now
+        """
+        mutations = set()
+        remaining = []
+        shift = 0  # change in file length before the current line
+        with open(input_file, "rb") as stream:
+            for error in report.errors:
+                stream.seek(error.offset + shift)
+                raw = stream.readline()
+                new_offset = error.offset + shift
+                shift += len(raw) - len(error.raw)
+                try:
+                    mutations.add(self.parse_line(raw))
+                except ValueError as e:
+                    remaining.append(LineError(line_number=error.line_number,
+                                               offset=new_offset, raw=raw,
+                                               reason=str(e)))
+        report.errors = remaining
+        report.offset += shift
+        return mutations
+
+    def read_columns(self, input_file):
+        """Fast path for large files. Memory-maps the file and parses it as
+        columns, without creating an object per line or depending on locale
+
+        Parameters
+        ----------
+        input_file: Path or str
+            path to abn amro mutations file
+
+        Returns
+        -------
+        MutationColumns
+            Descriptions are decoded from the memory-mapped file on demand
+
+        """
+        from sitdown.columns import MutationColumns, line_chunks
+
+        with stage(f"{type(self).__name__}.read_columns") as running:
+            with open(input_file, "rb") as f:
+                # the map stays valid after closing the file
+                raw = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) \
+                    if os.fstat(f.fileno()).st_size else b""
+            view = np.frombuffer(raw, dtype=np.uint8)
+            columns = MutationColumns.concatenate(
+                [self.parse_columns(raw, view, start, end)
+                 for start, end in line_chunks(raw, self.CHUNK_SIZE)])
+            running.rows = len(columns)
+        return columns
+
+    def parse_columns(self, raw, view, start, end):
+        """Parse lines in raw[start:end] to columns. See read_columns()
+
+        Parameters
+        ----------
+        raw: bytes or mmap
+            file contents
+        view: numpy.ndarray
+            uint8 view of raw
+        start: int
+            offset of the first line
+        end: int
+            offset just after the last line
+
+        Returns
+        -------
+        MutationColumns
+        """
+        from sitdown.columns import MutationColumns, categories, tab_fields, \
+            parse_minor_units, parse_yyyymmdd
+
+        starts, ends, line_starts, bad = tab_fields(
+            view, start, end, len(self.HEADER_NAMES))
+        field = {name: i for i, name in enumerate(self.HEADER_NAMES)}
+
+        def minor_units(name):
+            return parse_minor_units(view, starts[:, field[name]], ends[:, field[name]])
+
+        amounts, bad_amounts = minor_units("amount")
+        before, bad_before = minor_units("balance_before")
+        after, bad_after = minor_units("balance_after")
+        dates, bad_dates = parse_yyyymmdd(view, starts[:, field["date"]])
+        bad_dates |= ends[:, field["date"]] - starts[:, field["date"]] != 8
+        bad = bad | bad_amounts | bad_before | bad_after | bad_dates
+        if bad.any():
+            offset = int(line_starts[np.argmax(bad)])
+            line_number = int(np.count_nonzero(view[:offset] == ord("\n"))) + 1
+            line_end = raw.find(b"\n", offset)
+            line = bytes(raw[offset:line_end if line_end >= 0 else len(raw)])
+            raise ReaderException(f"Error reading line {line_number} "
+                                  f"'{line.decode(self.encoding, errors='replace')}'")
+
+        account_codes, accounts = categories(view, starts[:, field["account"]],
+                                             ends[:, field["account"]])
+        currency_codes, currencies = categories(view, starts[:, field["currency"]],
+                                                ends[:, field["currency"]])
+        return MutationColumns(
+            accounts=accounts, account_codes=account_codes,
+            currencies=currencies, currency_codes=currency_codes,
+            dates=dates, amounts=amounts, balances_before=before,
+            balances_after=after, buffer=raw,
+            description_starts=starts[:, field["description"]],
+            description_ends=ends[:, field["description"]],
+            encoding=self.encoding)
+
     def parse_to_mutation(self, line):
         """Try to parse given line to mutation object
 
         """
-        return Mutation(amount=atof(line['amount']),
+        return Mutation(amount=float(parse_amount(line['amount'])),
                         date=datetime.strptime(line['date'], '%Y%m%d').date(),
                         account=self.get_account(account_number=line['account']),
                         currency=line['currency'],
                         opposite_account=self.find_iban(line['description']),
                         description=line['description'],
-                        balance_after=atof(line['balance_after']),
-                        balance_before=atof(line['balance_before'])
+                        balance_after=float(parse_amount(line['balance_after'])),
+                        balance_before=float(parse_amount(line['balance_before']))
                         )
 
     @staticmethod
@@ -112,5 +395,587 @@ class ABNAMROReader:
             return None
 
 
+def parse_amount(text):
+    """Parse an amount written with either comma or dot as decimal separator,
+    without depending on locale. Like '-1.234,56', '1,234.56' or '-3,15'
+
+    Parameters
+    ----------
+    text: str
+
+    Returns
+    -------
+    Decimal
+
+    Raises
+    ------
+    ValueError
+        if text is not an amount
+    """
+    text = text.strip().replace(" ", "")
+    comma, dot = text.rfind(","), text.rfind(".")
+    if comma > dot:  # comma is the decimal separator
+        text = text.replace(".", "").replace(",", ".")
+    else:
+        text = text.replace(",", "")
+    try:
+        return Decimal(text)
+    except InvalidOperation:
+        raise ValueError(f"Not an amount: '{text}'")
+
+
+@register_reader
+class CSVReader(Reader):
+    """Reads comma or semicolon separated exports with a header line, like those
+    of ING, Rabobank, bunq and Triodos. Columns are found by their header name
+
+    """
+
+    encoding = "utf-8-sig"  # some banks start with a byte order mark
+    COLUMNS = {
+        "date": ("date", "datum", "boekingsdatum", "transactiedatum",
+                 "transaction date", "booking date"),
+        "amount": ("amount", "bedrag", "bedrag (eur)", "amount (eur)",
+                   "transactiebedrag"),
+        "direction": ("af bij", "debit/credit", "credit/debit"),
+        "account": ("account", "rekening", "iban/bban", "iban", "rekeningnummer",
+                    "account number"),
+        "opposite_account": ("tegenrekening", "tegenrekening iban/bban",
+                             "counterparty", "counterparty account",
+                             "counter account"),
+        "currency": ("currency", "munt", "valuta"),
+        "balance_after": ("balance", "saldo na mutatie", "saldo na trn",
+                          "balance after"),
+        "description": ("naam / omschrijving", "naam tegenpartij", "name",
+                        "description", "omschrijving", "omschrijving-1",
+                        "mededelingen", "memo", "details"),
+    }
+    NEGATIVE_DIRECTIONS = ("af", "debit", "d")
+    DATE_FORMATS = ("%Y-%m-%d", "%Y%m%d", "%d-%m-%Y", "%d/%m/%Y", "%Y/%m/%d")
+
+    def __init__(self, accounts=None):
+        super().__init__(accounts=accounts)
+        self._date_format = None
+
+    @classmethod
+    def header_columns(cls, header):
+        """Map sitdown field names to column indices in header. Description can
+        span several columns
+
+        Parameters
+        ----------
+        header: List[str]
+
+        Returns
+        -------
+        Dict[str, int or List[int]]
+        """
+        names = [x.strip().lower() for x in header]
+        columns = {}
+        for field, aliases in cls.COLUMNS.items():
+            found = [i for i, x in enumerate(names) if x in aliases]
+            if field == "description":
+                columns[field] = found
+            elif found:
+                columns[field] = found[0]
+        return columns
+
+    @classmethod
+    def sniff(cls, head, name=""):
+        if len(head) >= SNIFF_SIZE:
+            # the last line is cut off, possibly in the middle of a character
+            head = head[:head.rfind(b"\n") + 1] or head
+        try:
+            lines = head.decode(cls.encoding).splitlines()
+            dialect = csv.Sniffer().sniff("\n".join(lines[:5]), delimiters=",;\t")
+        except (UnicodeDecodeError, csv.Error):
+            return 0
+        header = next(csv.reader(lines[:1], dialect), [])
+        columns = cls.header_columns(header)
+        return 0.5 if "date" in columns and "amount" in columns else 0
+
+    def parse_date(self, text):
+        """Parse date in whichever of DATE_FORMATS this file uses"""
+        text = text.strip()
+        if self._date_format:
+            try:
+                return datetime.strptime(text, self._date_format).date()
+            except ValueError:
+                pass
+        for date_format in self.DATE_FORMATS:
+            try:
+                date = datetime.strptime(text, date_format).date()
+            except ValueError:
+                continue
+            self._date_format = date_format
+            return date
+        raise ValueError(f"Unknown date format: '{text}'")
+
+    def iter_mutations(self, stream):
+        text = self.text(stream)
+        head = text.read(SNIFF_SIZE)
+        text.seek(0)
+        dialect = csv.Sniffer().sniff("\n".join(head.splitlines()[:5]),
+                                      delimiters=",;\t")
+        rows = csv.reader(text, dialect)
+        columns = self.header_columns(next(rows))
+        for line_number, row in enumerate(rows, start=2):
+            if not any(row):
+                continue
+            try:
+                yield self.parse_row(row, columns)
+            except (ValueError, IndexError) as e:
+                raise ReaderException(f"Error reading line {line_number} "
+                                      f"'{row}': {e}")
+
+    def parse_row(self, row, columns):
+        """Parse a single csv row to a Mutation
+
+        Parameters
+        ----------
+        row: List[str]
+        columns: Dict
+            output of header_columns()
+
+        Returns
+        -------
+        Mutation
+        """
+        def get(field):
+            return row[columns[field]].strip() if field in columns else None
+
+        amount = parse_amount(get("amount"))
+        direction = get("direction")
+        if direction and direction.lower() in self.NEGATIVE_DIRECTIONS:
+            amount = -abs(amount)
+        balance_after = get("balance_after")
+        balance_after = parse_amount(balance_after) if balance_after else None
+        return Mutation(
+            amount=amount,
+            date=self.parse_date(get("date")),
+            account=self.get_account(account_number=get("account") or ""),
+            currency=get("currency") or "EUR",
+            opposite_account=get("opposite_account") or None,
+            description=" ".join(row[i].strip() for i in columns["description"]
+                                 if row[i].strip()),
+            balance_after=balance_after,
+            balance_before=None if balance_after is None else balance_after - amount)
+
+
+@register_reader
+class OFXReader(Reader):
+    """Reads Open Financial Exchange files, both SGML (OFX 1.x) and XML (OFX 2.x).
+    Handles one tag per line or several tags on a line
+
+    """
+
+    encoding = "latin-1"  # OFX 1.x default charset. Tags are plain ASCII anyway
+    TAG = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+    ACCOUNT_FROM = ("BANKACCTFROM", "CCACCTFROM")
+    ACCOUNT_TO = ("BANKACCTTO", "CCACCTTO")
+
+    @classmethod
+    def sniff(cls, head, name=""):
+        upper = head.upper()
+        return 1.0 if b"OFXHEADER" in upper or b"<OFX>" in upper else 0
+
+    @staticmethod
+    def parse_date(text):
+        """OFX dates look like 20190105, 20190105120000 or 20190105120000[-5:EST]"""
+        return datetime.strptime(text[:8], "%Y%m%d").date()
+
+    def iter_mutations(self, stream):
+        account = None
+        currency = "EUR"
+        path = []  # open aggregates, like ['OFX', 'BANKMSGSRSV1', ...]
+        transaction = None
+        for line in self.text(stream):
+            for closing, tag, value in self.TAG.findall(line):
+                tag, value = tag.upper(), value.strip()
+                if closing:
+                    if tag not in path:  # closing tag of an XML leaf element
+                        continue
+                    while path.pop() != tag:
+                        pass
+                    if tag == "STMTTRN":
+                        yield self.to_mutation(transaction, account, currency)
+                        transaction = None
+                elif not value:  # aggregate
+                    path.append(tag)
+                    if tag == "STMTTRN":
+                        transaction = {}
+                elif tag == "CURDEF":
+                    currency = value
+                elif tag == "ACCTID" and path and path[-1] in self.ACCOUNT_FROM:
+                    account = self.get_account(account_number=value)
+                elif transaction is not None:
+                    if tag == "ACCTID" and path[-1] in self.ACCOUNT_TO:
+                        tag = "OPPOSITE_ACCTID"
+                    transaction[tag] = value
+
+    @classmethod
+    def to_mutation(cls, transaction, account, currency):
+        try:
+            description = " ".join(transaction[x] for x in ("NAME", "MEMO")
+                                   if transaction.get(x))
+            return Mutation(amount=parse_amount(transaction["TRNAMT"]),
+                            date=cls.parse_date(transaction["DTPOSTED"]),
+                            account=account,
+                            currency=transaction.get("CURRENCY", currency),
+                            opposite_account=transaction.get("OPPOSITE_ACCTID"),
+                            description=description)
+        except (KeyError, ValueError) as e:
+            raise ReaderException(f"Error reading transaction {transaction}: {e}")
+
+
+@register_reader
+class CAMT053Reader(Reader):
+    """Reads ISO 20022 CAMT.053 bank to customer statements (XML)
+
+    Parses incrementally: each entry (Ntry) is turned into a Mutation and then
+    removed from the tree, so memory use does not grow with file size.
+    Counterparty account and name come from the structured related parties
+
+    """
+
+    @classmethod
+    def sniff(cls, head, name=""):
+        return 1.0 if b"camt.053" in head else 0
+
+    @staticmethod
+    def local(tag):
+        """Tag without namespace, like 'Ntry'"""
+        return tag.rsplit("}", 1)[-1]
+
+    @classmethod
+    def find(cls, element, *path):
+        """First descendant along path of local tag names, or None"""
+        for name in path:
+            if element is None:
+                return None
+            element = next((x for x in element if cls.local(x.tag) == name), None)
+        return element
+
+    @classmethod
+    def find_text(cls, element, *path):
+        found = cls.find(element, *path)
+        return found.text.strip() if found is not None and found.text else None
+
+    @classmethod
+    def account_id(cls, account):
+        """IBAN or other identification inside an Acct element"""
+        return cls.find_text(account, "Id", "IBAN") or cls.find_text(account, "Id", "Othr", "Id")
+
+    def iter_mutations(self, stream):
+        from xml.etree.ElementTree import iterparse
+
+        account, currency = None, "EUR"
+        parents = []
+        for event, element in iterparse(stream, events=("start", "end")):
+            if event == "start":
+                parents.append(element)
+                continue
+            parents.pop()
+            tag = self.local(element.tag)
+            if tag == "Acct" and parents and self.local(parents[-1].tag) == "Stmt":
+                account = self.get_account(account_number=self.account_id(element))
+                currency = self.find_text(element, "Ccy") or currency
+            elif tag == "Ntry":
+                yield self.to_mutation(element, account, currency)
+                # keep memory constant: drop the parsed entry from the tree
+                parents[-1].remove(element)
+
+    def to_mutation(self, entry, account, currency):
+        """Mutation for a single Ntry element"""
+        amount_element = self.find(entry, "Amt")
+        try:
+            amount = Decimal(amount_element.text.strip())
+            date = datetime.strptime(self.find_text(entry, "BookgDt", "Dt") or
+                                     self.find_text(entry, "BookgDt", "DtTm")[:10],
+                                     "%Y-%m-%d").date()
+        except (AttributeError, TypeError, ValueError, InvalidOperation) as e:
+            raise ReaderException(f"Error reading entry: {e}")
+        debit = self.find_text(entry, "CdtDbtInd") == "DBIT"
+        if debit:
+            amount = -amount
+
+        details = self.find(entry, "NtryDtls", "TxDtls")
+        # the other party is the creditor when we pay, the debtor when we receive
+        party = "Cdtr" if debit else "Dbtr"
+        parties = self.find(details, "RltdPties")
+        name = self.find_text(parties, party, "Nm") or self.find_text(parties, party, "Pty", "Nm")
+        opposite = self.account_id(self.find(parties, party + "Acct"))
+        remittance = self.find(details, "RmtInf")
+        lines = [x.text.strip() for x in (remittance if remittance is not None else [])
+                 if self.local(x.tag) == "Ustrd" and x.text]
+        if not lines:
+            lines = [self.find_text(entry, "AddtlNtryInf") or ""]
+
+        return Mutation(amount=amount, date=date, account=account,
+                        currency=amount_element.get("Ccy", currency),
+                        opposite_account=opposite,
+                        description=" ".join(x for x in [name] + lines if x))
+
+
+@register_reader
+class MT940Reader(Reader):
+    """Reads SWIFT MT940 statements, as exported by most Dutch banks
+
+    Reads line by line. Balances are chained from the opening balance (:60F:).
+    Counterparty account and name come from the structured /KEY/value fields
+    in :86: lines, where the bank provides them
+
+    """
+
+    encoding = "latin-1"
+    TAG = re.compile(r"^:(\d{2}[A-Z]?):(.*)")
+    STATEMENT_LINE = re.compile(r"(\d{6})(\d{4})?(R?[CD])[A-Z]?(\d+,\d*)")
+    BALANCE = re.compile(r"([CD])(\d{6})([A-Z]{3})(\d+,\d*)")
+    INFORMATION_KEYS = {"TRTP", "IBAN", "BIC", "NAME", "REMI", "EREF", "MARF",
+                        "CSID", "ORDP", "BENM", "CNTP", "ID", "ADDR", "PURP",
+                        "ULTC", "ULTD", "USTD", "STRD", "CDTRREF", "CDTRREFTP",
+                        "ISSR", "RTRN", "SVCL"}
+
+    @classmethod
+    def sniff(cls, head, name=""):
+        has_tags = re.search(rb"^:20:", head, re.MULTILINE) and b":25:" in head
+        return 0.9 if has_tags else 0
+
+    @staticmethod
+    def parse_mt_amount(text):
+        return Decimal(text.replace(",", "."))
+
+    @staticmethod
+    def parse_account(text):
+        """Account number from a :25: field like 'NL20RABO0123456789 EUR' or
+        'ABNANL2A/123456789'"""
+        text = text.split("/")[-1].replace(" ", "")
+        match = re.match(r"(.*\d)([A-Z]{3})$", text)
+        return match.group(1) if match else text
+
+    @classmethod
+    def parse_information(cls, text):
+        """Split structured :86: text like '/IBAN/NL..../NAME/Shop/REMI/Text' into
+        a dict. Returns an empty dict for unstructured text"""
+        if not text.startswith("/"):
+            return {}
+        fields, key = {}, None
+        for part in text[1:].split("/"):
+            if part in cls.INFORMATION_KEYS:
+                key = part
+                fields.setdefault(key, [])
+            elif key:
+                fields[key].append(part)
+        return {key: "/".join(value).strip("/ ") for key, value in fields.items()}
+
+    def iter_mutations(self, stream):
+        account, currency, balance = None, "EUR", None
+        pending = None  # :61: statement line, completed by the next field that is not :86:
+        information = None  # lines of the current :86: field
+        for line_number, line in enumerate(self.text(stream), start=1):
+            line = line.rstrip("\r\n")
+            match = self.TAG.match(line)
+            if not match:
+                if information is not None and line and line != "-":
+                    information.append(line)
+                continue
+            tag, value = match.groups()
+            if pending is not None and tag != "86":
+                mutation = self.to_mutation(pending, information or [], account,
+                                            currency, balance)
+                balance = mutation.balance_after
+                yield mutation
+                pending = None
+            information = None
+            if tag == "25":
+                account = self.get_account(account_number=self.parse_account(value))
+            elif tag in ("60F", "60M"):
+                balance_match = self.BALANCE.match(value)
+                if not balance_match:
+                    raise ReaderException(f"Error reading line {line_number} "
+                                          f"'{line}': malformed :{tag}: balance")
+                sign, _, currency, amount = balance_match.groups()
+                balance = self.parse_mt_amount(amount) * (-1 if sign == "D" else 1)
+            elif tag == "61":
+                pending = value
+            elif tag == "86":
+                information = [value]
+        if pending is not None:
+            yield self.to_mutation(pending, information or [], account, currency,
+                                   balance)
+
+    def to_mutation(self, statement_line, information, account, currency, balance):
+        """Mutation for one :61: line and the lines of its :86: information"""
+        match = self.STATEMENT_LINE.match(statement_line)
+        if not match:
+            raise ReaderException(f"Error reading statement line '{statement_line}'")
+        date, _, mark, amount = match.groups()
+        amount = self.parse_mt_amount(amount)
+        if mark in ("D", "RC"):  # debit, or reversal of a credit
+            amount = -amount
+
+        # structured fields may be broken off anywhere, free text between words
+        fields = self.parse_information("".join(information))
+        opposite = fields.get("IBAN")
+        name = fields.get("NAME")
+        if "CNTP" in fields:  # ING style: /CNTP/account/bic/name/city/
+            parts = fields["CNTP"].split("/")
+            opposite = opposite or parts[0] or None
+            name = name or (parts[2] if len(parts) > 2 else None)
+        if fields:
+            remark = fields.get("USTD") or fields.get("REMI") or ""
+            description = " ".join(x for x in (name, remark) if x)
+        else:
+            description = " ".join(" ".join(information).split())
+
+        return Mutation(amount=amount,
+                        date=datetime.strptime(date, "%y%m%d").date(),
+                        account=account, currency=currency,
+                        opposite_account=opposite or None,
+                        description=description,
+                        balance_before=balance,
+                        balance_after=None if balance is None else balance + amount)
+
+
+def detect_reader(head, name=""):
+    """The registered reader class most sure it can read a file starting with head
+
+    Parameters
+    ----------
+    head: bytes
+        first SNIFF_SIZE bytes of the file
+    name: str, optional
+        file name, as a hint. Defaults to ""
+
+    Returns
+    -------
+    Type[Reader]
+
+    Raises
+    ------
+    ReaderException
+        when no registered reader recognises the format
+    """
+    scores = [(reader_class.sniff(head, name), i, reader_class)
+              for i, reader_class in enumerate(READERS)]
+    score, _, best = max(scores, key=lambda x: (x[0], -x[1]), default=(0, 0, None))
+    if not score:
+        raise ReaderException(f"Unknown file format for '{name}'")
+    return best
+
+
+def iter_file(input_file, accounts=None):
+    """Mutations in input_file one by one, in whatever registered format it has.
+    The file is opened only once
+
+    Parameters
+    ----------
+    input_file: Path or str
+    accounts: List(BankAccount), Optional
+        Link mutations to these bank accounts if number matches
+
+    Returns
+    -------
+    Iterator[Mutation]
+    """
+    with open(input_file, "rb") as stream:
+        head = stream.read(SNIFF_SIZE)
+        stream.seek(0)
+        reader = detect_reader(head, name=Path(input_file).name)(accounts=accounts)
+        yield from reader.iter_mutations(stream)
+
+
+def read_file(input_file, accounts=None):
+    """All mutations in input_file, in whatever registered format it has
+
+    Returns
+    -------
+    Set[Mutation]
+    """
+    with stage("read_file") as running:
+        mutations = set(iter_file(input_file, accounts=accounts))
+        running.rows = len(mutations)
+    return mutations
+
+
+def read_files(input_files, processes=None):
+    """Read several files, possibly of different formats, in parallel
+
+    Parameters
+    ----------
+    input_files: List[Path or str]
+    processes: int, optional
+        Number of worker processes. 1 reads in this process. Defaults to None,
+        meaning the number of CPUs
+
+    Returns
+    -------
+    Dict[Path or str, Set[Mutation]]
+        mutations per input file, in the order of input_files
+    """
+    input_files = list(input_files)
+    if len(input_files) > 1 and processes != 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(pool.map(read_file, input_files))
+    else:
+        results = [read_file(x) for x in input_files]
+    return dict(zip(input_files, results))
+
+
+class LineError:
+    """A line that could not be parsed"""
+
+    def __init__(self, line_number, offset, raw, reason):
+        """
+
+        Parameters
+        ----------
+        line_number: int
+            1 for the first line in the file
+        offset: int
+            byte offset of the start of the line in the file
+        raw: bytes
+            the line as it is in the file
+        reason: str
+            why it could not be parsed
+        """
+        self.line_number = line_number
+        self.offset = offset
+        self.raw = raw
+        self.reason = reason
+
+    def __str__(self):
+        return f"Line {self.line_number}: {self.reason}"
+
+
+class ReadReport:
+    """What went wrong in a tolerant read, and where to continue reading"""
+
+    def __init__(self, input_file, offset=0, line_number=0):
+        """
+
+        Parameters
+        ----------
+        input_file: Path or str
+        offset: int, optional
+            byte offset just after the last line read. Defaults to 0
+        line_number: int, optional
+            number of the last line read. Defaults to 0
+        """
+        self.input_file = input_file
+        self.offset = offset
+        self.line_number = line_number
+        self.errors = []
+
+    def __str__(self):
+        return (f"Read {self.line_number} lines of {self.input_file}, "
+                f"{len(self.errors)} error(s)")
+
+    @property
+    def ok(self):
+        return not self.errors
+
+
 class ReaderException(Exception):
     pass
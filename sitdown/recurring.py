@@ -0,0 +1,244 @@
+"""Finding recurring payments, like rent, subscriptions and insurance
+
+Mutations are grouped once by counterparty and direction. Within each group the
+dates are sorted and the intervals between them are summarised with vectorized
+per-group statistics. A group is a recurring series if most intervals are close to
+its median interval and most amounts are close to its median amount. No pairs of
+mutations are ever compared, so this takes seconds for millions of mutations:
+
+    for series in RecurringDetector().detect(mutations):
+        print(series, series.next_date)
+"""
+import calendar
+import datetime
+import re
+
+from sitdown.aggregation import from_minor_units, to_minor_units_array
+from sitdown.lazy import lazy_import
+from sitdown.profiling import stage
+
+np = lazy_import("numpy")
+
+# name, length in days, length in calendar months if any
+PERIODS = [("weekly", 7, None), ("biweekly", 14, None), ("monthly", 30.44, 1),
+           ("quarterly", 91.31, 3), ("half-yearly", 182.62, 6), ("yearly", 365.25, 12)]
+
+NAME = re.compile(r"Naam: (.+?)(?:\s{2,}|$)")
+WORD = re.compile(r"[^\W\d_]{2,}")
+NOISE = {"bea", "nr", "pas", "sepa", "ideal", "overboeking", "incasso", "algemeen",
+         "doorlopend", "iban", "bic", "naam", "omschrijving", "kenmerk", "machtiging",
+         "id", "incassant"}
+
+
+def counterparty(mutation):
+    """Name for the other party of a mutation, the same for all of its mutations.
+    The opposite account if known, otherwise the name in a SEPA description,
+    otherwise the words in the description without numbers and bank jargon
+
+    Parameters
+    ----------
+    mutation: Mutation
+
+    Returns
+    -------
+    str
+    """
+    opposite = mutation.opposite_account
+    if opposite is not None:
+        return str(getattr(opposite, "number", opposite)).replace(" ", "").upper()
+    description = mutation.description or ""
+    name = NAME.search(description) if "Naam: " in description else None
+    if name:
+        return name.group(1).strip().lower()
+    return " ".join(x for x in WORD.findall(description.lower()) if x not in NOISE)
+
+
+def add_months(date, months):
+    """date moved by a number of calendar months. Days past the end of the new
+    month become its last day"""
+    month = date.month - 1 + months
+    year, month = date.year + month // 12, month % 12 + 1
+    return datetime.date(year, month, min(date.day, calendar.monthrange(year, month)[1]))
+
+
+class RecurringSeries:
+    """Mutations to or from the same counterparty at regular intervals"""
+
+    def __init__(self, counterparty, mutations, interval, amount, regularity,
+                 stability):
+        """
+
+        Parameters
+        ----------
+        counterparty: str
+        mutations: List[Mutation]
+            sorted by date
+        interval: float
+            median number of days between mutations
+        amount: Decimal
+            median amount
+        regularity: float
+            fraction of intervals close to the median interval
+        stability: float
+            fraction of amounts close to the median amount
+        """
+        self.counterparty = counterparty
+        self.mutations = mutations
+        self.interval = interval
+        self.amount = amount
+        self.regularity = regularity
+        self.stability = stability
+        name, days, months = min(PERIODS, key=lambda x: abs(x[1] - interval))
+        if abs(days - interval) > 0.2 * days:
+            name, months = f"every {round(interval)} days", None
+        self.period = name  # like 'monthly'
+        self.months = months  # calendar months per period, None if not monthly
+
+    @property
+    def first_date(self):
+        return self.mutations[0].date
+
+    @property
+    def last_date(self):
+        return self.mutations[-1].date
+
+    @property
+    def next_date(self):
+        """Expected date of the next mutation in this series"""
+        if self.months:
+            return add_months(self.last_date, self.months)
+        return self.last_date + datetime.timedelta(days=round(self.interval))
+
+    def __len__(self):
+        return len(self.mutations)
+
+    def __str__(self):
+        return f"{self.period.capitalize()} {self.amount} '{self.counterparty}'"
+
+
+def segment_medians(values, segments, n_segments):
+    """Median of values per segment, without a loop over segments
+
+    Parameters
+    ----------
+    values: numpy.ndarray
+    segments: numpy.ndarray
+        int segment of each value, all segments in range(n_segments) non-empty
+    n_segments: int
+
+    Returns
+    -------
+    numpy.ndarray
+        float median per segment
+    """
+    order = np.lexsort((values, segments))
+    ordered = values[order].astype(float)
+    counts = np.bincount(segments, minlength=n_segments)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    return (ordered[starts + (counts - 1) // 2] + ordered[starts + counts // 2]) / 2
+
+
+class RecurringDetector:
+    """Finds recurring series in mutations"""
+
+    def __init__(self, min_count=3, interval_tolerance=0.2, amount_tolerance=0.1,
+                 min_fraction=0.75, key=counterparty):
+        """
+
+        Parameters
+        ----------
+        min_count: int, optional
+            minimum number of mutations in a series. Defaults to 3
+        interval_tolerance: float, optional
+            intervals within this fraction of the median interval are regular.
+            Defaults to 0.2
+        amount_tolerance: float, optional
+            amounts within this fraction of the median amount are stable.
+            Defaults to 0.1
+        min_fraction: float, optional
+            fraction of intervals that need to be regular, and of amounts that
+            need to be stable. Allows for a missed or extra payment. Defaults
+            to 0.75
+        key: Callable[[Mutation], str], optional
+            groups mutations by counterparty. Defaults to counterparty()
+        """
+        self.min_count = min_count
+        self.interval_tolerance = interval_tolerance
+        self.amount_tolerance = amount_tolerance
+        self.min_fraction = min_fraction
+        self.key = key
+
+    def detect(self, mutations):
+        """Find recurring series. Incoming and outgoing mutations of the same
+        counterparty are separate series
+
+        Parameters
+        ----------
+        mutations: Iterable[Mutation]
+
+        Returns
+        -------
+        List[RecurringSeries]
+            sorted by counterparty
+        """
+        mutations = list(mutations)
+        with stage("RecurringDetector.detect", rows=len(mutations)):
+            if not mutations:
+                return []
+            keys = {}
+            codes = np.fromiter((keys.setdefault(self.key(x), len(keys))
+                                 for x in mutations), dtype=np.int64,
+                                count=len(mutations))
+            amounts = to_minor_units_array([x.amount for x in mutations])
+            dates = np.fromiter((x.date.toordinal() for x in mutations),
+                                dtype=np.int64, count=len(mutations))
+            groups = codes * 2 + (amounts < 0)
+
+            # sort once, after which each group is a contiguous segment
+            order = np.lexsort((dates, groups))
+            groups, dates, amounts = groups[order], dates[order], amounts[order]
+            new = np.concatenate(([True], groups[1:] != groups[:-1]))
+            segments = np.cumsum(new) - 1
+            n_segments = int(segments[-1]) + 1
+            starts = np.flatnonzero(new)
+            counts = np.bincount(segments, minlength=n_segments)
+
+            # intervals between consecutive mutations in the same segment
+            same = ~new[1:]
+            intervals = np.diff(dates)[same]
+            interval_segments = segments[1:][same]
+            candidates = counts >= self.min_count
+            median_intervals = np.zeros(n_segments)
+            regularity = np.zeros(n_segments)
+            if len(intervals):
+                has = np.bincount(interval_segments, minlength=n_segments) > 0
+                present = np.flatnonzero(has)
+                remap = np.cumsum(has) - 1
+                median_intervals[present] = segment_medians(
+                    intervals, remap[interval_segments], len(present))
+                median = median_intervals[interval_segments]
+                regular = np.abs(intervals - median) <= self.interval_tolerance * median
+                regularity = np.bincount(interval_segments, weights=regular,
+                                         minlength=n_segments) / np.maximum(counts - 1, 1)
+            candidates &= (regularity >= self.min_fraction) & (median_intervals > 0)
+
+            median_amounts = segment_medians(amounts, segments, n_segments)
+            median = median_amounts[segments]
+            stable = np.abs(amounts - median) <= self.amount_tolerance * np.abs(median)
+            stability = np.bincount(segments, weights=stable,
+                                    minlength=n_segments) / counts
+            candidates &= stability >= self.min_fraction
+
+            names = list(keys)
+            series = []
+            for segment in np.flatnonzero(candidates):
+                start = starts[segment]
+                members = order[start:start + counts[segment]]
+                series.append(RecurringSeries(
+                    counterparty=names[groups[start] // 2],
+                    mutations=[mutations[i] for i in members],
+                    interval=float(median_intervals[segment]),
+                    amount=from_minor_units(round(median_amounts[segment])),
+                    regularity=float(regularity[segment]),
+                    stability=float(stability[segment])))
+            return sorted(series, key=lambda x: (x.counterparty, x.amount))
@@ -0,0 +1,208 @@
+"""Rendering many report figures to file without a display
+
+Figures are drawn with the object-oriented matplotlib API on Agg canvases, so
+nothing touches pyplot global state and rendering can run in worker processes.
+All computation on mutations happens once in the calling process. Workers only
+receive prepared arrays.
+
+Example
+-------
+    >>> specs = [ReportSpec("shared_in_out", "in_out", shared_mutations),
+    ...          ReportSpec("shared_balance", "balance", shared_mutations,
+    ...                     formats=("png", "svg"))]
+    >>> BatchRenderer(output_dir="/tmp/reports").render(specs)
+    [PosixPath('/tmp/reports/shared_in_out.png'), ...]
+"""
+import os
+from pathlib import Path
+
+from sitdown.plots import prepare_balance, draw_balance, downsample_balance, \
+    in_out_series, draw_in_out
+from sitdown.views import MonthSet, MonthMatrix
+
+# Fraction of the figure width used by the axes, with default subplot parameters
+AXES_WIDTH_FRACTION = 0.775
+
+
+class ReportSpec:
+    """Description of a single figure to render"""
+
+    KINDS = ("in_out", "month_set", "month_matrix", "balance")
+
+    def __init__(self, name, kind, data, formats=("png",), title=None,
+                 figsize=(12, 8), dpi=100, downsample=None):
+        """
+
+        Parameters
+        ----------
+        name: str
+            base file name for output files, without extension
+        kind: str
+            One of KINDS
+        data: List[Mutation] or List[MutationSet]
+            What to plot. For 'month_matrix' a list of MutationSet, like the output
+            of FilterSet.get_filtered_data_set(). Mutations for all other kinds.
+            Specs that share the same data object share computed aggregates
+        formats: Tuple[str], optional
+            write a file for each of these formats. Defaults to ('png',)
+        title: str, optional
+            figure title. Defaults to None, meaning no title
+        figsize: Tuple[float, float], optional
+            figure size in inches. Defaults to (12, 8)
+        dpi: int, optional
+            resolution of raster output. Defaults to 100
+        downsample: str, optional
+            For 'balance', downsample lines with this method, 'minmax' or 'lttb'.
+            For other kinds, any value merges months that do not fit the figure
+            width. Defaults to None, meaning plot all data
+
+        Raises
+        ------
+        ValueError
+            When kind is not one of KINDS
+        """
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown kind '{kind}'. Options are {self.KINDS}")
+        self.name = name
+        self.kind = kind
+        self.data = data
+        self.formats = formats
+        self.title = title
+        self.figsize = figsize
+        self.dpi = dpi
+        self.downsample = downsample
+
+    def __str__(self):
+        return f"ReportSpec '{self.name}' ({self.kind})"
+
+    def pixel_width(self):
+        """Approximate width of the axes in the rendered figure, in pixels"""
+        return int(self.figsize[0] * self.dpi * AXES_WIDTH_FRACTION)
+
+
+class BatchRenderer:
+    """Renders ReportSpecs to files, in parallel"""
+
+    def __init__(self, output_dir, processes=None):
+        """
+
+        Parameters
+        ----------
+        output_dir: Path or str
+            write all figures to this directory. Created if it does not exist
+        processes: int, optional
+            number of worker processes. 0 or 1 renders in the calling process.
+            Defaults to None, meaning the number of CPUs
+        """
+        self.output_dir = Path(output_dir)
+        self.processes = processes
+        # computed views per (kind, data). Reused between specs and render calls
+        self.aggregates = {}
+
+    def aggregate(self, spec):
+        """Computed view for the data in spec. Computed once per data object
+
+        Returns
+        -------
+        MonthSet, MonthMatrix, Tuple[MonthSeries, MonthSeries, MonthSet] or List
+            For 'in_out' the series from in_out_series(). For 'balance' the full
+            resolution output of prepare_balance(). Specs only downsample these
+        """
+        key = (spec.kind, id(spec.data))
+        if key not in self.aggregates:
+            if spec.kind == "month_set":
+                view = MonthSet(spec.data)
+            elif spec.kind == "month_matrix":
+                view = MonthMatrix(filtered_data_list=spec.data)
+            elif spec.kind == "balance":
+                view = prepare_balance(spec.data)
+            else:
+                view = in_out_series(spec.data)
+            # keep data alive so that its id is not reused
+            self.aggregates[key] = (spec.data, view)
+        return self.aggregates[key][1]
+
+    def prepare(self, spec):
+        """Plain arrays needed to draw spec. Computed in the calling process
+
+        Returns
+        -------
+        Tuple
+            arguments for the draw function of spec.kind, after ax
+        """
+        view = self.aggregate(spec)
+        width = spec.pixel_width() if spec.downsample else None
+        if spec.kind == "month_set":
+            return view.plot_data(width), view.description
+        elif spec.kind == "month_matrix":
+            return view.plot_data(width), view.descriptions()
+        elif spec.kind == "balance":
+            return downsample_balance(view, width=width, downsample=spec.downsample),
+        else:
+            return [(x.description, x.prepare_plot(width)) for x in view],
+
+    def render(self, specs):
+        """Render all specs to files in output_dir
+
+        Parameters
+        ----------
+        specs: List[ReportSpec]
+
+        Returns
+        -------
+        List[Path]
+            all files written, in order of specs and formats
+        """
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        jobs = [(spec.kind, self.prepare(spec), spec.title, spec.figsize, spec.dpi,
+                 [str(self.output_dir / f"{spec.name}.{x}") for x in spec.formats])
+                for spec in specs]
+
+        if self.processes is not None and self.processes <= 1:
+            results = [render_figure(*job) for job in jobs]
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            workers = self.processes or os.cpu_count()
+            with ProcessPoolExecutor(max_workers=min(workers, len(jobs) or 1)) as pool:
+                results = list(pool.map(render_figure, *zip(*jobs))) if jobs else []
+        return [Path(x) for paths in results for x in paths]
+
+
+DRAW_FUNCTIONS = {"in_out": draw_in_out,
+                  "month_set": MonthSet.draw,
+                  "month_matrix": MonthMatrix.draw,
+                  "balance": draw_balance}
+
+
+def render_figure(kind, prepared, title, figsize, dpi, paths):
+    """Draw a single figure on a new Agg canvas and save it. Runs in workers
+
+    Parameters
+    ----------
+    kind: str
+        One of ReportSpec.KINDS
+    prepared: Tuple
+        arguments for the draw function of kind, after ax
+    title: str or None
+    figsize: Tuple[float, float]
+    dpi: int
+    paths: List[str]
+        save to each of these. Format is taken from extension
+
+    Returns
+    -------
+    List[str]
+        paths
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot(1, 1, 1)
+    DRAW_FUNCTIONS[kind](ax, *prepared)
+    if title:
+        ax.set_title(title)
+    for path in paths:
+        figure.savefig(path)
+    return paths
@@ -0,0 +1,426 @@
+"""SQLite storage for mutations that do not fit comfortably in memory
+
+A MutationStore keeps mutations, their accounts and their categories in a single
+SQLite file. It can be used wherever a set of mutations is expected:
+
+    store = MutationStore("mutations.sqlite")
+    store.add(ABNAMROReader().read(path))
+    groceries = StringFilter("albert heijn").apply(store)
+    Query(store).where(AmountFilter(to_amount=0)).group_by_month().sum()
+
+Filters that implement to_sql() are run by SQLite, using the indexes on date,
+account, amount and category. Other filters are checked in python on the rows
+SQLite returns. Monthly aggregates of a Query are computed with GROUP BY if all of
+its filters translate to SQL.
+
+Amounts and balances are stored as integer minor units, dates as ISO strings.
+Mutations are unique on their fingerprint: adding the same mutation again only adds
+categories it did not have yet.
+"""
+import datetime
+import sqlite3
+from collections import namedtuple
+from itertools import islice
+from pathlib import Path
+
+from sitdown.aggregation import from_minor_units, to_minor_units
+from sitdown.core import BankAccount, Mutation
+from sitdown.filters import Filter
+from sitdown.lazy import lazy_import
+from sitdown.profiling import stage
+
+np = lazy_import("numpy")
+
+BATCH_SIZE = 10000  # mutations per insert transaction
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    id INTEGER PRIMARY KEY,
+    number,  -- no type, numbers can be int or str
+    description TEXT,
+    UNIQUE (number, description)
+);
+CREATE TABLE IF NOT EXISTS categories (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    parent_id INTEGER REFERENCES categories (id)
+);
+CREATE TABLE IF NOT EXISTS mutations (
+    id INTEGER PRIMARY KEY,
+    fingerprint BLOB NOT NULL UNIQUE,
+    amount INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    account_id INTEGER REFERENCES accounts (id),
+    currency TEXT,
+    opposite_account TEXT,
+    opposite_account_id INTEGER REFERENCES accounts (id),
+    description TEXT,
+    balance_before INTEGER,
+    balance_after INTEGER
+);
+CREATE TABLE IF NOT EXISTS mutation_categories (
+    mutation_id INTEGER NOT NULL REFERENCES mutations (id),
+    category_id INTEGER NOT NULL REFERENCES categories (id),
+    PRIMARY KEY (mutation_id, category_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS mutations_date ON mutations (date);
+CREATE INDEX IF NOT EXISTS mutations_account ON mutations (account_id, date);
+CREATE INDEX IF NOT EXISTS mutations_amount ON mutations (amount);
+CREATE INDEX IF NOT EXISTS mutation_categories_category
+    ON mutation_categories (category_id, mutation_id);
+"""
+
+# mutations table columns needed for each Mutation attribute
+COLUMNS = {"amount": ("amount",),
+           "date": ("date",),
+           "account": ("account_id",),
+           "currency": ("currency",),
+           "opposite_account": ("opposite_account", "opposite_account_id"),
+           "description": ("description",),
+           "balance_before": ("balance_before",),
+           "balance_after": ("balance_after",),
+           "categories": ("(SELECT group_concat(category_id) FROM mutation_categories "
+                          "WHERE mutation_id = mutations.id)",)}
+FIELDS = tuple(COLUMNS)
+
+
+class MutationStore:
+    """Mutations in an SQLite database. Iterating gives Mutation objects, filters
+    and queries run in the database where they can"""
+
+    def __init__(self, path=":memory:"):
+        """
+
+        Parameters
+        ----------
+        path: Path or str, optional
+            SQLite database file. Created if it does not exist. Defaults to an
+            in-memory database
+        """
+        self.path = str(path)
+        self.connection = sqlite3.connect(self.path)
+        if self.path != ":memory:":
+            self.connection.execute("PRAGMA journal_mode = WAL")
+            self.connection.execute("PRAGMA synchronous = NORMAL")
+        # python's lower() to match StringFilter. sqlite's only handles ascii
+        self.connection.create_function("py_lower", 1, lambda x: x and x.lower(),
+                                        deterministic=True)
+        self.connection.executescript(SCHEMA)
+        self._rows = {}  # row types per tuple of fields
+        self._load_tables()
+
+    def __str__(self):
+        return f"MutationStore '{Path(self.path).name}'"
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def _load_tables(self):
+        """Read accounts and categories into memory. There are few of them"""
+        from sitdown.classifiers import Category
+
+        self.accounts = {}
+        for id_, number, description in self.connection.execute(
+                "SELECT id, number, description FROM accounts"):
+            self.accounts[id_] = BankAccount(number=number, description=description)
+        self.categories = {}
+        rows = self.connection.execute(
+            "SELECT id, name, parent_id FROM categories ORDER BY id").fetchall()
+        for id_, name, parent_id in rows:  # parents are always added first
+            self.categories[id_] = Category(name, parent=self.categories.get(parent_id))
+        self._account_ids = {(x.number, x.description): id_
+                             for id_, x in self.accounts.items()}
+        self._category_ids = {x: id_ for id_, x in self.categories.items()}
+
+    def _account_id(self, account):
+        if account is None:
+            return None
+        key = (account.number, account.description)
+        if key not in self._account_ids:
+            cursor = self.connection.execute(
+                "INSERT INTO accounts (number, description) VALUES (?, ?)", key)
+            self._account_ids[key] = cursor.lastrowid
+            self.accounts[cursor.lastrowid] = account
+        return self._account_ids[key]
+
+    def _category_id(self, category):
+        if category not in self._category_ids:
+            parent_id = None if category.parent is None else \
+                self._category_id(category.parent)
+            cursor = self.connection.execute(
+                "INSERT INTO categories (name, parent_id) VALUES (?, ?)",
+                (category.name, parent_id))
+            self._category_ids[category] = cursor.lastrowid
+            self.categories[cursor.lastrowid] = category
+        return self._category_ids[category]
+
+    def _encode(self, mutation):
+        def minor(amount):
+            return None if amount is None else to_minor_units(amount)
+
+        opposite = mutation.opposite_account
+        if isinstance(opposite, BankAccount):
+            opposite, opposite_id = None, self._account_id(opposite)
+        else:
+            opposite_id = None
+        return (mutation.fingerprint(), to_minor_units(mutation.amount),
+                mutation.date.isoformat(), self._account_id(mutation.account),
+                mutation.currency, opposite, opposite_id, mutation.description,
+                minor(mutation.balance_before), minor(mutation.balance_after))
+
+    def add(self, mutations, batch_size=BATCH_SIZE):
+        """Add mutations, in one transaction per batch. Mutations that are
+        already stored get any new categories added
+
+        Parameters
+        ----------
+        mutations: Iterable[Mutation]
+        batch_size: int, optional
+            Number of mutations per transaction. Defaults to BATCH_SIZE
+
+        Returns
+        -------
+        int
+            number of mutations that were not stored yet
+        """
+        mutations = iter(mutations)
+        added = 0
+        with stage("MutationStore.add") as running:
+            while True:
+                batch = list(islice(mutations, batch_size))
+                if not batch:
+                    break
+                with self.connection:
+                    before = self.connection.total_changes
+                    self.connection.executemany(
+                        "INSERT OR IGNORE INTO mutations (fingerprint, amount, date, "
+                        "account_id, currency, opposite_account, opposite_account_id, "
+                        "description, balance_before, balance_after) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        [self._encode(x) for x in batch])
+                    added += self.connection.total_changes - before
+                    self.connection.executemany(
+                        "INSERT OR IGNORE INTO mutation_categories "
+                        "SELECT id, ? FROM mutations WHERE fingerprint = ?",
+                        [(self._category_id(category), x.fingerprint())
+                         for x in batch for category in x.categories])
+                running.rows += len(batch)
+        return added
+
+    def translates(self, filters):
+        """Can all these filters be run by SQLite?
+
+        Parameters
+        ----------
+        filters: Iterable[Filter]
+
+        Returns
+        -------
+        bool
+        """
+        return all(x.to_sql() is not None for x in filters)
+
+    def _where(self, filters):
+        """SQL WHERE clause for filters that translate, and the other filters"""
+        conditions, params, rest = [], [], []
+        for fltr in filters:
+            sql = fltr.to_sql()
+            if sql is None:
+                rest.append(fltr)
+            else:
+                conditions.append(f"({sql[0]})")
+                params.extend(sql[1])
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        return where, params, rest
+
+    def _row_type(self, fields):
+        if fields not in self._rows:
+            self._rows[fields] = namedtuple("Row", fields)
+        return self._rows[fields]
+
+    def _getters(self, fields):
+        """For each field, a function that takes its python value from a row with
+        the columns of fields"""
+        def account(id_):
+            if id_ is not None and id_ not in self.accounts:  # added elsewhere
+                self._load_tables()
+            return self.accounts.get(id_)
+
+        def categories(ids):
+            if not ids:
+                return set()
+            ids = [int(x) for x in ids.split(",")]
+            if any(x not in self.categories for x in ids):
+                self._load_tables()
+            return {self.categories[x] for x in ids}
+
+        def minor(value):
+            return None if value is None else from_minor_units(value)
+
+        decoders = {"amount": from_minor_units,
+                    "date": datetime.date.fromisoformat,
+                    "account": account,
+                    "balance_before": minor,
+                    "balance_after": minor,
+                    "categories": categories}
+        getters, position = [], 0
+        for field in fields:
+            if field == "opposite_account":  # text, or id of a BankAccount
+                def get(row, p=position):
+                    return row[p] if row[p + 1] is None else account(row[p + 1])
+            elif field in decoders:
+                def get(row, p=position, decode=decoders[field]):
+                    return decode(row[p])
+            else:
+                def get(row, p=position):
+                    return row[p]
+            getters.append((field, get))
+            position += len(COLUMNS[field])
+        return getters
+
+    def scan(self, fields=None, filters=()):
+        """Iterate over stored mutations that pass all filters
+
+        Parameters
+        ----------
+        fields: Iterable[str], optional
+            Only read these Mutation attributes and return light rows with just
+            these. Defaults to None, meaning full Mutation objects
+        filters: Iterable[Filter], optional
+            Single filters, parents are not taken into account. Filters that can
+            not be run by SQLite are checked on each row, their fields are read
+            too. Filters without their own matches() are checked on full
+            mutations. Defaults to no filters
+
+        Returns
+        -------
+        Iterator[Mutation or namedtuple]
+        """
+        where, params, rest = self._where(filters)
+        projected = None
+        if fields is not None:
+            fields = set(fields).union(*(x.fields for x in rest))
+            projected = tuple(x for x in FIELDS if x in fields)
+        # the default Filter.matches() puts each mutation in a set, rows holding
+        # categories can not be hashed. Check those filters on full mutations
+        full = projected is None or any(type(x).matches is Filter.matches for x in rest)
+        fields = FIELDS if full else projected
+
+        columns = [column for x in fields for column in COLUMNS[x]]
+        if full:
+            columns.append("fingerprint")
+        sql = f"SELECT {', '.join(columns) or 'NULL'} FROM mutations{where}"
+
+        getters = self._getters(fields)
+        make = Mutation if full else self._row_type(fields)
+        for row in self.connection.execute(sql, params):
+            item = make(**{field: get(row) for field, get in getters})
+            if full:
+                item.__dict__["_fingerprint"] = row[-1]
+            if all(fltr.matches(item) for fltr in rest):
+                if full and projected is not None:
+                    item = self._row_type(projected)(
+                        **{x: getattr(item, x) for x in projected})
+                yield item
+
+    def __iter__(self):
+        return self.scan()
+
+    def __len__(self):
+        return self.count()
+
+    def count(self, filters=()):
+        """Number of stored mutations passing all filters
+
+        Parameters
+        ----------
+        filters: Iterable[Filter], optional
+
+        Returns
+        -------
+        int
+        """
+        where, params, rest = self._where(filters)
+        if rest:
+            return sum(1 for _ in self.scan(fields=(), filters=filters))
+        return self.connection.execute(
+            f"SELECT count(*) FROM mutations{where}", params).fetchone()[0]
+
+    def select(self, fltr):
+        """Mutations passing fltr and all its parents
+
+        Parameters
+        ----------
+        fltr: Filter
+
+        Returns
+        -------
+        Set[Mutation]
+        """
+        with stage(f"MutationStore.select '{fltr.description}'") as running:
+            selected = set(self.scan(filters=fltr.chain()))
+            running.rows = len(selected)
+        return selected
+
+    def currencies(self, filters=()):
+        """Distinct normalized currencies of mutations passing filters
+
+        Parameters
+        ----------
+        filters: Iterable[Filter], optional
+            Single filters, all of which need to translate to SQL
+
+        Returns
+        -------
+        List[str]
+            sorted
+        """
+        from sitdown.currency import normalize_currency
+
+        where, params, rest = self._where(filters)
+        if rest:
+            raise ValueError(f"Can not select in SQL, {rest[0]} has no SQL equivalent")
+        rows = self.connection.execute(
+            f"SELECT DISTINCT currency FROM mutations{where}", params).fetchall()
+        return sorted({normalize_currency(x) for x, in rows})
+
+    def month_totals(self, filters=(), sign=None):
+        """Sum and count of amounts per month, computed by SQLite with GROUP BY
+
+        Parameters
+        ----------
+        filters: Iterable[Filter], optional
+            Single filters, all of which need to translate to SQL
+        sign: int, optional
+            1 to only include incoming amounts, -1 for only outgoing. Defaults
+            to None, meaning all amounts
+
+        Returns
+        -------
+        Tuple[List[datetime.date], numpy.ndarray, numpy.ndarray]
+            first day of each month with mutations, sorted. Exact sums in minor
+            units per month, counts per month
+
+        Raises
+        ------
+        ValueError
+            If any of the filters can not be run by SQLite
+        """
+        where, params, rest = self._where(filters)
+        if rest:
+            raise ValueError(f"Can not group in SQL, {rest[0]} has no SQL equivalent")
+        amount = {None: "amount", 1: "max(amount, 0)", -1: "min(amount, 0)"}[sign]
+        rows = self.connection.execute(
+            f"SELECT substr(date, 1, 7) AS month, sum({amount}), count(*) "
+            f"FROM mutations{where} GROUP BY month ORDER BY month", params).fetchall()
+        months = [datetime.date(int(x[:4]), int(x[5:7]), 1) for x, _, _ in rows]
+        sums = np.array([x for _, x, _ in rows], dtype=np.int64)
+        counts = np.array([x for _, _, x in rows], dtype=np.int64)
+        return months, sums, counts
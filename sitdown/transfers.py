@@ -0,0 +1,205 @@
+"""Finding transfers between your own accounts
+
+Money moved from one of your accounts to another shows up twice: once going out of
+the first account and once coming into the second. Summed over all accounts it
+cancels out, but in per-direction reports it counts as both spending and income.
+
+TransferMatcher pairs these up. Candidate pairs are found with a hash join on
+(absolute amount, date bucket), so the work grows linearly with the number of
+mutations instead of quadratically. Each pair is then checked on accounts and date.
+Matched mutations can be tagged with a category and left out of reports with
+CategoryFilter(TRANSFER, exclude=True):
+
+    matcher = TransferMatcher(accounts=[checking, savings])
+    matcher.tag(mutations)
+    spending = CategoryFilter(TRANSFER, exclude=True).apply(mutations)
+"""
+import functools
+import re
+from collections import defaultdict
+
+from sitdown.aggregation import to_minor_units
+from sitdown.classifiers import Category
+from sitdown.core import BankAccount
+
+TRANSFER = Category("internal transfer")
+IBAN = re.compile(r"^[A-Z]{2}\d{2}[A-Z0-9]{4}(\d+)$")
+
+
+@functools.lru_cache(maxsize=2 ** 16)  # few distinct accounts, many mutations
+def account_key(account):
+    """Comparable form of an account number. ABN AMRO exports give the account
+    itself as a plain number and opposite accounts as IBAN, so 625381173 and
+    NL12ABNA0625381173 need to be the same account
+
+    Parameters
+    ----------
+    account: BankAccount, str or None
+
+    Returns
+    -------
+    str or None
+        account number without IBAN prefix and leading zeros
+    """
+    if account is None:
+        return None
+    if isinstance(account, BankAccount):
+        account = account.number
+    number = str(account).replace(" ", "").upper()
+    match = IBAN.match(number)
+    if match:
+        number = match.group(1)
+    return number.lstrip("0") or number
+
+
+class Transfer:
+    """Money moving between two own accounts, as the mutation going out of one
+    and the mutation coming in on the other"""
+
+    def __init__(self, outgoing, incoming):
+        """
+
+        Parameters
+        ----------
+        outgoing: Mutation
+            negative amount, on the account the money came from
+        incoming: Mutation
+            positive amount, on the account the money went to
+        """
+        self.outgoing = outgoing
+        self.incoming = incoming
+
+    @property
+    def amount(self):
+        return self.incoming.amount
+
+    @property
+    def days(self):
+        """Days between leaving one account and arriving at the other"""
+        return abs((self.incoming.date - self.outgoing.date).days)
+
+    def __iter__(self):
+        return iter((self.outgoing, self.incoming))
+
+    def __str__(self):
+        return (f"Transfer of {self.amount} from {self.outgoing.account} to "
+                f"{self.incoming.account} on {self.outgoing.date}")
+
+
+class TransferMatcher:
+    """Pairs up mutations that are transfers between known accounts"""
+
+    def __init__(self, accounts, max_days=3):
+        """
+
+        Parameters
+        ----------
+        accounts: Iterable[BankAccount]
+            your own accounts
+        max_days: int, optional
+            maximum number of days between the two halves of a transfer.
+            Defaults to 3
+        """
+        self.accounts = list(accounts)
+        self.keys = {account_key(x) for x in self.accounts}
+        self.max_days = max_days
+
+    def _own(self, account):
+        key = account_key(account)
+        return key if key in self.keys else None
+
+    def _fit(self, outgoing, incoming):
+        """How well the accounts of these two mutations agree with each other
+
+        Returns
+        -------
+        int
+            2 if both name the other account, 1 if only one does, 0 if they
+            do not match
+        """
+        out_to = self._own(outgoing[2].opposite_account)
+        in_from = self._own(incoming[2].opposite_account)
+        if outgoing[1] == incoming[1] or out_to not in (None, incoming[1]) or \
+                in_from not in (None, outgoing[1]):
+            return 0
+        return (out_to is not None) + (in_from is not None)
+
+    def match(self, mutations):
+        """Find transfers between own accounts. Each mutation is part of at most
+        one transfer. When there are several candidates, the one naming both
+        accounts is taken, then the closest in date
+
+        Parameters
+        ----------
+        mutations: Iterable[Mutation]
+
+        Returns
+        -------
+        List[Transfer]
+            sorted by date of the outgoing mutation
+        """
+        width = max(self.max_days, 1)
+        outgoing, buckets = [], defaultdict(list)
+        for mutation in mutations:
+            account = self._own(mutation.account)
+            if account is None:
+                continue
+            amount = to_minor_units(mutation.amount)
+            ordinal = mutation.date.toordinal()
+            row = (ordinal, account, mutation)
+            if amount < 0:
+                outgoing.append((-amount, row))
+            elif amount > 0:
+                buckets[amount, ordinal // width].append(row)
+
+        outgoing.sort(key=lambda x: x[1][0])
+        matched = set()  # id() of incoming mutations already used
+        transfers = []
+        for amount, row in outgoing:
+            bucket = row[0] // width
+            best, best_score = None, None
+            for candidate in (candidate for offset in (-1, 0, 1)
+                              for candidate in buckets.get((amount, bucket + offset), ())):
+                distance = abs(candidate[0] - row[0])
+                if distance > self.max_days or id(candidate[2]) in matched:
+                    continue
+                fit = self._fit(row, candidate)
+                if fit and (best is None or (-fit, distance) < best_score):
+                    best, best_score = candidate, (-fit, distance)
+            if best is not None:
+                matched.add(id(best[2]))
+                transfers.append(Transfer(outgoing=row[2], incoming=best[2]))
+        return transfers
+
+    def tag(self, mutations, category=TRANSFER):
+        """Add category to both mutations of every transfer found
+
+        Parameters
+        ----------
+        mutations: Iterable[Mutation]
+        category: Category, optional
+            Defaults to TRANSFER
+
+        Returns
+        -------
+        List[Transfer]
+        """
+        transfers = self.match(mutations)
+        for transfer in transfers:
+            for mutation in transfer:
+                mutation.categories = mutation.categories | {category}
+        return transfers
+
+    def exclude(self, mutations):
+        """mutations without the transfers between own accounts
+
+        Parameters
+        ----------
+        mutations: Iterable[Mutation]
+
+        Returns
+        -------
+        Set[Mutation]
+        """
+        mutations = set(mutations)
+        return mutations - {x for transfer in self.match(mutations) for x in transfer}
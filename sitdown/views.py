@@ -1,13 +1,24 @@
 import datetime
 
-import matplotlib.pyplot as plt
-import numpy as np
-
+from abc import abstractmethod
 from collections import defaultdict, OrderedDict, UserDict
+from decimal import Decimal
 from functools import total_ordering
 from typing import List
 
+from sitdown.aggregation import AmountArray, SCALE
 from sitdown.core import Plottable, MutationSet
+from sitdown.cube import ALLOCATIONS, allocate, allocated_categories, check_allocation
+from sitdown.currency import amounts_in_one_currency, sums_per_currency
+from sitdown.downsample import PlotCache, bucket_edges, pixel_width, thinned_ticks
+from sitdown.lazy import lazy_import
+from sitdown.profiling import stage
+
+np = lazy_import("numpy")
+plt = lazy_import("matplotlib.pyplot")
+
+MIN_BAR_WIDTH = 3  # in pixels. When downsampling, bars are merged below this width
+MIN_TICK_SPACING = 60  # in pixels. When downsampling, tick labels are thinned out
 
 
 class MonthSet(UserDict, Plottable):
@@ -15,12 +26,16 @@ class MonthSet(UserDict, Plottable):
 
     """
 
-    def __init__(self, mutations, description="Unnamed"):
+    def __init__(self, mutations, description="Unnamed", rates=None):
         """
         Parameters
         ----------
         mutations: List[Mutations]
             The mutations in this dataset
+        rates: RateTable, optional
+            Convert amounts to the base currency of these rates before summing.
+            Defaults to None, in which case all mutations should be in the same
+            currency
 
 
         """
@@ -28,14 +43,18 @@ class MonthSet(UserDict, Plottable):
 
         self.mutations = mutations
         self.description = description
+        self.rates = rates
 
-        months = defaultdict(list)
-        for mutation in mutations:
-            months[Month(mutation.date)].append(mutation)
+        with stage(type(self).__name__) as running:
+            months = defaultdict(list)
+            for mutation in mutations:
+                months[Month(mutation.date)].append(mutation)
+            running.rows = sum(len(x) for x in months.values())
 
-        self.data = OrderedDict()
-        for x in sorted(list(months.keys())):
-            self.data[x] = MonthBin(mutations=months[x], month=x)
+            self.data = OrderedDict()
+            for x in sorted(list(months.keys())):
+                self.data[x] = MonthBin(mutations=months[x], month=x, rates=rates)
+        self._plot_cache = PlotCache()
 
     def __str__(self):
         return f"Dataset {self.description}"
@@ -115,7 +134,7 @@ class MonthSet(UserDict, Plottable):
             self, from_month=from_month, to_month=to_month
         )
 
-    def plot(self, ax=None):
+    def plot(self, ax=None, downsample=False):
         """Plot this mutations per month as a bar graph
 
         Parameters
@@ -123,6 +142,10 @@ class MonthSet(UserDict, Plottable):
         ax: matplotlib.Axes, optional
             plot into this axes. Defaults to None, in which case a new axes will be created
             for this plot
+        downsample: bool, optional
+            If True and there are more months than fit in the width of ax, merge
+            consecutive months into one bar spanning their minimum to maximum sum.
+            Also thin out tick labels so they can be read. Defaults to False
 
         Returns
         -------
@@ -133,20 +156,74 @@ class MonthSet(UserDict, Plottable):
         if not ax:
             _, ax = plt.subplots()
 
-        months = self.months()
-        sum_values = [x.sum() for x in self.bins()]
+        width = pixel_width(ax) if downsample else None
+        prepared = self.plot_data(width)
+        return self.draw(ax, prepared, self.description)
 
-        ind = np.arange(len(months))
-        ax.bar(x=ind, height=sum_values)
+    @staticmethod
+    def draw(ax, prepared, description):
+        """Draw bars prepared by prepare_plot() into ax
 
-        ax.set_ylabel(f"{self.description} (Euro)")
+        Parameters
+        ----------
+        ax: matplotlib.Axes
+        prepared: Tuple
+            output of prepare_plot()
+        description: str
+            used for y label
+
+        Returns
+        -------
+        matplotlib.Axes
+        """
+        x, bottom, height, bar_width, ticks, labels = prepared
+        ax.bar(x=x, height=height, bottom=bottom, width=bar_width, align='edge')
+
+        ax.set_ylabel(f"{description} (Euro)")
         ax.set_xlabel("Month")
         ax.grid(which="both", axis="y")
-        ax.set_xticks(ind)
-        ax.set_xticklabels([str(x) for x in months])
+        ax.set_xticks(ticks)
+        ax.set_xticklabels(labels)
 
         return ax
 
+    def plot_data(self, width=None):
+        """Output of prepare_plot(), cached between redraws"""
+        return self._plot_cache.get(width, lambda: self.prepare_plot(width))
+
+    def prepare_plot(self, width=None):
+        """Arrays needed to plot this set as bars
+
+        Parameters
+        ----------
+        width: int, optional
+            Width of the axes in pixels. If given, downsample to fit this width.
+            Defaults to None, meaning plot each month
+
+        Returns
+        -------
+        Tuple
+            x, bottom, height and width of each bar, tick positions and labels
+        """
+        months = self.months()
+        sums = np.array([float(x) for x in self.sums()])
+        starts = np.arange(len(months))
+        if width and len(months) > width // MIN_BAR_WIDTH:
+            starts = bucket_edges(len(months), width // MIN_BAR_WIDTH)
+        if len(starts) < len(months):
+            bottom = np.minimum(np.minimum.reduceat(sums, starts), 0)
+            height = np.maximum(np.maximum.reduceat(sums, starts), 0) - bottom
+        else:
+            bottom, height = np.zeros(len(months)), sums
+        bar_width = np.diff(np.append(starts, len(months))) * 0.8
+
+        ticks = np.arange(len(months))
+        if width:
+            ticks = thinned_ticks(len(months), width // MIN_TICK_SPACING)
+        labels = [str(months[x]) for x in ticks]
+        # bars are edge-aligned. Shift by half a bar to center them on the ticks
+        return starts - 0.4, bottom, height, bar_width, ticks, labels
+
 
 class MonthSeries(MonthSet):
     """A MonthSet that is guaranteed to have all consecutive months between min and max
@@ -154,7 +231,8 @@ class MonthSeries(MonthSet):
     Months without mutations will just have empty month bins"""
 
     def __init__(
-        self, mutations, description="Unnamed", from_month=None, to_month=None
+        self, mutations, description="Unnamed", from_month=None, to_month=None,
+        rates=None
     ):
         """Create a consecutive series of month bins with the given mutations.
 
@@ -168,10 +246,12 @@ class MonthSeries(MonthSet):
             Start with this month. Defaults to first month in the mutations
         to_month: Month, optional
             End with this month. Defaults to last month in the mutations
+        rates: RateTable, optional
+            Convert amounts with these rates. Defaults to None
 
 
         """
-        super().__init__(mutations, description)
+        super().__init__(mutations, description, rates=rates)
 
         # MonthSet might have missing months. Make into range
         self.data = self.make_into_series(self.data, from_month, to_month)
@@ -196,7 +276,8 @@ class MonthSeries(MonthSet):
             from_month = month_set.min_month
         if not to_month:
             to_month = month_set.max_month
-        series = cls(mutations=month_set.mutations, description=month_set.description)
+        series = cls(mutations=month_set.mutations, description=month_set.description,
+                     rates=month_set.rates)
         series.data = series.make_into_series(
             month_set.data, from_month=from_month, to_month=to_month
         )
@@ -232,7 +313,8 @@ class MonthSeries(MonthSet):
             if month in bin_dict:
                 bin_dict_series[month] = bin_dict[month]
             else:
-                bin_dict_series[month] = MonthBin(mutations=[], month=month)
+                bin_dict_series[month] = MonthBin(mutations=[], month=month,
+                                                  rates=self.rates)
         return bin_dict_series
 
 
@@ -274,7 +356,7 @@ class Month:
 class MonthBin:
     """A collection of mutations for a single month"""
 
-    def __init__(self, mutations, month: Month):
+    def __init__(self, mutations, month: Month, rates=None):
         """
 
         Parameters
@@ -283,11 +365,16 @@ class MonthBin:
             all mutations for this month
         month: datetime.date
             Should be the first of the month indicated
+        rates: RateTable, optional
+            Convert amounts with these rates before summing. Defaults to None, in
+            which case all mutations should be in the same currency
 
 
         """
         self.mutations = mutations
         self.month = month
+        self.rates = rates
+        self._amounts = None
 
     def __len__(self):
         return len(self.mutations)
@@ -313,17 +400,39 @@ class MonthBin:
     def __lt__(self, other):
         return self.month < other.month
 
-    def sum(self) -> float:
+    def amounts(self) -> AmountArray:
+        """Amounts of all mutations in this bin, as exact minor units. Converted
+        to a single currency if this bin has rates
+
+        Raises
+        ------
+        CurrencyError
+            If there are several currencies and no rates
+        """
+        if self._amounts is None:
+            self._amounts = amounts_in_one_currency(self.mutations, self.rates)
+        return self._amounts
+
+    def sums_per_currency(self):
+        """Sum of amounts for each currency in this bin, not converted
+
+        Returns
+        -------
+        Dict[str, Decimal]
+        """
+        return sums_per_currency(self.mutations)
+
+    def sum(self) -> Decimal:
         """Sum of all amounts in this bin"""
-        return sum([x.amount for x in self.mutations])
+        return self.amounts().sum()
 
-    def sum_in(self) -> float:
+    def sum_in(self) -> Decimal:
         """Sum of all incoming amounts in this bin"""
-        return sum([x.amount for x in self.mutations if x.amount > 0])
+        return self.amounts().sum_in()
 
-    def sum_out(self) -> float:
+    def sum_out(self) -> Decimal:
         """Sum of all outgoing amounts in this bin"""
-        return sum([x.amount for x in self.mutations if x.amount < 0])
+        return self.amounts().sum_out()
 
 
 def month_iterator(start_month, end_month):
@@ -342,32 +451,43 @@ def month_iterator(start_month, end_month):
         current = new
 
 
-class MonthMatrix(Plottable, UserDict):
-    """Holds MonthSeries for a number of categories. Dictionary of str: MonthSeries
+class MonthGrid(Plottable):
+    """Values per row, per month as dense numpy arrays of shape (rows, months),
+    plotted as stacked bars. Rows are aligned with descriptions(), columns with
+    get_month_range()
+
+    Base of MonthMatrix and CategoryMatrix. Child classes set min_month, max_month
+    and _plot_cache, and implement descriptions() and minor_units()
 
     """
 
-    def __init__(self, filtered_data_list):
-        """
-        Parameters
-        ----------
-        filtered_data_list: List[MutationSet]
+    LAYERS = ("sum", "in", "out", "count")
+
+    @abstractmethod
+    def descriptions(self):
+        """Legend entry for each row
 
+        Returns
+        -------
+        List[str]
         """
-        super().__init__()
-        # Separate each mutations list into months
-        sets = [MonthSet(mutations=x.mutations, description=x.description) for x in filtered_data_list]
+        pass
 
-        # determine the full month range of all sets
-        self.min_month = min([x.min_month for x in sets])
-        self.max_month = max([x.max_month for x in sets])
+    @abstractmethod
+    def minor_units(self, layer="sum"):
+        """Exact data per row, per month as a 2D array
 
-        # make all sets into series of the same length
-        series = {x.description: MonthSeries.from_month_set(x, self.min_month, self.max_month) for x in sets}
-        self.data = series
+        Parameters
+        ----------
+        layer: str, optional
+            One of LAYERS. Defaults to 'sum'
 
-    def descriptions(self):
-        return list(self.data.keys())
+        Returns
+        -------
+        numpy.ndarray
+            int64 array of shape (rows, months). Amounts are in minor units
+        """
+        pass
 
     def get_month_range(self):
         """Get all months in between min and max months. For consistent plotting
@@ -375,23 +495,80 @@ class MonthMatrix(Plottable, UserDict):
         """
         return [x for x in month_iterator(self.min_month, self.max_month)]
 
-    def matrix(self):
-        """Data per month, per category as a 2D array
+    def month_index(self, month):
+        """Column index of the given month in matrix()
+
+        Parameters
+        ----------
+        month: Month
 
         Returns
         -------
-        Dict[Month, List[MonthBin]]
+        int
         """
+        return (month.date.year - self.min_month.date.year) * 12 + \
+            month.date.month - self.min_month.date.month
 
-        matrix = {}
-        for per_month in self.per_month_list:
-            matrix[per_month.description] = per_month.get_series(
-                self.min_month, self.max_month
-            )
+    def matrix(self, layer="sum"):
+        """Data per category, per month as a 2D array
+
+        Same as minor_units(), but with amounts in major units as float. For
+        plotting and further calculation. Use minor_units() for exact values
 
-        return matrix
+        Returns
+        -------
+        numpy.ndarray
+            Array of shape (categories, months).
+        """
+        values = self.minor_units(layer)
+        if layer == "count":
+            return values
+        return values / SCALE
 
-    def plot(self, ax=None):
+    def totals(self, layer="sum"):
+        """Summed value of all categories for each month
+
+        Returns
+        -------
+        numpy.ndarray
+            Array of shape (months,)
+        """
+        totals = self.minor_units(layer).sum(axis=0)
+        if layer == "count":
+            return totals
+        return totals / SCALE
+
+    def percentages(self, layer="sum"):
+        """Share of each category in the monthly total, in percent
+
+        Months with a total of zero have 0 percent for each category
+
+        Returns
+        -------
+        numpy.ndarray
+            Array of shape (categories, months)
+        """
+        matrix = self.matrix(layer)
+        totals = matrix.sum(axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            shares = np.where(totals != 0, matrix / totals * 100, 0)
+        return shares
+
+    def stacked(self, layer="sum"):
+        """Bottom position of each category when stacking categories per month
+
+        Returns
+        -------
+        numpy.ndarray
+            Array of shape (categories, months). Row 0 is all zeros, each next
+            row is the cumulative sum of all rows before it
+        """
+        matrix = self.matrix(layer)
+        bottoms = np.zeros_like(matrix)
+        np.cumsum(matrix[:-1], axis=0, out=bottoms[1:])
+        return bottoms
+
+    def plot(self, ax=None, downsample=False):
         """Plot this matrix as a stacked graph
 
         Parameters
@@ -399,6 +576,10 @@ class MonthMatrix(Plottable, UserDict):
         ax: matplotlib.Axes, optional
             plot into this axes. Defaults to None, in which case a new axes will be created
             for this plot
+        downsample: bool, optional
+            If True and there are more months than fit in the width of ax, merge
+            consecutive months into one bar showing their average per month. Also
+            thin out tick labels so they can be read. Defaults to False
 
         Returns
         -------
@@ -406,39 +587,391 @@ class MonthMatrix(Plottable, UserDict):
             The axes into which this plot has been made
 
         """
+        if not ax:
+            _, ax = plt.subplots()
+
+        width = pixel_width(ax) if downsample else None
+        prepared = self.plot_data(width)
+        return self.draw(ax, prepared, self.descriptions())
+
+    @staticmethod
+    def draw(ax, prepared, descriptions):
+        """Draw stacked bars prepared by prepare_plot() into ax
+
+        Parameters
+        ----------
+        ax: matplotlib.Axes
+        prepared: Tuple
+            output of prepare_plot()
+        descriptions: List[str]
+            legend entry for each category
+
+        Returns
+        -------
+        matplotlib.Axes
+        """
+        x, heights, bottoms, bar_width, ticks, labels = prepared
+        handles = [ax.bar(x, height, width=bar_width, bottom=bottom, align='edge')
+                   for height, bottom in zip(heights, bottoms)]
+
+        ax.set_ylabel('amount')
+        ax.set_xticks(ticks)
+        ax.set_xticklabels(labels)
+        ax.legend(reversed([x[0] for x in handles]), reversed(descriptions))
+
+        return ax
+
+    def plot_data(self, width=None):
+        """Output of prepare_plot(), cached between redraws"""
+        return self._plot_cache.get(width, lambda: self.prepare_plot(width))
 
-        # get sums for each series rounded
-        sums = {x: [int(z) for z in y.sums()] for x, y in self.data.items()}
+    def prepare_plot(self, width=None):
+        """Arrays needed to plot this matrix as stacked bars
 
+        Parameters
+        ----------
+        width: int, optional
+            Width of the axes in pixels. If given, downsample to fit this width.
+            Defaults to None, meaning plot each month
+
+        Returns
+        -------
+        Tuple
+            x, heights and bottoms per category, bar width, tick positions and
+            labels
+        """
         months = self.get_month_range()
-        ind = np.arange(len(months))  # the x locations for the bars
+        heights = self.matrix()
+        starts = np.arange(len(months))
+        if width and len(months) > width // MIN_BAR_WIDTH:
+            starts = bucket_edges(len(months), width // MIN_BAR_WIDTH)
+        sizes = np.diff(np.append(starts, len(months)))
+        if len(starts) < len(months):
+            heights = np.add.reduceat(heights, starts, axis=1) / sizes
+        bottoms = np.zeros_like(heights)
+        np.cumsum(heights[:-1], axis=0, out=bottoms[1:])
+
+        ticks = np.arange(len(months))
+        if width:
+            ticks = thinned_ticks(len(months), width // MIN_TICK_SPACING)
+        labels = [str(months[x].date.strftime("%b `%y")) for x in ticks]
+        return starts - 0.4, heights, bottoms, sizes * 0.8, ticks, labels
+
+
+class MonthMatrix(MonthGrid, UserDict):
+    """Holds MonthSeries for a number of categories. Dictionary of str: MonthSeries
 
-        # work out bottom, height for each series by stacking for each month
-        test = 1
-        # start with a height of 0
-        current_height = [0] * len(months)
-        handles = []
-        for series_sums in sums.values():
-            handles.append(plt.bar(ind, series_sums, width=0.8, bottom=current_height))
-            current_height = piece_wise_add(current_height, series_sums)
+    Next to the per-category MonthSeries, the matrix exposes its data as dense
+    numpy arrays of shape (categories, months) via matrix(). Rows are aligned with
+    descriptions(), columns with get_month_range()
 
-        # arange for len(months)
+    """
 
-        # plt.bar(ind, series, width, bottom)
+    def __init__(self, filtered_data_list, rates=None):
+        """
+        Parameters
+        ----------
+        filtered_data_list: List[MutationSet]
+        rates: RateTable, optional
+            Convert amounts with these rates. Defaults to None, in which case all
+            mutations should be in the same currency
+
+        """
+        super().__init__()
+        self.rates = rates
+        with stage("MonthMatrix", rows=sum(len(x.mutations) for x in filtered_data_list)):
+            # Separate each mutations list into months
+            sets = [MonthSet(mutations=x.mutations, description=x.description, rates=rates)
+                    for x in filtered_data_list]
+
+            # determine the full month range of all sets
+            self.min_month = min([x.min_month for x in sets])
+            self.max_month = max([x.max_month for x in sets])
+
+            # make all sets into series of the same length
+            series = {x.description: MonthSeries.from_month_set(x, self.min_month, self.max_month) for x in sets}
+        self.data = series
+        self._layers = None
+        self._plot_cache = PlotCache()
+
+    def descriptions(self):
+        return list(self.data.keys())
+
+    def _compute_layers(self):
+        """Bin all mutations of all series into (category, month) cells in one pass
+
+        Returns
+        -------
+        Dict[str, numpy.ndarray]
+            2D int64 array of shape (categories, months) for each layer in LAYERS.
+            Amount layers are in exact minor units
+        """
+        shape = (len(self.data), len(self.get_month_range()))
+        cells = []
+        mutations = []
+        for row, month_series in enumerate(self.data.values()):
+            offset = row * shape[1]
+            for mutation in month_series.mutations:
+                cells.append(offset + self.month_index(Month(mutation.date)))
+                mutations.append(mutation)
+
+        amounts = amounts_in_one_currency(mutations, self.rates)
+        size = shape[0] * shape[1]
+
+        def binned(where=None):
+            return amounts.grouped_sums(cells, size, where=where).reshape(shape)
+
+        return {"sum": binned(),
+                "in": binned(amounts.minor_units > 0),
+                "out": binned(amounts.minor_units < 0),
+                "count": np.bincount(np.array(cells, dtype=np.int64),
+                                     minlength=size).reshape(shape)}
+
+    def minor_units(self, layer="sum"):
+        """Exact data per category, per month as a 2D array
+
+        Parameters
+        ----------
+        layer: str, optional
+            One of LAYERS. 'sum' for the summed amounts, 'in' and 'out' for the
+            summed incoming and outgoing amounts, 'count' for the number of
+            mutations. Defaults to 'sum'
+
+        Returns
+        -------
+        numpy.ndarray
+            int64 array of shape (categories, months). Amounts are in minor units
+            (cents). Rows are in the order of descriptions(), columns in the order
+            of get_month_range()
+
+        Raises
+        ------
+        ValueError
+            When layer is not one of LAYERS
+        """
+        if layer not in self.LAYERS:
+            raise ValueError(f"Unknown layer '{layer}'. Options are {self.LAYERS}")
+        if self._layers is None:
+            self._layers = self._compute_layers()
+        return self._layers[layer]
 
 
-        plt.ylabel('amount')
-        #plt.title('Scores by group and gender')
-        plt.xticks(ind, [str(x.date.strftime("%b `%y")) for x in months])
-        #plt.yticks(np.arange(0, 81, 10))
-        plt.legend(reversed([x[0] for x in handles]), reversed(self.descriptions()))
+class CategoryMatrix(MonthGrid, UserDict):
+    """Monthly values for every node of a category tree. Dictionary of
+    Category: list of the mutations directly in that category. Unlike MonthMatrix,
+    values are not MonthSeries, as amounts can be split over categories
 
+    Mutations are binned per (category, month) once, after which the sums of
+    subcategories are added to their parents in a single bottom-up pass. Rows of
+    matrix() are the visible nodes: top-level categories, with expanded categories
+    replaced by their subcategories. Expanding and collapsing only changes which of
+    the precomputed rows are shown.
 
-def piece_wise_add(list_a, list_b):
-    """Add each element of list a to list b.
+    A mutation with several categories is allocated according to allocation.
+    Categories that are a parent of another category of the same mutation are
+    ignored. Mutations without category are in UNCLASSIFIED
 
-    After trying to get numpy to work with decimals for about 10 minuts
-    it was raising cryptic errors. Enough of that nonsense.
     """
-    return [x+y for x, y in zip(list_a, list_b)]
 
+    ALLOCATIONS = ALLOCATIONS
+
+    def __init__(self, mutations, categories=(), allocation="split", rates=None):
+        """
+        Parameters
+        ----------
+        mutations: Iterable[Mutation]
+            classified mutations
+        categories: Iterable[Category], optional
+            include these categories even if no mutation is in them, for example
+            classifier.categories(). Defaults to only categories of mutations
+        allocation: str, optional
+            How to allocate a mutation with several categories. 'split' divides
+            the amount evenly over its categories, 'each' counts the full amount
+            in each of its categories, 'first' counts it only in the first of its
+            categories by name. Defaults to 'split'
+        rates: RateTable, optional
+            Convert amounts with these rates. Defaults to None, in which case all
+            mutations should be in the same currency
+
+        Raises
+        ------
+        ValueError
+            When allocation is not one of ALLOCATIONS, or there are no mutations
+        """
+        check_allocation(allocation)
+        mutations = list(mutations)
+        if not mutations:
+            raise ValueError("Can not make a CategoryMatrix without mutations")
+        UserDict.__init__(self)
+        self.rates = rates
+        self.allocation = allocation
+        self.nodes = {}  # Category: row
+        for category in categories:
+            self._node(category)
+
+        with stage("CategoryMatrix", rows=len(mutations)):
+            self.min_month = Month(min(x.date for x in mutations))
+            self.max_month = Month(max(x.date for x in mutations))
+            n_months = self.month_index(self.max_month) + 1
+
+            rows, cells, shares, parts = [], [], [], []
+            for row, mutation in enumerate(mutations):
+                assigned = allocated_categories(mutation.categories, allocation)
+                month = self.month_index(Month(mutation.date))
+                for share, category in enumerate(assigned):
+                    self.data.setdefault(category, []).append(mutation)
+                    rows.append(row)
+                    cells.append(self._node(category) * n_months + month)
+                    shares.append(share)
+                    parts.append(len(assigned) if allocation == "split" else 1)
+
+            amounts = amounts_in_one_currency(mutations, self.rates).minor_units
+            amounts = AmountArray(allocate(amounts[np.array(rows, dtype=np.int64)],
+                                           np.array(shares, dtype=np.int64),
+                                           np.array(parts, dtype=np.int64)))
+            shape = (len(self.nodes), n_months)
+            direct = {"sum": amounts.grouped_sums(cells, shape[0] * shape[1]),
+                      "in": amounts.grouped_sums(cells, shape[0] * shape[1],
+                                                 where=amounts.minor_units > 0),
+                      "out": amounts.grouped_sums(cells, shape[0] * shape[1],
+                                                  where=amounts.minor_units < 0),
+                      "count": np.bincount(np.array(cells, dtype=np.int64),
+                                           minlength=shape[0] * shape[1])}
+            self._direct = {name: x.reshape(shape) for name, x in direct.items()}
+            self._layers = {name: self._roll_up(x) for name, x in self._direct.items()}
+
+        self._children = defaultdict(list)  # Category or None: sorted subcategories
+        for category in sorted(self.nodes, key=lambda x: x.name):
+            self._children[category.parent].append(category)
+        self.expanded = set()
+        self._plot_cache = PlotCache()
+
+    def _node(self, category):
+        """Row of category, adding it and its parents if new"""
+        if category not in self.nodes:
+            if category.parent is not None:
+                self._node(category.parent)
+            self.nodes[category] = len(self.nodes)
+        return self.nodes[category]
+
+    def _roll_up(self, direct):
+        """Add the rows of all subcategories to their parents, deepest first
+
+        Parameters
+        ----------
+        direct: numpy.ndarray
+            values per (category, month) of mutations directly in each category
+
+        Returns
+        -------
+        numpy.ndarray
+            values per (category, month) including all subcategories
+        """
+        rolled = direct.copy()
+        by_depth = defaultdict(list)  # depth: (row, parent row)
+        for category, row in self.nodes.items():
+            if category.parent is not None:
+                by_depth[self.depth(category)].append((row, self.nodes[category.parent]))
+        for depth in sorted(by_depth, reverse=True):
+            children, parents = np.array(by_depth[depth], dtype=np.int64).T
+            np.add.at(rolled, parents, rolled[children])
+        return rolled
+
+    @staticmethod
+    def depth(category):
+        """Number of parents of category. 0 for top-level categories"""
+        depth = 0
+        while category.parent is not None:
+            depth, category = depth + 1, category.parent
+        return depth
+
+    def children(self, category=None):
+        """Direct subcategories of category, sorted by name
+
+        Parameters
+        ----------
+        category: Category, optional
+            Defaults to None, meaning top-level categories
+        """
+        return list(self._children.get(category, []))
+
+    def expand(self, *categories):
+        """Show the subcategories of categories instead of their totals"""
+        self.expanded.update(categories)
+        self._plot_cache = PlotCache()
+
+    def collapse(self, *categories):
+        """Show the totals of categories instead of their subcategories. Collapses
+        all categories if none are given"""
+        if categories:
+            self.expanded.difference_update(categories)
+        else:
+            self.expanded.clear()
+        self._plot_cache = PlotCache()
+
+    def expand_to(self, depth):
+        """Show all categories down to depth, 0 meaning only top-level categories"""
+        self.expanded = {x for x in self.nodes if self.depth(x) < depth}
+        self._plot_cache = PlotCache()
+
+    def rows(self):
+        """Visible rows in tree order
+
+        Returns
+        -------
+        List[Tuple[Category, bool]]
+            category for each row, and whether the row holds only the mutations
+            directly in an expanded category instead of its total
+        """
+        visible = []
+
+        def visit(category):
+            children = self.children(category)
+            if category not in self.expanded or not children:
+                visible.append((category, False))
+                return
+            for child in children:
+                visit(child)
+            if self._direct["count"][self.nodes[category]].any():
+                visible.append((category, True))
+
+        for top in self.children():
+            visit(top)
+        return visible
+
+    def descriptions(self):
+        return [f"{x.name} (other)" if own else x.name for x, own in self.rows()]
+
+    def minor_units(self, layer="sum"):
+        """Exact data per visible category, per month as a 2D array
+
+        Parameters
+        ----------
+        layer: str, optional
+            One of LAYERS. Defaults to 'sum'
+
+        Returns
+        -------
+        numpy.ndarray
+            int64 array of shape (rows, months). Rows are in the order of rows()
+        """
+        if layer not in self.LAYERS:
+            raise ValueError(f"Unknown layer '{layer}'. Options are {self.LAYERS}")
+        rows = self.rows()
+        if not rows:
+            return np.zeros((0, self.month_index(self.max_month) + 1), dtype=np.int64)
+        return np.stack([(self._direct if own else self._layers)[layer][self.nodes[x]]
+                         for x, own in rows])
+
+    def node(self, category, layer="sum"):
+        """Exact data per month of category including all its subcategories,
+        whether it is visible or not
+
+        Returns
+        -------
+        numpy.ndarray
+            int64 array of shape (months,)
+        """
+        if layer not in self.LAYERS:
+            raise ValueError(f"Unknown layer '{layer}'. Options are {self.LAYERS}")
+        return self._layers[layer][self.nodes[category]]
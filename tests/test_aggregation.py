@@ -0,0 +1,60 @@
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from sitdown.aggregation import AmountArray, to_minor_units, from_minor_units, \
+    to_minor_units_array
+from tests.factories import MutationFactory
+
+
+@pytest.mark.parametrize(
+    "amount, expected",
+    [
+        (Decimal("12.79"), 1279),
+        (Decimal("-3.15"), -315),
+        (Decimal("0.005"), 0),  # rounded half even
+        (Decimal("0.015"), 2),
+        (12.79, 1279),
+        (-0.1, -10),
+        (10, 1000),
+    ],
+)
+def test_to_minor_units(amount, expected):
+    assert to_minor_units(amount) == expected
+
+
+def test_from_minor_units():
+    assert from_minor_units(1279) == Decimal("12.79")
+    assert from_minor_units(np.int64(-315)) == Decimal("-3.15")
+    assert type(from_minor_units(0)) == Decimal
+
+
+def test_to_minor_units_array():
+    floats = to_minor_units_array([0.1, 0.2, 12.79])
+    assert floats.dtype == np.int64
+    assert list(floats) == [10, 20, 1279]
+    mixed = to_minor_units_array([Decimal("0.1"), 0.2, 3])
+    assert list(mixed) == [10, 20, 300]
+    assert len(to_minor_units_array([])) == 0
+
+
+def test_amount_array_is_exact():
+    # summing these as floats gives 0.30000000000000004
+    amounts = AmountArray.from_amounts([0.1, 0.2])
+    assert amounts.sum() == Decimal("0.3")
+
+    mutations = [MutationFactory(amount=x) for x in
+                 (Decimal("1.10"), Decimal("-2.20"), Decimal("3.30"))]
+    amounts = AmountArray.from_mutations(mutations)
+    assert amounts.sum() == Decimal("2.20")
+    assert amounts.sum_in() == Decimal("4.40")
+    assert amounts.sum_out() == Decimal("-2.20")
+
+
+def test_amount_array_grouped_sums():
+    amounts = AmountArray([100, 200, -50, 25])
+    assert list(amounts.grouped_sums([0, 1, 1, 3], 4)) == [100, 150, 0, 25]
+    assert list(amounts.grouped_sums([0, 1, 1, 3], 4,
+                                     where=amounts.minor_units > 0)) == \
+        [100, 200, 0, 25]
@@ -0,0 +1,64 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+
+from sitdown.classifiers import Category
+from sitdown.core import BankAccount
+from sitdown.readers import ABNAMROReader
+from tests import RESOURCE_PATH
+from tests.factories import MutationFactory
+
+pytest.importorskip("pyarrow")
+from sitdown import arrow  # noqa: E402
+
+account1 = BankAccount(number="NL01BANK0123456789", description="checking")
+account2 = BankAccount(number="NL02BANK0123456789", description="savings")
+groceries = Category("groceries", parent=Category("shopping"))
+
+
+@pytest.fixture
+def mutations():
+    return [MutationFactory(date=datetime.date(2018, 1, 1) + datetime.timedelta(days=i),
+                            account=account1 if i % 3 else account2,
+                            opposite_account=account2 if i % 5 == 0 else "NL03",
+                            categories={groceries} if i % 2 else set())
+            for i in range(100)] + \
+        [MutationFactory(amount=-12.5, balance_before=None, balance_after=None)]
+
+
+def test_table_roundtrip(mutations):
+    table = arrow.to_table(mutations)
+    assert str(table.schema.field("amount").type) == "decimal128(18, 2)"
+    assert str(table.schema.field("date").type) == "date32[day]"
+    assert str(table.schema.field("categories").type) == "list<item: int32>"
+    assert table.schema.field("account").type.value_type == "string"
+
+    assert arrow.from_table(table) == set(mutations)
+    assert arrow.amount_array(table).sum() == \
+        sum(Decimal(str(x.amount)) for x in mutations)
+    assert {x.description: x for x in arrow.from_table(table)}[
+        mutations[1].description].categories == {groceries}
+
+
+def test_parquet_chunks_and_filters(mutations, tmpdir):
+    path = tmpdir / "mutations.parquet"
+    assert arrow.write_parquet(mutations[:-1], path, chunk_size=30) == 100
+    assert arrow.read_parquet(path) == set(mutations[:-1])
+
+    import pyarrow.parquet as pq
+    assert pq.ParquetFile(str(path)).metadata.num_row_groups == 4
+
+    selected = arrow.read_parquet(path, from_date=datetime.date(2018, 2, 1),
+                                  to_date=datetime.date(2018, 3, 1), accounts=[account2])
+    assert selected == {x for x in mutations[:-1] if x.account == account2 and
+                        x.date.month == 2}
+    # categories survive filtering
+    assert any(x.categories == {groceries} for x in selected)
+
+
+def test_columns_to_table():
+    reader = ABNAMROReader()
+    path = RESOURCE_PATH / "example_abn_export.TAB"
+    table = arrow.columns_to_table(reader.read_columns(path), reader)
+    assert arrow.from_table(table) == reader.read(path)
@@ -0,0 +1,101 @@
+import datetime
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from sitdown.balance import balance_series, find_gaps, reconstruct
+from sitdown.core import BankAccount
+from sitdown.plots import plot_balance
+from tests.factories import MutationFactory
+
+
+def make_chain(account, amounts_per_day, start_balance=Decimal("100.00"),
+               start_date=datetime.date(2019, 1, 1)):
+    """Consecutive mutations with balances that fit together
+
+    Parameters
+    ----------
+    amounts_per_day: List[List[Decimal]]
+        amounts for each consecutive day
+    """
+    mutations = []
+    balance = start_balance
+    for day, amounts in enumerate(amounts_per_day):
+        for amount in amounts:
+            mutations.append(MutationFactory(
+                account=account, amount=amount,
+                date=start_date + datetime.timedelta(days=day),
+                balance_before=balance, balance_after=balance + amount))
+            balance = balance + amount
+    return mutations
+
+
+@pytest.fixture
+def an_account():
+    return BankAccount(number="1234", description="current")
+
+
+def test_reconstruct(an_account):
+    mutations = make_chain(an_account, [[Decimal("10")], [], [Decimal("-5"),
+                                        Decimal("2.5")]])
+    series = reconstruct(an_account, mutations)
+    assert series.is_continuous
+    assert len(series) == 2
+    assert series.dates.dtype == np.dtype('datetime64[D]')
+    assert list(series.balances) == [11000, 10750]
+    assert series.at(datetime.date(2019, 1, 2)) == Decimal("110.00")
+    assert series.at(datetime.date(2018, 1, 1)) is None
+
+    daily = series.daily()
+    assert len(daily) == 3
+    assert list(daily.values()) == [110.0, 110.0, 107.5]
+
+
+def test_same_day_ordering(an_account):
+    """Mutations on the same day should be chained by balance, not by input order"""
+    mutations = make_chain(an_account, [[Decimal("1")],
+                                        [Decimal("10"), Decimal("-20"),
+                                         Decimal("30")]])
+    shuffled = [mutations[0], mutations[3], mutations[1], mutations[2]]
+    series = reconstruct(an_account, shuffled)
+    assert series.is_continuous
+    assert series.at(datetime.date(2019, 1, 2)) == Decimal("121.00")
+
+
+def test_gap_detection(an_account):
+    mutations = make_chain(an_account, [[Decimal("1")], [Decimal("2")],
+                                        [Decimal("4")], [Decimal("8")]])
+    del mutations[2]
+    gaps = find_gaps(mutations)
+    assert len(gaps) == 1
+    assert gaps[0].missing_amount == Decimal("4.00")
+    assert gaps[0].after.date == datetime.date(2019, 1, 2)
+    assert gaps[0].before.date == datetime.date(2019, 1, 4)
+
+
+def test_missing_balances(an_account):
+    mutations = make_chain(an_account, [[Decimal("1")], [Decimal("2")],
+                                        [Decimal("4")]])
+    mutations[0].balance_before = mutations[0].balance_after = None
+    mutations[2].balance_before = mutations[2].balance_after = None
+    series = reconstruct(an_account, mutations)
+    assert series.is_continuous
+    assert list(series.balances) == [10100, 10300, 10700]
+
+
+def test_multiple_accounts(an_account):
+    other = BankAccount(number="5678", description="savings")
+    mutations = make_chain(an_account, [[Decimal("1")]]) + \
+        make_chain(other, [[Decimal("2")], [Decimal("3")]])
+    per_account = balance_series(mutations)
+    assert list(per_account.keys()) == [an_account, other]
+    assert len(per_account[other]) == 2
+    assert len(reconstruct(an_account, []).dates) == 0
+
+
+def test_plot_balance(an_account):
+    mutations = make_chain(an_account, [[Decimal("1")], [Decimal("2")]])
+    to_plot = list(reversed(mutations))
+    plot_balance(to_plot)
+    assert to_plot == list(reversed(mutations))  # input should not be sorted
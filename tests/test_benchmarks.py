@@ -0,0 +1,55 @@
+import json
+
+from benchmarks.generators import generate_mutations, write_classifier_yaml, \
+    write_tab_file
+from benchmarks import tab_throughput
+from benchmarks.run import compare, main
+from sitdown.classifiers import string_match_classifier_from_yaml
+
+
+def test_generators(tmpdir):
+    path = tmpdir / "mutations.TAB"
+    assert write_tab_file(str(path), n_rows=10) > 0
+    lines = path.read().splitlines()
+    assert len(lines) == 10
+    assert all(len(x.split("\t")) == 8 for x in lines)
+
+    mutations = generate_mutations(10)
+    assert len(mutations) == 10
+    assert generate_mutations(10) == mutations  # seeded
+
+    write_classifier_yaml(str(tmpdir / "classifier.yaml"), n_rules=50)
+    with open(str(tmpdir / "classifier.yaml")) as f:
+        classifier = string_match_classifier_from_yaml(f)
+    classified = [classifier.classify(x) for x in mutations]
+    assert any(x is not None for x in classified)
+
+
+def test_compare():
+    baseline = {"classify": {"100": {"seconds": 1.0}}}
+    assert compare({"classify": {"100": {"seconds": 1.1}}}, baseline, 0.25) == []
+    assert len(compare({"classify": {"100": {"seconds": 2.0}}}, baseline, 0.25)) == 1
+    # errors and missing baselines are not regressions
+    assert compare({"classify": {"100": {"error": "x"}},
+                    "reader": {"100": {"seconds": 1.0}}}, baseline, 0.25) == []
+
+
+def test_run(tmpdir):
+    baseline = str(tmpdir / "baseline.json")
+    args = ["--sizes", "20", "--only", "classify", "month_set", "month_matrix",
+            "--workdir", str(tmpdir)]
+    assert main(args + ["--baseline", baseline, "--save-baseline"]) == 0
+    with open(baseline) as f:
+        results = json.load(f)["results"]
+    assert set(results) == {"classify", "month_set", "month_matrix"}
+    assert "seconds" in results["month_set"]["20"]
+
+    # generous tolerance, timings of tiny runs are noisy
+    output = str(tmpdir / "results.json")
+    assert main(args + ["--baseline", baseline, "--output", output,
+                        "--tolerance", "1000"]) == 0
+
+
+def test_tab_throughput():
+    results = tab_throughput.main(["--rows", "100", "--runs", "1"])
+    assert results["mmap read_columns()"] > 0
@@ -0,0 +1,126 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+import pytest
+
+from sitdown.cache import MutationCache, decode_mutations, encode_mutations, file_key
+from sitdown.classifiers import Category
+from sitdown.core import BankAccount
+from tests.factories import MutationFactory
+
+
+class CountingReader:
+    def __init__(self, mutations):
+        self.mutations = mutations
+        self.calls = 0
+
+    def read(self, input_file):
+        self.calls += 1
+        return self.mutations
+
+
+def test_file_key(tmpdir):
+    path = tmpdir / "a_file.TAB"
+    path.write("some content")
+    key = file_key(path)
+    assert key == file_key(path)
+    assert key != file_key(path, "extra")
+    path.write("some other content")
+    assert key != file_key(path)
+
+
+def test_mutation_cache(tmpdir, short_mutation_sequence):
+    path = tmpdir / "a_file.TAB"
+    path.write("some content")
+    cache = MutationCache(tmpdir / "cache")
+    reader = CountingReader(short_mutation_sequence)
+
+    mutations, from_cache = cache.read(path, reader)
+    assert not from_cache
+    mutations, from_cache = cache.read(path, reader)
+    assert from_cache
+    assert mutations == short_mutation_sequence
+    assert reader.calls == 1
+
+    assert len(cache.entries()) == 1
+    assert cache.size() > 0
+    assert cache.clear() == 1
+    assert cache.get(file_key(path, "CountingReader")) is None
+
+
+def test_mutation_cache_default_dir(tmpdir, monkeypatch):
+    monkeypatch.setitem(os.environ, "SITDOWN_CACHE_DIR", str(tmpdir / "env_cache"))
+    assert MutationCache().path == tmpdir / "env_cache"
+
+
+def test_encode_decode_mutations():
+    sports = Category("sports")
+    gym = Category("gym", parent=sports)
+    account = BankAccount(number="123", description="main")
+    mutations = {
+        MutationFactory(amount=Decimal("-12.50"), account=account,
+                        balance_before=Decimal("100.00"),
+                        balance_after=Decimal("87.50"), categories={gym}),
+        MutationFactory(amount=3.25, account=account, opposite_account="NL01BANK0123",
+                        balance_before=None, balance_after=None),
+        MutationFactory(amount=Decimal("1"), account=account,
+                        opposite_account=BankAccount(number="456"), categories=set())}
+
+    decoded = decode_mutations(encode_mutations(mutations))
+    assert decoded == mutations
+    by_amount = {x.amount: x for x in decoded}
+    assert type(by_amount[3.25].amount) is float
+    assert type(by_amount[Decimal("-12.50")].amount) is Decimal
+    assert by_amount[Decimal("-12.50")].categories == {gym}
+    assert list(by_amount[Decimal("-12.50")].categories)[0].parent == sports
+    assert by_amount[Decimal("1")].opposite_account == BankAccount(number="456")
+
+    with pytest.raises(ValueError):
+        decode_mutations(b"something else")
+
+
+def test_cache_key_depends_on_content_only(tmpdir):
+    cache = MutationCache(tmpdir / "cache")
+    original = tmpdir / "a_file.TAB"
+    original.write("some content")
+    copy = tmpdir / "copy.TAB"
+    copy.write("some content")
+    assert cache.key(original) == cache.key(copy)
+    assert cache.key(original) != cache.key(original, "extra")
+
+    original.write("changed")
+    assert cache.key(original) != cache.key(copy)
+
+
+def test_cache_evicts_least_recently_used(tmpdir, short_mutation_sequence):
+    cache = MutationCache(tmpdir / "cache", max_size=10 ** 9)
+    for key in ("a", "b", "c"):
+        cache.put(key, short_mutation_sequence)
+    entry_size = cache.size() // 3
+    for age, key in enumerate(("a", "b", "c")):  # a is oldest
+        os.utime(cache._entry(key), (1000 + age, 1000 + age))
+    assert cache.get("a") is not None  # using a makes b the oldest
+
+    assert cache.evict(max_size=2 * entry_size) == 1
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+
+def put_many(cache_dir, mutations, worker):
+    cache = MutationCache(cache_dir, max_size=4000)
+    for i in range(20):
+        cache.put(f"{worker}_{i % 5}", mutations)
+        cache.get(f"{1 - worker}_{i % 5}")
+
+
+def test_cache_concurrent_access(tmpdir, short_mutation_sequence):
+    cache_dir = str(tmpdir / "cache")
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        list(pool.map(put_many, [cache_dir] * 2, [short_mutation_sequence] * 2,
+                      [0, 1]))
+    cache = MutationCache(cache_dir)
+    assert 0 < cache.size() <= 4000
+    assert not list(cache.path.glob("*.tmp"))
+    assert all(cache.get(x.name[:-len(cache.SUFFIX)]) == short_mutation_sequence
+               for x in cache.entries())
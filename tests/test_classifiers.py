@@ -3,8 +3,8 @@ from tests import RESOURCE_PATH
 
 import pytest
 
-from sitdown.classifiers import Category, StringMatchClassifier, \
-    string_match_classifier_from_yaml
+from sitdown.classifiers import Category, DescriptionIndex, RulesDiff, \
+    StringMatchClassifier, string_match_classifier_from_yaml
 from tests.factories import MutationFactory
 
 
@@ -93,3 +93,42 @@ def test_classifier_definition():
     assert classifier.mapping['kees'].parent.name == 'Pay'
 
 
+
+
+def test_description_index():
+    mutations = [MutationFactory(description=x) for x in
+                 ["AH  betaling 123", "ah betaling 456", "Johns Bakery", "NS reizen"]]
+    index = DescriptionIndex(mutations)
+    assert len(index) == 4
+    assert index.matching("AH Betaling") == mutations[:2]
+    assert index.matching("bakery") == [mutations[2]]
+    assert index.matching("ns") == mutations[2:]  # shorter than a trigram
+    assert index.matching("bakery&co") == []
+
+
+def test_rules_diff(some_categories):
+    cat = some_categories
+    old = StringMatchClassifier({"sportcity": cat["gym"], "zwembad": cat["pool_a"],
+                                 "de mirandabad": cat["pool_b"]})
+    new = StringMatchClassifier({"sportcity": cat["gym"], "Zwembad": cat["pool_b"],
+                                 "basic fit": cat["gym"]})
+    diff = RulesDiff(old, new)
+    assert set(diff.added) == {"basic fit"}
+    assert set(diff.removed) == {"de mirandabad"}
+    assert set(diff.moved) == {"zwembad"}
+    assert not RulesDiff(old, old)
+
+    mutations = [MutationFactory(description=x) for x in
+                 ["Sportcity 12", "Zwembad west", "De Mirandabad", "Basic Fit 3",
+                  "Albert Heijn"]]
+    transfer = Category("internal transfer")
+    for mutation in mutations:
+        mutation.categories = old.classify(mutation)
+    mutations[2].categories = mutations[2].categories | {transfer}
+
+    changed = diff.apply(DescriptionIndex(mutations))
+    assert set(changed) == set(mutations[1:4])
+    assert [x.categories for x in mutations] == [
+        {cat["gym"]}, {cat["pool_b"]}, {transfer}, {cat["gym"]}, set()]
+    assert all(x.categories == new.classify(x) | ({transfer} if x is mutations[2]
+                                                   else set()) for x in mutations)
@@ -1,18 +1,157 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import datetime
+from decimal import Decimal
 
+import pytest
 from click.testing import CliRunner
-from sitdown import cli
+
+from sitdown import cli, readers
+from tests import RESOURCE_PATH
+from tests.factories import MutationFactory
+
+
+@pytest.fixture
+def mock_read_file(monkeypatch):
+    """Replace parsing of .TAB files by generated mutations. Records calls"""
+    calls = []
+
+    def read_file(input_file):
+        calls.append(input_file)
+        return {MutationFactory(description="Salaris", amount=Decimal("100.00"),
+                                date=datetime.date(2018, 1, 5)),
+                MutationFactory(description="Albert Heijn", amount=Decimal("-10.50"),
+                                date=datetime.date(2018, 2, 5)),
+                MutationFactory(description="something", amount=Decimal("-1.00"),
+                                date=datetime.date(2018, 2, 6))}
+
+    monkeypatch.setattr(readers, "read_file", read_file)
+    return calls
+
+
+@pytest.fixture
+def an_input_file(tmpdir):
+    path = tmpdir / "mutations.TAB"
+    path.write("content does not matter, parsing is mocked")
+    return str(path)
+
+
+def invoke(tmpdir, *args):
+    runner = CliRunner()
+    result = runner.invoke(cli.main, ["--cache-dir", str(tmpdir / "cache"),
+                                      "-p", "1"] + list(args))
+    assert result.exit_code == 0, result.output
+    return result
 
 
 def test_command_line_interface():
     """Test the CLI."""
     runner = CliRunner()
-    result = runner.invoke(cli.main)
-    assert result.exit_code == 0
-    assert 'sitdown.cli.main' in result.output
     help_result = runner.invoke(cli.main, ['--help'])
     assert help_result.exit_code == 0
-    assert '--help  Show this message and exit.' in help_result.output
+    assert '--help' in help_result.output
+    for command in ["ingest", "classify", "report", "cache"]:
+        assert command in help_result.output
+
+
+def test_ingest_uses_cache(tmpdir, mock_read_file, an_input_file):
+    result = invoke(tmpdir, "ingest", an_input_file)
+    assert "3 mutations in total" in result.output
+    assert "0 from cache" in result.output
+    assert "ingest took" in result.output
+    assert len(mock_read_file) == 1
+
+    result = invoke(tmpdir, "ingest", an_input_file)
+    assert "1 from cache" in result.output
+    assert len(mock_read_file) == 1  # not parsed again
+
+
+def test_report_monthly(tmpdir, mock_read_file, an_input_file):
+    result = invoke(tmpdir, "report", "monthly", an_input_file)
+    assert "2018/2" in result.output
+    assert "-11.50" in result.output
+
+
+def test_report_currencies(tmpdir, monkeypatch, an_input_file):
+    def read_file(input_file):
+        return {MutationFactory(description="Albert Heijn", amount=Decimal("-10.50"),
+                                date=datetime.date(2018, 2, 5)),
+                MutationFactory(description="Albert Heijn", amount=Decimal("-4.00"),
+                                date=datetime.date(2018, 2, 5), currency="USD")}
+
+    monkeypatch.setattr(readers, "read_file", read_file)
+    lines = invoke(tmpdir, "report", "monthly", an_input_file).output.splitlines()
+    assert lines[1].split()[:2] == ["month", "currency"]
+    assert lines[3].split()[:5] == ["2018/2", "EUR", "0.00", "-10.50", "-10.50"]
+    assert lines[4].split()[:5] == ["2018/2", "USD", "0.00", "-4.00", "-4.00"]
+
+    rates = tmpdir / "rates.csv"
+    rates.write("date,currency,rate\n2018-01-01,USD,0.5\n")
+    result = invoke(tmpdir, "report", "monthly", "--rates", str(rates), an_input_file)
+    assert "-12.50" in result.output
+
+    classifier_file = str(RESOURCE_PATH / "classifier_definition.yaml")
+    result = invoke(tmpdir, "report", "categories", classifier_file, an_input_file)
+    assert "USD" in result.output and "-4.00" in result.output
+
+
+def test_classify_and_report_categories(tmpdir, mock_read_file, an_input_file):
+    classifier_file = str(RESOURCE_PATH / "classifier_definition.yaml")
+    result = invoke(tmpdir, "classify", classifier_file, an_input_file)
+    assert "albert_heijn" in result.output
+    assert "<unclassified>" in result.output
+
+    result = invoke(tmpdir, "report", "categories", classifier_file, an_input_file)
+    assert "-10.50" in result.output
+    assert "Pay" in result.output
+    assert len(mock_read_file) == 1  # parsed result was reused from cache
+
+
+def test_classify_parses_uncached_files_together(tmpdir, mock_read_file, monkeypatch):
+    input_files = []
+    for name in ("a", "b", "c"):
+        path = tmpdir / f"{name}.TAB"
+        path.write(name)
+        input_files.append(str(path))
+    batches = []
+
+    def load_per_file(context, files, load=cli.load_per_file):
+        batches.append(list(files))
+        return load(context, files)
+
+    monkeypatch.setattr(cli, "load_per_file", load_per_file)
+    classifier_file = str(RESOURCE_PATH / "classifier_definition.yaml")
+    invoke(tmpdir, "classify", classifier_file, input_files[0])
+    result = invoke(tmpdir, "classify", classifier_file, *input_files)
+    assert batches == [input_files[:1], input_files[1:]]
+    assert sorted(mock_read_file) == input_files
+    assert "albert_heijn            3" in result.output
+
+    # each file was cached separately
+    invoke(tmpdir, "classify", classifier_file, *input_files[1:])
+    assert len(batches) == 2
+
+
+def test_cache_commands(tmpdir, mock_read_file, an_input_file):
+    invoke(tmpdir, "ingest", an_input_file)
+    assert "1 entries" in invoke(tmpdir, "cache", "info").output
+    assert "Removed 1 entries" in invoke(tmpdir, "cache", "clear").output
+    assert "0 entries" in invoke(tmpdir, "cache", "info").output
+    result = CliRunner().invoke(cli.main, ["--no-cache", "cache", "info"])
+    assert "disabled" in result.output
+
+
+def test_format_table():
+    table = cli.format_table(["name", "value"], [["a", 1], ["bb", 22]])
+    assert table.splitlines()[2] == "a         1"
 
 
+def test_profile(tmpdir, mock_read_file, an_input_file):
+    classifier_file = str(RESOURCE_PATH / "classifier_definition.yaml")
+    result = invoke(tmpdir, "--profile", "classify", classifier_file, an_input_file)
+    assert "StringMatchClassifier.classify" in result.output
+    stage_line = next(x for x in result.output.splitlines()
+                      if x.startswith("StringMatchClassifier.classify"))
+    assert stage_line.split()[1] == "1"  # one call for all mutations
+    assert stage_line.split()[3] == "3"
+    assert "peak MB" in result.output
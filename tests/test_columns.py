@@ -0,0 +1,145 @@
+import datetime
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from sitdown.columns import DescriptionSearch, MutationColumns, categories, \
+    line_chunks, parse_minor_units, parse_yyyymmdd, tab_fields
+from sitdown.readers import ABNAMROReader, ReaderException
+from tests import RESOURCE_PATH
+from tests.factories import MutationFactory
+
+
+def fields(*texts, separator=b"|"):
+    """uint8 buffer with texts separated, and start and end offset of each"""
+    raw = separator.join(x.encode() for x in texts)
+    starts, ends, position = [], [], 0
+    for text in texts:
+        starts.append(position)
+        ends.append(position + len(text.encode()))
+        position = ends[-1] + len(separator)
+    return np.frombuffer(raw, dtype=np.uint8), np.array(starts), np.array(ends)
+
+
+def test_parse_minor_units():
+    values, bad = parse_minor_units(*fields(
+        "-3,15", "116,00", "1.234,5", "7", "-0,01", "12,345", "abc", "", "1,2,3"))
+    assert values[:5].tolist() == [-315, 11600, 123450, 700, -1]
+    assert bad.tolist() == [False] * 5 + [True] * 4
+
+    values, bad = parse_minor_units(*fields("1,234.56", "-0.5"),
+                                    decimal_separator=b".")
+    assert values.tolist() == [123456, -50]
+
+    values, bad = parse_minor_units(*fields(" -1,00", "1,00- ", "1-00", "--1", "1,0-0",
+                                            "-1-"))
+    assert values[:2].tolist() == [-100, -100]
+    assert bad.tolist() == [False] * 2 + [True] * 4
+
+
+def test_parse_yyyymmdd():
+    buffer, starts, _ = fields("20160715", "20200229", "20190229", "2016071x",
+                               "20161301")
+    dates, bad = parse_yyyymmdd(buffer, starts)
+    assert dates[:2].tolist() == [datetime.date(2016, 7, 15),
+                                  datetime.date(2020, 2, 29)]
+    assert bad.tolist() == [False, False, True, True, True]
+
+
+def test_categories():
+    codes, values = categories(*fields("b", "a", "bb", "b", "a"))
+    assert values == ["b", "a", "bb"]
+    assert codes.tolist() == [0, 1, 2, 0, 1]
+
+
+def test_tab_fields():
+    raw = b"a\tb\tc\td\r\n\nshort\tline\nx\ty\tz\twith\ttab"
+    view = np.frombuffer(raw, dtype=np.uint8)
+    starts, ends, line_starts, bad = tab_fields(view, 0, len(raw), 4)
+    texts = [[raw[s:e] for s, e in zip(*x)] for x in zip(starts, ends)]
+    assert texts[0] == [b"a", b"b", b"c", b"d"]
+    assert texts[2] == [b"x", b"y", b"z", b"with\ttab"]
+    assert bad.tolist() == [False, True, False]
+    assert line_starts.tolist() == [0, 10, 21]
+
+
+def test_line_chunks():
+    raw = b"one\ntwo\nthree\n"
+    assert list(line_chunks(raw, 5)) == [(0, 8), (8, 14)]
+    assert list(line_chunks(raw, 100)) == [(0, 14)]
+    assert list(line_chunks(b"", 100)) == [(0, 0)]
+
+
+def test_read_columns():
+    reader = ABNAMROReader()
+    columns = reader.read_columns(RESOURCE_PATH / "example_abn_export.TAB")
+    assert len(columns) == 5
+    assert columns.accounts == ["128456789"]
+    assert columns.amounts.tolist() == [11600, -12100, -4500, -10900, -1680]
+    assert columns.amount_array().sum() == Decimal("-175.80")
+    assert columns.description(2).startswith("BEA   NR:HXY0D9")
+    assert "KOSTEN ¤0,15" in columns.descriptions()[4]
+
+    first = sorted(columns.mutations(reader))[0]
+    assert first.date == datetime.date(2016, 7, 1)
+    assert first.amount == Decimal("-45.00")
+    assert first.balance_after == Decimal("1096.02")
+
+    # parsing in small chunks gives the same result
+    reader.CHUNK_SIZE = 100
+    chunked = reader.read_columns(RESOURCE_PATH / "example_abn_export.TAB")
+    assert chunked.amounts.tolist() == columns.amounts.tolist()
+    assert chunked.descriptions() == columns.descriptions()
+
+
+def test_read_columns_matches_read():
+    reader = ABNAMROReader()
+    path = RESOURCE_PATH / "example_abn_export.TAB"
+    columns = sorted(reader.read_columns(path).mutations(reader))
+    objects = sorted(ABNAMROReader().read(path))
+    assert len(columns) == len(objects)
+    # read() gives floats, the columns path exact Decimals of the same values
+    assert all(type(x.amount) == Decimal for x in columns)
+    assert all(type(x.amount) == float for x in objects)
+    for fast, slow in zip(columns, objects):
+        assert (fast.date, fast.description, fast.account, fast.opposite_account) == \
+            (slow.date, slow.description, slow.account, slow.opposite_account)
+        assert (fast.amount, fast.balance_before, fast.balance_after) == \
+            tuple(Decimal(str(x)).quantize(Decimal("0.01")) for x in
+                  (slow.amount, slow.balance_before, slow.balance_after))
+
+
+def test_read_columns_errors(tmpdir):
+    path = tmpdir / "bad.TAB"
+    path.write_binary(b"1\tEUR\t20160715\t1,00\t2,00\t20160715\t1,00\tok\n"
+                      b"1\tEUR\t20160715\t1,00\tbroken\t20160715\t1,00\tnot ok\n")
+    with pytest.raises(ReaderException, match="line 2"):
+        ABNAMROReader().read_columns(str(path))
+
+    empty = tmpdir / "empty.TAB"
+    empty.write_binary(b"")
+    assert len(ABNAMROReader().read_columns(str(empty))) == 0
+
+
+def test_from_mutations():
+    mutations = [MutationFactory(description=x, amount=Decimal("-1.25"),
+                                 date=datetime.date(2019, 1, 2)) for x in ["één", "", "AH"]]
+    columns = MutationColumns.from_mutations(mutations)
+    assert len(columns) == 3
+    assert columns.descriptions() == ["één", "", "AH"]
+    assert columns.amounts.tolist() == [-125] * 3
+    assert columns.dates[0] == np.datetime64("2019-01-02")
+    assert columns.accounts == [mutations[0].account.number]
+
+
+def test_description_search():
+    mutations = [MutationFactory(description=x) for x in
+                 ["Albert Heijn", "", "HEIJNS bakery", "ns reizen", "Café"]]
+    search = DescriptionSearch(MutationColumns.from_mutations(mutations))
+    assert search.find("heijn").tolist() == [0, 2]
+    assert search.find("heijns").tolist() == [2]  # narrowed down from 'heijn'
+    assert search.find("nh").tolist() == []  # not across descriptions
+    assert search.find("ns").tolist() == [2, 3]
+    assert search.find("café").tolist() == [4]
+    assert search.find("").tolist() == [0, 1, 2, 3, 4]
@@ -1,9 +1,10 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import datetime
+import pickle
 from decimal import Decimal
 
-from sitdown.core import BankAccount, MutationSet
+from sitdown.core import BankAccount, Mutation, MutationSet
 from tests.factories import MutationFactory
 from tests import RESOURCE_PATH
 
@@ -28,3 +29,43 @@ def test_mutation_set(tmpdir, short_mutation_sequence):
         loaded_set = MutationSet.load(f)
 
     assert loaded_set.mutations == org_set.mutations
+
+
+def a_mutation(**kwargs):
+    values = dict(amount=Decimal("12.50"), date=datetime.date(2018, 1, 5),
+                  account=BankAccount(number="128456789", description="mine"),
+                  currency="EUR", opposite_account="NL01BANK0123456789",
+                  description="Salaris", balance_before=Decimal("100.00"),
+                  balance_after=Decimal("112.50"))
+    values.update(kwargs)
+    return Mutation(**values)
+
+
+def test_fingerprint_is_stable():
+    # a fixed value: fingerprints are stored in caches and compared across processes
+    assert a_mutation().fingerprint().hex() == "b78d9ea71b5139a17124556502f64d34"
+
+
+def test_fingerprint_identity():
+    mutation = a_mutation()
+    # same amount as float, same account under another description
+    assert a_mutation(amount=12.5, account=BankAccount(number="128456789")) == mutation
+    assert a_mutation(description="Other") != mutation
+    assert mutation.fingerprint() == pickle.loads(pickle.dumps(mutation)).fingerprint()
+
+
+def test_fingerprint_is_reset_on_change():
+    mutation = a_mutation()
+    before = mutation.fingerprint()
+    mutation.categories = {"ignored"}
+    assert mutation.fingerprint() == before
+    mutation.amount = Decimal("13.00")
+    assert mutation.fingerprint() != before
+    assert mutation.fingerprint() == a_mutation(amount=Decimal("13.00")).fingerprint()
+
+
+def test_equal_fingerprints_still_compare_fields():
+    mutation, other = a_mutation(), a_mutation(description="Other")
+    other.__dict__["_fingerprint"] = mutation.fingerprint()  # forced collision
+    assert hash(mutation) == hash(other)
+    assert mutation != other
@@ -0,0 +1,150 @@
+import datetime
+import random
+from decimal import Decimal
+
+import pytest
+
+from sitdown.classifiers import Category
+from sitdown.core import BankAccount
+from sitdown.cube import UNCLASSIFIED, MutationCube, most_specific, period_label
+from sitdown.currency import CurrencyError, RateTable
+from sitdown.filters import CategoryFilter
+from tests.factories import MutationFactory
+
+checking = BankAccount(number="625381173")
+savings = BankAccount(number="123456789")
+shopping = Category("shopping")
+groceries = Category("groceries", parent=shopping)
+clothes = Category("clothes", parent=shopping)
+rent = Category("rent")
+
+
+def mutation(amount, date, account=checking, categories=(), currency="EUR"):
+    return MutationFactory(amount=Decimal(amount), date=date, account=account,
+                           currency=currency, categories=set(categories))
+
+
+@pytest.fixture
+def mutations():
+    return [mutation("-20.00", datetime.date(2019, 1, 3), categories=[groceries]),
+            mutation("-30.50", datetime.date(2019, 1, 20), categories=[clothes]),
+            mutation("-950.00", datetime.date(2019, 2, 1), categories=[rent]),
+            mutation("-10.25", datetime.date(2019, 4, 2),
+                     categories=[groceries, shopping]),
+            mutation("100.00", datetime.date(2019, 4, 5), account=savings),
+            mutation("-5.00", datetime.date(2020, 1, 1), account=savings,
+                     categories=[groceries])]
+
+
+def test_most_specific():
+    assert most_specific({groceries, shopping}) == [groceries]
+    assert sorted(x.name for x in most_specific({groceries, clothes, rent})) == \
+        ["clothes", "groceries", "rent"]
+
+
+def test_period_label():
+    assert period_label(2019 * 12 + 2, "month") == "2019/3"
+    assert period_label((2019 * 12 + 4) // 3, "quarter") == "2019 Q2"
+    assert period_label(2019, "year") == "2019"
+
+
+def test_cube(mutations):
+    cube = MutationCube(mutations)
+    assert len(cube) == 6
+    assert cube.total() == Decimal("-915.75")
+    assert cube.total(layer="count") == 6
+    assert cube.total(layer="in") == Decimal("100.00")
+    assert cube.total(account=savings) == Decimal("95.00")
+    assert cube.total(account=BankAccount(number="1")) == 0
+    assert cube.total(category=shopping) == Decimal("-65.75")
+    assert cube.total(category=UNCLASSIFIED) == Decimal("100.00")
+    assert cube.total(start=datetime.date(2019, 2, 15),
+                      end=datetime.date(2019, 5, 1)) == Decimal("-860.25")
+    assert cube.month_range() == (datetime.date(2019, 1, 1), datetime.date(2020, 1, 1))
+    with pytest.raises(ValueError):
+        cube.total(layer="average")
+
+
+def test_group(mutations):
+    cube = MutationCube(mutations)
+    assert cube.group(by=["category"], category_level=0) == {
+        (shopping,): Decimal("-65.75"), (rent,): Decimal("-950.00"),
+        (UNCLASSIFIED,): Decimal("100.00")}
+    assert list(cube.group(by=["period"], period="quarter",
+                           category=shopping).items()) == [
+        (("2019 Q1",), Decimal("-50.50")), (("2019 Q2",), Decimal("-10.25")),
+        (("2020 Q1",), Decimal("-5.00"))]
+    assert cube.group(by=["account", "period"], period="year", layer="count") == {
+        (checking, "2019"): 4, (savings, "2019"): 1, (savings, "2020"): 1}
+    assert cube.group(by=[]) == {(): Decimal("-915.75")}
+    with pytest.raises(ValueError):
+        cube.group(by=["currency"])
+
+
+def test_unrelated_categories():
+    mutations = [mutation("-10.01", datetime.date(2019, 1, 3), categories=[rent, clothes]),
+                 mutation("-5.00", datetime.date(2019, 1, 4))]
+    cube = MutationCube(mutations)
+    assert cube.total() == Decimal("-15.01")
+    assert cube.total(layer="count") == 2
+    assert cube.group(by=["account"]) == {(checking,): Decimal("-15.01")}
+    assert cube.group(by=["period"], layer="count") == {("2019/1",): 2}
+    # split exactly, the remaining cent goes to the first category by name
+    assert cube.total(category=clothes) == Decimal("-5.01")
+    assert cube.total(category=rent) == Decimal("-5.00")
+    assert sum(cube.group(by=["category"]).values()) == Decimal("-15.01")
+
+    each = MutationCube(mutations, allocation="each")
+    assert each.total(category=clothes) == each.total(category=rent) == Decimal("-10.01")
+    assert each.total() == Decimal("-15.01")
+    assert each.total(layer="count") == 2
+    first = MutationCube(mutations, allocation="first")
+    assert first.total(category=clothes) == Decimal("-10.01")
+    assert first.total(category=rent) == 0
+    with pytest.raises(ValueError):
+        MutationCube(mutations, allocation="random")
+
+
+def test_sibling_categories():
+    cube = MutationCube([mutation("-5.00", datetime.date(2019, 1, 3),
+                                  categories=[groceries, clothes])])
+    assert cube.total() == Decimal("-5.00")
+    assert cube.total(category=shopping) == Decimal("-5.00")
+    assert cube.group(by=["category"], category_level=0) == {(shopping,): Decimal("-5.00")}
+    assert cube.total(category=groceries) == Decimal("-2.50")
+    assert cube.total(layer="count") == 1
+
+
+def test_group_matches_filters():
+    random.seed(1)
+    categories = [groceries, clothes, rent, shopping]
+    mutations = [mutation(f"{random.randint(-10000, 10000) / 100:.2f}",
+                          datetime.date(2018, 1, 1) + datetime.timedelta(days=i),
+                          account=random.choice([checking, savings]),
+                          categories=random.sample(categories, random.randint(0, 1)))
+                 for i in range(500)]
+    cube = MutationCube(mutations)
+    for category in categories:
+        for account in (checking, savings):
+            expected = sum(x.amount for x in CategoryFilter(category).apply(mutations)
+                           if x.account == account)
+            assert cube.total(account=account, category=category) == expected
+    by_category = cube.group(by=["category"], category_level=0)
+    assert sum(by_category.values()) == sum(x.amount for x in mutations)
+
+
+def test_currencies():
+    mutations = [mutation("-10.00", datetime.date(2019, 1, 3)),
+                 mutation("-10.00", datetime.date(2019, 1, 3), currency="USD")]
+    with pytest.raises(CurrencyError):
+        MutationCube(mutations)
+    rates = RateTable(rates={"USD": [(datetime.date(2019, 1, 1), 0.9)]})
+    assert MutationCube(mutations, rates=rates).total() == Decimal("-19.00")
+
+
+def test_empty():
+    cube = MutationCube([])
+    assert len(cube) == 0
+    assert cube.total() == 0
+    assert cube.group() == {}
+    assert cube.month_range() is None
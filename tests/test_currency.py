@@ -0,0 +1,71 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+
+from sitdown.currency import CurrencyError, RateTable, normalize_currency, \
+    sums_per_currency
+from sitdown.filters import CatchAllFilter, StringFilter
+from sitdown.views import MonthMatrix, MonthSet
+from tests.factories import MutationFactory
+
+
+@pytest.fixture
+def rates_file(tmpdir):
+    path = tmpdir / "rates.csv"
+    path.write("date,currency,rate\n"
+               "2019-01-02,USD,0.80\n"
+               "2019-01-04,USD,0.90\n"
+               "2019-01-02,GBP,1.10\n")
+    return path
+
+
+@pytest.fixture
+def mutations():
+    return [MutationFactory(amount=Decimal("10.00"), currency="EURO",
+                            date=datetime.date(2019, 1, 3), description="a"),
+            MutationFactory(amount=Decimal("10.00"), currency="USD",
+                            date=datetime.date(2019, 1, 3), description="b"),
+            MutationFactory(amount=Decimal("-10.00"), currency="USD",
+                            date=datetime.date(2019, 1, 5), description="c"),
+            MutationFactory(amount=Decimal("1.01"), currency="gbp",
+                            date=datetime.date(2019, 2, 1), description="d")]
+
+
+def test_rate_table(rates_file):
+    rates = RateTable.load(rates_file)
+    assert RateTable.load(rates_file) is rates  # read once
+    assert rates.currencies() == ["EUR", "GBP", "USD"]
+    dates = [datetime.date(2019, 1, x).toordinal() for x in (2, 3, 4, 31)]
+    assert list(rates.rate("usd", dates)) == [0.8, 0.8, 0.9, 0.9]  # as-of
+    assert list(rates.convert([100, 100, 100], ["USD", "EURO", "GBP"],
+                              dates[:3])) == [80, 100, 110]
+    with pytest.raises(CurrencyError):
+        rates.rate("USD", [datetime.date(2019, 1, 1).toordinal()])
+    with pytest.raises(CurrencyError):
+        rates.rate("JPY", dates)
+
+
+def test_views_per_currency(mutations, rates_file):
+    assert normalize_currency(" euro") == "EUR"
+    assert sums_per_currency(mutations) == {"EUR": Decimal("10.00"),
+                                            "GBP": Decimal("1.01"),
+                                            "USD": Decimal("0.00")}
+    month_set = MonthSet(mutations)
+    with pytest.raises(CurrencyError):
+        month_set.sums()
+    assert month_set.bins()[0].sums_per_currency() == {"EUR": Decimal("10.00"),
+                                                       "USD": Decimal("0.00")}
+
+    rates = RateTable.load(rates_file)
+    converted = MonthSet(mutations, rates=rates)
+    # 10 EUR + 10 USD at 0.80 - 10 USD at 0.90
+    assert converted.sums() == [Decimal("9.00"), Decimal("1.11")]
+    assert converted.get_series().sums() == converted.sums()
+
+    filtered = [x.get_filtered_data(mutations) for x in
+                (StringFilter("a"), CatchAllFilter("rest"))]
+    with pytest.raises(CurrencyError):
+        MonthMatrix(filtered).matrix()
+    assert MonthMatrix(filtered, rates=rates).minor_units().tolist() == \
+        [[1000, 0], [900, 111]]
@@ -0,0 +1,129 @@
+import datetime
+import gc
+from decimal import Decimal
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+from matplotlib.backend_bases import ResizeEvent
+
+from sitdown.core import BankAccount
+from sitdown.downsample import minmax_indices, lttb_indices, downsample, \
+    PlotCache, DownsampledLine, bucket_edges, thinned_ticks
+from sitdown.plots import plot_balance
+from sitdown.views import MonthSet
+from tests.factories import MutationFactory
+
+
+@pytest.fixture
+def noisy_series():
+    x = np.arange(10000)
+    y = np.sin(x / 500) * 100 + np.random.RandomState(42).normal(size=len(x))
+    y[1234] = 1000  # a peak that should survive downsampling
+    return x, y
+
+
+def test_minmax_keeps_extremes(noisy_series):
+    x, y = noisy_series
+    indices = minmax_indices(y, 100)
+    assert len(indices) <= 200
+    assert 1234 in indices
+    assert np.argmin(y) in indices
+    assert list(indices) == sorted(indices)
+    assert list(minmax_indices([1, 2, 3], 100)) == [0, 1, 2]
+
+
+def test_lttb(noisy_series):
+    x, y = noisy_series
+    indices = lttb_indices(x, y, 300)
+    assert len(indices) == 300
+    assert indices[0] == 0 and indices[-1] == len(x) - 1
+    assert 1234 in indices
+    assert all(np.diff(indices) > 0)
+
+    dates = np.arange(np.datetime64('2000-01-01'), np.datetime64('2010-01-01'))
+    assert len(lttb_indices(dates, np.arange(len(dates)), 50)) == 50
+
+
+def test_downsample(noisy_series):
+    x, y = noisy_series
+    for method in ("minmax", "lttb"):
+        x_out, y_out = downsample(x, y, 500, method=method)
+        assert len(x_out) <= 500
+        assert len(x_out) == len(y_out)
+    with pytest.raises(ValueError):
+        downsample(x, y, 500, method="unknown")
+
+
+def test_buckets_and_ticks():
+    assert list(bucket_edges(10, 3)) == [0, 3, 6]
+    assert list(bucket_edges(2, 5)) == [0, 1]
+    assert list(thinned_ticks(10, 4)) == [0, 3, 6, 9]
+
+
+def test_plot_cache():
+    cache = PlotCache(max_size=2)
+    calls = []
+
+    def compute(value):
+        calls.append(value)
+        return value
+
+    assert cache.get("a", lambda: compute(1)) == 1
+    assert cache.get("a", lambda: compute(2)) == 1
+    cache.get("b", lambda: compute(3))
+    cache.get("c", lambda: compute(4))
+    assert len(cache) == 2
+    assert calls == [1, 3, 4]
+
+
+def test_downsampled_line(noisy_series):
+    x, y = noisy_series
+    _, ax = plt.subplots(figsize=(4, 3), dpi=100)
+    line = DownsampledLine(ax, x, y)
+    assert len(line.line.get_xdata()) < 400
+    line.update()
+    assert len(line.cache) == 1  # same width, served from cache
+
+
+def test_plot_balance_downsampled():
+    account = BankAccount(number="1234")
+    start = datetime.date(2000, 1, 1)
+    mutations = [MutationFactory(account=account, amount=Decimal(1),
+                                 date=start + datetime.timedelta(days=i),
+                                 balance_before=Decimal(i),
+                                 balance_after=Decimal(i + 1))
+                 for i in range(3000)]
+    _, ax = plt.subplots(figsize=(4, 3), dpi=100)
+    plot_balance(mutations, ax=ax, downsample="lttb")
+    assert len(ax.lines[0].get_xdata()) < 400
+
+
+def test_plot_balance_downsampled_resize():
+    account = BankAccount(number="1234")
+    start = datetime.date(2000, 1, 1)
+    mutations = [MutationFactory(account=account, amount=Decimal(1),
+                                 date=start + datetime.timedelta(days=i),
+                                 balance_before=Decimal(i),
+                                 balance_after=Decimal(i + 1))
+                 for i in range(3000)]
+    fig, ax = plt.subplots(figsize=(4, 3), dpi=100)
+    plot_balance(mutations, ax=ax, downsample="minmax")
+    before = len(ax.lines[0].get_xdata())
+    gc.collect()  # nothing but the canvas refers to the downsampled line
+    fig.set_size_inches(12, 3)
+    fig.canvas.callbacks.process("resize_event", ResizeEvent("resize_event", fig.canvas))
+    assert len(ax.lines[0].get_xdata()) > before
+
+
+def test_month_set_plot_downsampled():
+    mutations = [MutationFactory(date=datetime.date(1990 + i // 12, i % 12 + 1, 1))
+                 for i in range(360)]
+    month_set = MonthSet(mutations)
+    _, ax = plt.subplots(figsize=(2, 2), dpi=100)
+    month_set.plot(ax, downsample=True)
+    assert len(ax.patches) < 360
+    assert len(ax.get_xticks()) < 10
+    _, ax = plt.subplots(figsize=(2, 2), dpi=100)
+    month_set.plot(ax)
+    assert len(ax.patches) == 360
@@ -86,3 +86,20 @@ def test_filter():
         Filter(description="some description")
 
 
+
+
+def test_filter_matches(mutation_sequence_with_set_descriptions):
+    """Checking single mutations should give the same result as filtering sets"""
+    mutations = mutation_sequence_with_set_descriptions
+    account = list(mutations)[0].account
+    parent = StringFilter(string_to_match="alert!")
+    filters = [StringFilter(string_to_match="SUPER SHOP", parent=parent),
+               AmountFilter(from_amount=100, to_amount=400),
+               AccountFilter(from_account=account),
+               FilterSet(filters=[StringFilter("super"), AmountFilter(to_amount=50)])]
+    for fltr in filters:
+        assert {x for x in mutations if fltr.matches_chain(x)} == fltr.apply(mutations)
+
+    assert parent.chain() == [parent]
+    assert filters[0].chain() == [parent, filters[0]]
+    assert filters[0].chain_fields() == {"description"}
@@ -0,0 +1,74 @@
+import datetime
+import os
+from decimal import Decimal
+
+import pytest
+
+from sitdown.classifiers import Category
+from tests.factories import MutationFactory
+
+pytest.importorskip("PyQt5")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+from PyQt5.QtCore import Qt  # noqa: E402
+from PyQt5.QtWidgets import QApplication  # noqa: E402
+
+from sitdown.gui.mainwindow import MainAnotatorWindow, MutationsTableModel  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+@pytest.fixture
+def model(app):
+    descriptions = ["Albert Heijn 1", "albert heijn 2", "NS Reizen", "Bol.com", "Salaris"]
+    return MutationsTableModel([MutationFactory(
+        description=x, amount=Decimal(amount), date=datetime.date(2019, 1, day),
+        categories={Category("groceries")} if day < 3 else set())
+        for x, amount, day in zip(descriptions, ["-1.50", "-20.00", "-3.25", "-15.00",
+                                                 "2000.00"], [3, 1, 5, 2, 4])])
+
+
+def column(model, name):
+    return [model.data(model.index(row, model.column_numbers[name]))
+            for row in range(model.rowCount())]
+
+
+def test_model(model):
+    assert model.rowCount() == 5
+    assert model.columnCount() == 5
+    assert model.headerData(2, Qt.Horizontal) == "amount"
+    assert column(model, "amount")[0] == "-1.50 EURO"
+    assert column(model, "date")[0] == "2019-01-03"
+    assert column(model, "categories")[:3] == ["", "groceries", ""]
+    assert model.mutation(2).description == "NS Reizen"
+
+
+def test_sort_and_filter(model):
+    model.sort(model.column_numbers["amount"], Qt.DescendingOrder)
+    assert column(model, "description") == [
+        "Salaris", "Albert Heijn 1", "NS Reizen", "Bol.com", "albert heijn 2"]
+    model.set_filter("ALBERT")
+    assert column(model, "description") == ["Albert Heijn 1", "albert heijn 2"]
+    model.set_filter("albert heijn 2")  # narrows down the previous search
+    assert column(model, "description") == ["albert heijn 2"]
+    model.sort(model.column_numbers["description"])
+    model.set_filter("e")
+    assert column(model, "description") == [
+        "Albert Heijn 1", "albert heijn 2", "NS Reizen"]
+    model.sort(-1)
+    model.set_filter("")
+    assert model.rowCount() == 5
+    assert column(model, "description")[0] == "Albert Heijn 1"
+    model.presort()
+    assert len(model._permutations) == 5
+
+
+def test_window(model):
+    window = MainAnotatorWindow()
+    window.set_model(model)
+    window.searchEdit.setText("bol")
+    assert model.rowCount() == 1
+    assert window.statusLabel.text() == "1 of 5 mutations"
+    window.close()
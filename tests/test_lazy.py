@@ -0,0 +1,27 @@
+import subprocess
+import sys
+
+from sitdown.lazy import LazyModule, lazy_import
+
+
+def test_lazy_module():
+    lazy = LazyModule("colorsys")
+    assert "LazyModule" in repr(type(lazy))
+    assert lazy.rgb_to_hsv(1, 0, 0) == (0, 1, 1)
+    assert lazy.rgb_to_hsv is sys.modules["colorsys"].rgb_to_hsv
+
+
+def test_lazy_import_returns_imported_module():
+    assert lazy_import("sys") is sys
+
+
+def test_no_heavy_imports():
+    """Importing sitdown modules for text-only work should not import heavy
+    dependencies"""
+    check = ("import sys, sitdown.cli, sitdown.views, sitdown.query, "
+             "sitdown.plots, sitdown.reports, sitdown.classifiers; "
+             "print(' '.join(x for x in ('numpy', 'matplotlib', 'yaml') "
+             "if x in sys.modules))")
+    output = subprocess.run([sys.executable, "-c", check], check=True,
+                            stdout=subprocess.PIPE, universal_newlines=True).stdout
+    assert output.split() == []
@@ -0,0 +1,73 @@
+import json
+
+from sitdown.classifiers import StringMatchClassifier, Category
+from sitdown.filters import StringFilter, AmountFilter, FilterSet
+from sitdown.profiling import Profiler, is_profiling, stage, profiled
+from sitdown.query import Query
+from sitdown.views import MonthSet, MonthMatrix
+
+
+def test_no_recording_outside_profiler():
+    assert not is_profiling()
+    with stage("outside") as running:
+        running.rows = 10
+    with Profiler() as profiler:
+        assert is_profiling()
+    assert not is_profiling()
+    assert profiler.report() == []
+
+
+def test_nested_stages():
+    @profiled(rows=len)
+    def make_list(n):
+        return [0] * n
+
+    with Profiler() as profiler:
+        with stage("outer", rows=3):
+            make_list(10)
+            make_list(100000)
+        make_list(5)
+
+    outer, inner, top_level = profiler.report()
+    assert (outer.name, outer.depth, outer.rows) == ("outer", 0, 3)
+    assert inner.path == ("outer", inner.name)
+    assert inner.name.endswith("make_list")
+    assert (inner.calls, inner.rows) == (2, 100010)
+    assert (top_level.depth, top_level.rows) == (0, 5)
+    # the big list shows up in the inner stage and in the stage around it
+    assert inner.peak_memory >= 100000 * 8
+    assert outer.peak_memory >= inner.peak_memory
+    assert outer.seconds >= inner.seconds
+    json.dumps(profiler.as_dict())
+    assert "  " + inner.name in profiler.format_report()
+
+
+def test_pipeline_stages(long_mutation_sequence):
+    classifier = StringMatchClassifier({"shop": Category("shopping")})
+    median = sorted(x.amount for x in long_mutation_sequence)[100]
+    big = AmountFilter(from_amount=median, description="big")
+    anything = StringFilter("", description="any", parent=big)
+    filter_set = FilterSet([anything, AmountFilter(to_amount=median, description="small")])
+
+    with Profiler(memory=False) as profiler:
+        Query(long_mutation_sequence).classify(classifier).count()
+        for mutation in long_mutation_sequence:
+            classifier.classify(mutation)  # single calls are not recorded
+        filtered = filter_set.get_filtered_data_set(long_mutation_sequence)
+        MonthMatrix(filtered)
+
+    stats = {x.path: x for x in profiler.report()}
+    n = len(long_mutation_sequence)
+    assert stats[("Classify with StringMatchClassifier",)].rows == n
+    assert stats[("Classify with StringMatchClassifier",)].calls == 1
+    # filters in a chain are recorded separately, parent first
+    assert stats[("AmountFilter 'big'",)].rows == n
+    assert stats[("StringFilter 'any'",)].rows == \
+        len(big.apply(long_mutation_sequence))
+    assert stats[("MonthMatrix",)].rows == sum(len(x.mutations) for x in filtered)
+    assert stats[("MonthMatrix", "MonthSet")].calls == 2
+    assert all(x.peak_memory == 0 for x in stats.values())
+
+    with Profiler() as profiler:
+        MonthSet(long_mutation_sequence)
+    assert profiler.report()[0].rows == n
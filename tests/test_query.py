@@ -0,0 +1,132 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+
+from sitdown.classifiers import Category, StringMatchClassifier
+from sitdown.core import MutationSet
+from sitdown.currency import CurrencyError, RateTable
+from sitdown.filters import StringFilter, AmountFilter, FilterSet
+from sitdown.query import Query
+from sitdown.views import Month, MonthSet
+from tests.factories import MutationFactory
+
+
+@pytest.fixture
+def shop_mutations():
+    return {MutationFactory(description="shop A", amount=Decimal("10.10"),
+                            date=datetime.date(2018, 1, 5)) for _ in range(3)} | \
+           {MutationFactory(description="shop A", amount=Decimal("-2.50"),
+                            date=datetime.date(2018, 3, 5)) for _ in range(2)} | \
+           {MutationFactory(description="shop B", amount=Decimal("5.00"),
+                            date=datetime.date(2018, 1, 5)) for _ in range(4)}
+
+
+class FieldRecordingStore:
+    """Store that records which fields were requested by a query"""
+
+    def __init__(self, mutations):
+        self.mutations = mutations
+        self.requested = None
+
+    def __iter__(self):
+        return iter(self.mutations)
+
+    def scan(self, fields):
+        self.requested = set(fields)
+        return iter(self.mutations)
+
+
+def test_query_matches_filters(shop_mutations):
+    string_filter = StringFilter("shop a")
+    amount_filter = AmountFilter(from_amount=0, parent=string_filter)
+
+    query = Query(shop_mutations).where(amount_filter)
+    assert query.mutations() == amount_filter.apply(shop_mutations)
+    assert query.count() == 3
+    assert query.sum() == Decimal("30.30")
+
+
+def test_query_is_lazy_and_immutable(shop_mutations):
+    calls = []
+
+    def check(mutation):
+        calls.append(mutation)
+        return True
+
+    base = Query(shop_mutations)
+    query = base.where(check)
+    assert not calls
+    assert len(base.steps) == 0
+    assert query.count() == 9
+    assert len(calls) == 9
+
+
+def test_query_shared_parent_checked_once(shop_mutations):
+    parent = StringFilter("shop")
+    query = Query(shop_mutations)\
+        .where(AmountFilter(from_amount=0, parent=parent))\
+        .where(StringFilter("B", parent=parent))
+    assert len(query.steps) == 3
+    assert query.count() == 4
+
+
+def test_query_filter_set(shop_mutations):
+    filter_set = FilterSet(filters=[StringFilter("shop A"), StringFilter("shop B")])
+    assert Query(shop_mutations).where(filter_set).mutations() == \
+        filter_set.apply(shop_mutations)
+
+
+def test_query_group_by_month(shop_mutations):
+    grouped = Query(MutationSet(shop_mutations)).group_by_month()
+    assert grouped.sum() == {Month("2018/01"): Decimal("50.30"),
+                             Month("2018/03"): Decimal("-5.00")}
+    assert list(grouped.sum().keys()) == [Month("2018/01"), Month("2018/03")]
+    assert grouped.sum_in()[Month("2018/03")] == 0
+    assert grouped.sum_out()[Month("2018/03")] == Decimal("-5.00")
+    assert grouped.count() == {Month("2018/01"): 7, Month("2018/03"): 2}
+
+    month_set = grouped.month_set()
+    assert type(month_set) == MonthSet
+    assert month_set.sums() == list(grouped.sum().values())
+    assert Query([]).group_by_month().sum() == {}
+
+
+def test_query_projection_pushdown(shop_mutations):
+    store = FieldRecordingStore(shop_mutations)
+    Query(store).where(StringFilter("shop")).group_by_month().sum()
+    # currency is read so that amounts in different currencies are not added
+    assert store.requested == {"description", "date", "amount", "currency"}
+
+    # unknown predicate means all fields might be needed. Full scan
+    store = FieldRecordingStore(shop_mutations)
+    Query(store).where(lambda x: True).group_by_month().sum()
+    assert store.requested is None
+
+
+def test_query_classify(shop_mutations):
+    shop = Category("shop")
+    classifier = StringMatchClassifier(mapping={"shop B": shop})
+    result = Query(shop_mutations).classify(classifier).where(
+        lambda x: shop in x.categories).mutations()
+    assert len(result) == 4
+
+
+def test_query_currencies(shop_mutations):
+    mutations = shop_mutations | {MutationFactory(
+        description="shop US", amount=Decimal("-10.00"), currency="USD",
+        date=datetime.date(2018, 3, 5))}
+    query = Query(mutations)
+    assert query.currencies() == ["EUR", "USD"]
+    with pytest.raises(CurrencyError):
+        query.sum()
+    with pytest.raises(CurrencyError):
+        query.group_by_month().sum()
+    assert query.in_currency("euro").sum() == Decimal("45.30")
+    assert query.in_currency("USD").group_by_month().sum() == \
+        {Month("2018/03"): Decimal("-10.00")}
+
+    rates = Query(mutations, rates=RateTable(
+        rates={"USD": [(datetime.date(2018, 1, 1), 0.8)]}))
+    assert rates.where(StringFilter("shop")).sum() == Decimal("37.30")
+    assert rates.group_by_month().sum()[Month("2018/03")] == Decimal("-13.00")
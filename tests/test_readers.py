@@ -2,8 +2,15 @@
 # -*- coding: utf-8 -*-
 
 import datetime
+import io
+import tracemalloc
+from decimal import Decimal
 
-from sitdown.readers import ABNAMROReader
+import pytest
+
+from sitdown.readers import ABNAMROReader, CAMT053Reader, CSVReader, MT940Reader, \
+    OFXReader, ReaderException, SNIFF_SIZE, detect_reader, parse_amount, read_file, \
+    read_files
 from tests import RESOURCE_PATH
 
 
@@ -14,3 +21,185 @@ def test_abn_amro_reader():
     assert len(mutations) == 5
     assert type(mutations.pop().amount) == float
     assert type(mutations.pop().date) == datetime.date
+
+
+@pytest.mark.parametrize("file_name, expected", [
+    ("example_abn_export.TAB", ABNAMROReader),
+    ("example_ing_export.csv", CSVReader),
+    ("example_export.ofx", OFXReader),
+    ("example_camt053.xml", CAMT053Reader),
+    ("example_mt940.sta", MT940Reader)])
+def test_detect_reader(file_name, expected):
+    with open(RESOURCE_PATH / file_name, "rb") as f:
+        assert detect_reader(f.read(SNIFF_SIZE), file_name) is expected
+
+
+def test_detect_reader_head_cut_in_character():
+    row = "20200103," + "é" * 20 + ",-1.00\n"
+    head = ("Datum,Naam,Bedrag\n" + row * 100).encode("utf-8")[:SNIFF_SIZE]
+    assert head.endswith("é".encode("utf-8")[:1])
+    assert CSVReader.sniff(head) == 0.5
+    assert detect_reader(head, "export.csv") is CSVReader
+
+
+def test_detect_reader_unknown():
+    with pytest.raises(ReaderException):
+        detect_reader(b"nothing to see here")
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("-3,15", "-3.15"), ("1.234,56", "1234.56"), ("1,234.56", "1234.56"),
+    ("-1000.00", "-1000.00"), (" 12 ", "12")])
+def test_parse_amount(text, expected):
+    assert parse_amount(text) == Decimal(expected)
+
+
+def test_parse_amount_invalid():
+    with pytest.raises(ValueError):
+        parse_amount("twelve")
+
+
+def test_csv_reader():
+    mutations = sorted(read_file(RESOURCE_PATH / "example_ing_export.csv"))
+    salary, shop, train = mutations
+    assert salary.amount == Decimal("1000.00")
+    assert salary.date == datetime.date(2020, 1, 3)
+    assert salary.opposite_account == "NL20RABO0123456789"
+    assert salary.description == "Werkgever BV Salaris januari"
+    assert shop.amount == Decimal("-23.45")
+    assert shop.opposite_account is None
+    assert shop.balance_before == Decimal("1000.00")
+    assert train.account.number == "NL11INGB0001234567"
+
+
+def test_ofx_reader():
+    mutations = sorted(OFXReader().read(RESOURCE_PATH / "example_export.ofx"))
+    salary, bread = mutations
+    assert salary.amount == Decimal("-1000.00")
+    assert salary.date == datetime.date(2020, 1, 3)
+    assert salary.account.number == "NL20RABO0123456789"
+    assert salary.opposite_account == "NL11INGB0001234567"
+    assert salary.description == "J Jones Salaris januari"
+    assert salary.currency == "EUR"
+    assert (bread.amount, bread.description) == (Decimal("-12.50"), "Bakkerij")
+
+
+def test_read_files_mixed_formats():
+    files = [RESOURCE_PATH / "example_ing_export.csv",
+             RESOURCE_PATH / "example_export.ofx"]
+    serial = read_files(files, processes=1)
+    parallel = read_files(files, processes=2)
+    assert list(serial) == files
+    assert {k: len(v) for k, v in serial.items()} == \
+        {k: len(v) for k, v in parallel.items()} == {files[0]: 3, files[1]: 2}
+
+
+def test_camt053_reader():
+    salary, shop = sorted(read_file(RESOURCE_PATH / "example_camt053.xml"))
+    assert salary.amount == Decimal("1000.00")
+    assert salary.account.number == "NL20RABO0123456789"
+    assert salary.opposite_account == "NL11INGB0001234567"  # debtor, as we receive
+    assert salary.description == "Werkgever BV Salaris januari"
+    assert shop.amount == Decimal("-23.45")
+    assert shop.date == datetime.date(2020, 1, 5)
+    assert shop.opposite_account == "123456789"
+    assert shop.description == "Albert Heijn Betaalautomaat 05-01-2020"
+
+
+def test_camt053_reader_memory_does_not_grow():
+    entry = ("<Ntry><Amt Ccy='EUR'>1.00</Amt><CdtDbtInd>DBIT</CdtDbtInd>"
+             "<BookgDt><Dt>2020-01-01</Dt></BookgDt>"
+             "<AddtlNtryInf>" + "x" * 500 + "</AddtlNtryInf></Ntry>")
+    document = ("<Document xmlns='urn:iso:std:iso:20022:tech:xsd:camt.053.001.02'>"
+                "<BkToCstmrStmt><Stmt><Acct><Id><IBAN>NL20RABO0123456789</IBAN>"
+                "</Id></Acct>" + entry * 10000 + "</Stmt></BkToCstmrStmt>"
+                "</Document>").encode()
+    stream = io.BytesIO(document)
+
+    tracemalloc.start()
+    try:
+        count = sum(1 for _ in CAMT053Reader().iter_mutations(stream))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert count == 10000
+    assert peak < len(document) / 5
+
+
+def test_mt940_reader():
+    salary, shop, train = sorted(read_file(RESOURCE_PATH / "example_mt940.sta"))
+    assert salary.account.number == "NL20RABO0123456789"
+    assert salary.amount == Decimal("1000.00")
+    assert salary.opposite_account == "NL11INGB0001234567"
+    assert salary.description == "Werkgever BV Salaris januari"
+    assert (salary.balance_before, salary.balance_after) == \
+        (Decimal("1000.00"), Decimal("2000.00"))
+
+    assert shop.amount == Decimal("-23.45")
+    assert shop.opposite_account == "NL30ABNA0987654321"
+    assert shop.description == "Albert Heijn Boodschappen"
+    assert shop.balance_before == salary.balance_after
+
+    # unstructured information: no counterparty guessed from the text
+    assert train.date == datetime.date(2020, 1, 7)
+    assert train.opposite_account is None
+    assert train.description == "BEA NR:12345 07.01.20 NS Reizigers Utrecht"
+    assert train.balance_after == Decimal("1972.45")
+
+
+def test_mt940_reader_raises_on_bad_balance(tmpdir):
+    path = tmpdir / "bad.sta"
+    path.write_binary(b":20:STATEMENT\r\n:25:NL20RABO0123456789 EUR\r\n"
+                      b":60F:garbage\r\n")
+    with pytest.raises(ReaderException, match="line 3 ':60F:garbage'"):
+        MT940Reader().read(str(path))
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("NL20RABO0123456789 EUR", "NL20RABO0123456789"),
+    ("NL20RABO0123456789EUR", "NL20RABO0123456789"),
+    ("ABNANL2A/123456789", "123456789")])
+def test_mt940_parse_account(text, expected):
+    assert MT940Reader.parse_account(text) == expected
+
+
+GOOD_LINE = b"1\tEUR\t20160715\t1,00\t2,00\t20160715\t1,00\tok %d\n"
+
+
+def test_abn_amro_reader_raises_on_bad_line(tmpdir):
+    path = tmpdir / "bad.TAB"
+    path.write_binary(GOOD_LINE % 1 + b"1\tEUR\t2016\tbroken\n")
+    with pytest.raises(ReaderException, match="line 2"):
+        ABNAMROReader().read(str(path))
+
+
+def test_abn_amro_reader_tolerant(tmpdir):
+    path = tmpdir / "bad.TAB"
+    bad_line = b"1\tEUR\t20160715\tbroken\t2,00\t20160715\t1,00\tbad\n"
+    path.write_binary(GOOD_LINE % 1 + bad_line + GOOD_LINE % 3 + b"too short\n")
+    reader = ABNAMROReader()
+
+    mutations, report = reader.read_tolerant(str(path))
+    assert len(mutations) == 2
+    assert not report.ok
+    assert [(x.line_number, x.offset, x.raw) for x in report.errors] == \
+        [(2, len(GOOD_LINE % 1), bad_line),
+         (4, len(GOOD_LINE % 1 + bad_line + GOOD_LINE % 3), b"too short\n")]
+    assert "Not an amount" in report.errors[0].reason
+    assert report.offset == path.size()
+
+    # fix the first bad line, making it longer. Only bad lines are parsed again
+    path.write_binary(GOOD_LINE % 1 + bad_line.replace(b"broken", b"1000,00") +
+                      GOOD_LINE % 3 + b"too short\n")
+    fixed = reader.reparse(str(path), report)
+    assert [x.description for x in fixed] == ["bad"]
+    assert [x.line_number for x in report.errors] == [4]
+    assert report.errors[0].offset == path.size() - len(b"too short\n")
+    assert report.offset == path.size()
+
+    # resume after lines were added to the file
+    with open(str(path), "ab") as f:
+        f.write(GOOD_LINE % 5)
+    added, report = reader.read_tolerant(str(path), resume=report)
+    assert [x.description for x in added] == ["ok 5"]
+    assert report.line_number == 5
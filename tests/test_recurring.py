@@ -0,0 +1,55 @@
+import datetime
+from decimal import Decimal
+
+from sitdown.core import BankAccount
+from sitdown.recurring import RecurringDetector, add_months, counterparty
+from tests.factories import MutationFactory
+
+account = BankAccount(number="625381173")
+
+
+def mutation(amount, date, description="", opposite=None):
+    return MutationFactory(account=account, amount=Decimal(amount), date=date,
+                           description=description, opposite_account=opposite)
+
+
+def test_counterparty():
+    assert counterparty(mutation("1", datetime.date(2019, 1, 1),
+                                 opposite="nl01 bank 0123")) == "NL01BANK0123"
+    assert counterparty(mutation(
+        "1", datetime.date(2019, 1, 1),
+        "SEPA iDEAL   IBAN: NL01  Naam: Bol.com   Omschrijving: 123")) == "bol.com"
+    assert counterparty(mutation(
+        "1", datetime.date(2019, 1, 1),
+        "BEA   NR:12345678 05.01.19/13.45 NETFLIX.COM AMSTERDAM,PAS123")) == \
+        "netflix com amsterdam"
+
+
+def test_add_months():
+    assert add_months(datetime.date(2019, 1, 31), 1) == datetime.date(2019, 2, 28)
+    assert add_months(datetime.date(2019, 11, 15), 3) == datetime.date(2020, 2, 15)
+
+
+def test_detect():
+    start = datetime.date(2018, 1, 1)
+    rent = [mutation("-950.00", add_months(start, i), opposite="NL01RENT01")
+            for i in range(12)]
+    # varying amounts and one missed month are allowed
+    energy = [mutation(str(-80 - i % 3), add_months(start, i) + datetime.timedelta(days=i % 3),
+                       f"BEA NR:{i} ENERGIE BV,PAS123") for i in range(12) if i != 5]
+    weekly = [mutation("25.00", start + datetime.timedelta(weeks=i), "pocket money")
+              for i in range(10)]
+    # same counterparty, but neither regular in time nor in amount
+    shop = [mutation(str(-5 * i * i), start + datetime.timedelta(days=i * i), "Shop")
+            for i in range(1, 10)]
+    refund = [mutation("950.00", datetime.date(2018, 3, 1), opposite="NL01RENT01")]
+
+    series = RecurringDetector().detect(rent + energy + weekly + shop + refund)
+    assert [(x.counterparty, x.period, len(x)) for x in series] == [
+        ("NL01RENT01", "monthly", 12), ("energie bv", "monthly", 11),
+        ("pocket money", "weekly", 10)]
+    assert series[0].amount == Decimal("-950.00")
+    assert series[0].next_date == datetime.date(2019, 1, 1)
+    assert series[1].regularity == 0.9  # the missed month counts as one irregular interval
+    assert series[2].next_date == start + datetime.timedelta(weeks=10)
+    assert RecurringDetector().detect([]) == []
@@ -0,0 +1,86 @@
+import pytest
+
+from sitdown import reports
+
+from sitdown.filters import FilterSet, StringFilter
+from sitdown.plots import prepare_balance, prepare_in_out
+from sitdown.reports import ReportSpec, BatchRenderer, render_figure
+from sitdown.views import MonthSet
+
+
+@pytest.fixture
+def some_specs(long_mutation_sequence):
+    mutations = list(long_mutation_sequence)
+    filtered = FilterSet(filters=[StringFilter("a"), StringFilter("b")])\
+        .get_filtered_data_set(set(mutations))
+    return [ReportSpec("in_out", "in_out", mutations),
+            ReportSpec("month_set", "month_set", mutations, title="per month",
+                       formats=("png", "svg")),
+            ReportSpec("month_set_small", "month_set", mutations, figsize=(2, 2),
+                       downsample=True),
+            ReportSpec("matrix", "month_matrix", filtered),
+            ReportSpec("balance", "balance", mutations, downsample="lttb")]
+
+
+def test_report_spec():
+    with pytest.raises(ValueError):
+        ReportSpec("name", "unknown_kind", [])
+    assert ReportSpec("name", "balance", [], figsize=(10, 5), dpi=100)\
+        .pixel_width() == 775
+
+
+def test_batch_renderer_in_process(tmpdir, some_specs):
+    renderer = BatchRenderer(output_dir=tmpdir / "reports", processes=1)
+    paths = renderer.render(some_specs)
+    assert [x.name for x in paths] == ["in_out.png", "month_set.png",
+                                       "month_set.svg", "month_set_small.png",
+                                       "matrix.png", "balance.png"]
+    assert all(x.exists() and x.stat().st_size > 0 for x in paths)
+
+    # specs sharing the same data share a single aggregate
+    assert len(renderer.aggregates) == 4
+    month_set = renderer.aggregate(some_specs[1])
+    assert type(month_set) == MonthSet
+    assert month_set is renderer.aggregate(some_specs[2])
+
+
+def test_batch_renderer_parallel(tmpdir, some_specs):
+    paths = BatchRenderer(output_dir=tmpdir, processes=2).render(some_specs)
+    assert len(paths) == 6
+    assert all(x.exists() for x in paths)
+    assert BatchRenderer(output_dir=tmpdir, processes=2).render([]) == []
+
+
+def test_render_figure_does_not_use_pyplot(tmpdir, long_mutation_sequence):
+    import matplotlib.pyplot as plt
+    before = plt.get_fignums()
+    spec = ReportSpec("set", "month_set", list(long_mutation_sequence))
+    job = BatchRenderer(output_dir=tmpdir).prepare(spec)
+    render_figure("month_set", job, None, (4, 4), 50, [str(tmpdir / "a.png")])
+    assert plt.get_fignums() == before
+
+
+def test_batch_renderer_prepares_once(tmpdir, long_mutation_sequence, monkeypatch):
+    calls = []
+    for name in ("prepare_balance", "in_out_series"):
+        def counted(mutations, function=getattr(reports, name), name=name):
+            calls.append(name)
+            return function(mutations)
+        monkeypatch.setattr(reports, name, counted)
+
+    mutations = list(long_mutation_sequence)
+    specs = [ReportSpec(f"{kind}_{size}", kind, mutations, figsize=(size, 4),
+                        downsample="minmax" if size < 8 else None)
+             for kind in ("balance", "in_out") for size in (0.5, 1, 12)]
+    renderer = BatchRenderer(output_dir=tmpdir, processes=1)
+    prepared = [renderer.prepare(x) for x in specs]
+    assert sorted(calls) == ["in_out_series", "prepare_balance"]
+    # each spec is still downsampled to its own width
+    assert [len(x[0][0][1]) for x in prepared[:3]] == [38, 76, 80]
+    for spec, (lines,) in zip(specs, prepared):
+        width = spec.pixel_width() if spec.downsample else None
+        if spec.kind == "balance":
+            expected = prepare_balance(mutations, width, spec.downsample)
+        else:
+            expected = prepare_in_out(mutations, width)
+        assert repr(lines) == repr(expected)
@@ -0,0 +1,140 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+
+from sitdown.classifiers import Category
+from sitdown.core import BankAccount
+from sitdown.currency import CurrencyError, RateTable
+from sitdown.filters import (AccountFilter, AmountFilter, CategoryFilter,
+                             CatchAllFilter, Filter, FilterSet, StringFilter)
+from sitdown.query import Query
+from sitdown.store import MutationStore
+from sitdown.views import Month
+from tests.factories import MutationFactory
+
+shopping = Category("shopping")
+groceries = Category("groceries", parent=shopping)
+account1 = BankAccount(number=1233454, description="test1")
+account2 = BankAccount(number="NL01BANK0123456789", description="test2")
+
+
+@pytest.fixture
+def mutations():
+    return {MutationFactory(description="Shop Ä", amount=Decimal("10.10"),
+                            date=datetime.date(2018, 1, 5), account=account1,
+                            categories={groceries}),
+            MutationFactory(description="shop ä", amount=Decimal("-2.50"),
+                            date=datetime.date(2018, 3, 5), account=account1,
+                            opposite_account=account2, categories={shopping}),
+            MutationFactory(description="salary", amount=Decimal("2000.00"),
+                            date=datetime.date(2018, 3, 25), account=account2,
+                            opposite_account="NL99BANK0000000001",
+                            balance_before=None, balance_after=None),
+            MutationFactory(description="rent", amount=-800.5, balance_after=0.0,
+                            date=datetime.date(2018, 4, 1), account=account2)}
+
+
+@pytest.fixture
+def store(mutations, tmpdir):
+    with MutationStore(tmpdir / "mutations.sqlite") as store:
+        store.add(mutations, batch_size=3)
+        yield store
+
+
+def test_store_roundtrip(store, mutations, tmpdir):
+    assert len(store) == 4
+    assert set(store) == mutations
+    stored = {x.description: x for x in store}
+    assert stored["Shop Ä"].categories == {groceries}
+    assert stored["shop ä"].opposite_account == account2
+    assert stored["salary"].balance_before is None
+    assert stored["rent"].amount == Decimal("-800.50")
+
+    # adding again only adds new categories
+    rent = [x for x in mutations if x.description == "rent"][0]
+    rent.categories = {shopping}
+    assert store.add(mutations) == 0
+    assert len(store) == 4
+    store.close()
+    with MutationStore(tmpdir / "mutations.sqlite") as reopened:
+        assert {x.description: x for x in reopened}["rent"].categories == {shopping}
+
+
+@pytest.mark.parametrize("fltr", [
+    StringFilter("SHOP ä"),
+    AmountFilter(from_amount=0, to_amount=100),
+    AmountFilter(to_amount=Decimal("-2.50")),
+    AccountFilter(from_account=account1),
+    AccountFilter(from_account=account1, to_account=account2),
+    CategoryFilter(shopping),
+    CategoryFilter(shopping, exclude=True),
+    CategoryFilter(groceries, parent=AmountFilter(from_amount=0)),
+    FilterSet([StringFilter("rent"), CatchAllFilter("rest")]),
+    FilterSet([StringFilter("rent"), AmountFilter(to_amount=0)], parent=StringFilter("e")),
+])
+def test_filters_in_sql(store, mutations, fltr):
+    assert fltr.chain_to_sql() is not None
+    assert fltr.apply(store) == fltr.apply(mutations)
+
+
+def test_filters_in_python(store, mutations):
+    class PositiveFilter(AmountFilter):
+        def to_sql(self):
+            return None  # checked on each row
+
+    fltr = PositiveFilter(from_amount=0, parent=StringFilter("shop"))
+    assert fltr.chain_to_sql() is None
+    assert fltr.apply(store) == fltr.apply(mutations)
+    assert store.count(fltr.chain()) == 1
+
+
+def test_untranslatable_filter_on_categories(store, mutations):
+    class ShoppingFilter(Filter):
+        """Only implements _filter(), so matches() needs hashable mutations"""
+        fields = ("amount", "categories")
+
+        def _filter(self, data):
+            return {x for x in data if x.amount < 0 and shopping in x.categories}
+
+    fltr = ShoppingFilter()
+    assert fltr.chain_to_sql() is None
+    assert store.count([fltr]) == 1
+    assert fltr.apply(store) == fltr.apply(mutations)
+    assert [x.amount for x in store.scan(fields=("amount",), filters=[fltr])] == \
+        [Decimal("-2.50")]
+
+
+def test_query_on_store(store, mutations):
+    query = Query(store).where(AmountFilter(to_amount=0))
+    assert query.mutations() == Query(mutations).where(AmountFilter(to_amount=0)).mutations()
+    grouped = Query(store).where(AccountFilter(from_account=account1)).group_by_month()
+    expected = Query(mutations).where(AccountFilter(from_account=account1)).group_by_month()
+    assert grouped.sum() == expected.sum()
+    assert grouped.sum_out() == expected.sum_out()
+    assert grouped.count() == expected.count()
+    # lambdas can not be grouped in SQL
+    assert Query(store).where(lambda x: x.amount > 0).group_by_month().sum() == \
+        Query(mutations).where(lambda x: x.amount > 0).group_by_month().sum()
+
+
+def test_query_currencies_on_store(store, mutations):
+    store.add([MutationFactory(description="dollars", amount=Decimal("-10.00"),
+                               currency="USD", date=datetime.date(2018, 3, 6),
+                               account=account1)])
+    assert Query(store).currencies() == ["EUR", "USD"]
+    with pytest.raises(CurrencyError):
+        Query(store).group_by_month().sum()
+    assert Query(store).where(AccountFilter(from_account=account2)).group_by_month() \
+        .sum() == Query(mutations).where(AccountFilter(from_account=account2)) \
+        .group_by_month().sum()
+    rates = RateTable(rates={"USD": [(datetime.date(2018, 1, 1), 0.5)]})
+    assert Query(store, rates=rates).where(AccountFilter(from_account=account1)) \
+        .group_by_month().sum() == {Month("2018/01"): Decimal("10.10"),
+                                    Month("2018/03"): Decimal("-7.50")}
+
+
+def test_filter_set_on_store(store, mutations):
+    filter_set = FilterSet([StringFilter("shop"), CatchAllFilter("rest")])
+    assert [x.mutations for x in filter_set.get_filtered_data_set(store)] == \
+        [x.mutations for x in filter_set.get_filtered_data_set(mutations)]
@@ -0,0 +1,54 @@
+import datetime
+from decimal import Decimal
+
+from sitdown.core import BankAccount
+from sitdown.filters import CategoryFilter
+from sitdown.transfers import TRANSFER, TransferMatcher, account_key
+from tests.factories import MutationFactory
+
+checking = BankAccount(number="625381173", description="checking")
+savings = BankAccount(number="254265944", description="savings")
+other = BankAccount(number="111111111", description="someone else")
+
+
+def mutation(account, amount, day, opposite=None):
+    return MutationFactory(account=account, amount=Decimal(amount),
+                           date=datetime.date(2019, 1, day), opposite_account=opposite)
+
+
+def test_account_key():
+    assert account_key(checking) == account_key("NL12ABNA0625381173") == "625381173"
+    assert account_key("NL86 INGB 0008 4355 88") == "8435588"
+    assert account_key(None) is None
+
+
+def test_match_transfers():
+    out = mutation(checking, "-100.00", 10, opposite="NL12ABNA0254265944")
+    into = mutation(savings, "100.00", 11, opposite="NL12ABNA0625381173")
+    # a second candidate further away in date, and one without account names
+    later = mutation(savings, "100.00", 13, opposite="NL12ABNA0625381173")
+    unnamed = mutation(savings, "100.00", 10)
+    # same amount, but from someone else, or too late
+    salary = mutation(checking, "100.00", 10, opposite="NL12ABNA0111111111")
+    late_out = mutation(checking, "-50.00", 1, opposite="NL12ABNA0254265944")
+    late_in = mutation(savings, "50.00", 5)
+    mutations = {out, into, later, unnamed, salary, late_out, late_in}
+
+    matcher = TransferMatcher(accounts=[checking, savings], max_days=3)
+    transfers = matcher.match(mutations)
+    assert len(transfers) == 1
+    assert (transfers[0].outgoing, transfers[0].incoming) == (out, into)
+    assert transfers[0].days == 1
+
+    assert matcher.exclude(mutations) == mutations - {out, into}
+    matcher.tag(mutations)
+    assert CategoryFilter(TRANSFER, exclude=True).apply(mutations) == \
+        mutations - {out, into}
+
+
+def test_match_one_to_one():
+    outs = [mutation(checking, "-20.00", 5, opposite=savings) for _ in range(3)]
+    ins = [mutation(savings, "20.00", 5 + i, opposite=checking) for i in range(2)]
+    transfers = TransferMatcher(accounts=[checking, savings]).match(outs + ins)
+    assert len(transfers) == 2
+    assert len({x.incoming for x in transfers}) == 2
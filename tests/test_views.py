@@ -1,11 +1,17 @@
 import datetime
+from decimal import Decimal
+
 import matplotlib.pyplot as plt
+import numpy as np
 import pytest
 
 
+from sitdown.classifiers import Category
+from sitdown.cube import UNCLASSIFIED
 from sitdown.filters import FilterSet, StringFilter
 from sitdown.core import MutationSet
-from sitdown.views import MonthSet, MonthMatrix, Month, MonthBin, MonthSeries
+from sitdown.views import MonthSet, MonthMatrix, Month, MonthBin, MonthSeries, CategoryMatrix, \
+    MonthGrid
 from tests.factories import MutationFactory
 
 
@@ -111,3 +117,144 @@ def test_month_matrix_plotting(shop_a_b_filtered_data_set):
     matrix = MonthMatrix(filtered_data_list=shop_a_b_filtered_data_set)
     matrix.plot()
     #plt.show()
+
+
+def test_month_matrix_arrays(shop_a_b_filtered_data_set):
+    matrix = MonthMatrix(filtered_data_list=shop_a_b_filtered_data_set)
+
+    sums = matrix.matrix()
+    assert sums.shape == (3, len(matrix.get_month_range()))
+    # rows are aligned with descriptions, columns with months
+    for row, description in enumerate(matrix.descriptions()):
+        assert sums[row] == pytest.approx([float(x) for x in matrix[description].sums()])
+
+    counts = matrix.matrix('count')
+    assert counts.sum() == 42
+    assert counts[1, matrix.month_index(Month("2017/09"))] == 1
+    assert matrix.matrix('in') + matrix.matrix('out') == pytest.approx(sums)
+
+    assert matrix.totals() == pytest.approx(sums.sum(axis=0))
+    assert matrix.stacked()[0] == pytest.approx(0)
+    assert matrix.stacked()[2] == pytest.approx(sums[0] + sums[1])
+    with pytest.raises(ValueError):
+        matrix.matrix('unknown_layer')
+
+
+def test_month_matrix_percentages(shop_a_b_filtered_data_set):
+    matrix = MonthMatrix(filtered_data_list=shop_a_b_filtered_data_set)
+    percentages = matrix.percentages()
+    totals = percentages.sum(axis=0)
+    # months without mutations have 0 percent for all categories
+    assert all(x == pytest.approx(100) or x == 0 for x in totals)
+
+
+def test_month_bin_sums_are_exact():
+    mutations = [MutationFactory(amount=x, balance_before=0.0,
+                                 date=datetime.date(2018, 1, 1))
+                 for x in (0.1, 0.2, -0.05)]
+    month_bin = MonthSet(mutations).bins()[0]
+    assert month_bin.sum() == Decimal("0.25")
+    assert month_bin.sum_in() == Decimal("0.3")
+    assert month_bin.sum_out() == Decimal("-0.05")
+
+
+def test_month_matrix_minor_units(shop_a_b_filtered_data_set):
+    matrix = MonthMatrix(filtered_data_list=shop_a_b_filtered_data_set)
+    minor_units = matrix.minor_units()
+    assert minor_units.dtype == np.int64
+    for row, description in enumerate(matrix.descriptions()):
+        assert [Decimal(int(x)) / 100 for x in minor_units[row]] == \
+            matrix[description].sums()
+
+
+def test_month_matrix_plotting_downsampled():
+    mutations = {MutationFactory(description="shop A",
+                                 date=datetime.date(1990 + i // 12, i % 12 + 1, 1))
+                 for i in range(240)}
+    data = FilterSet(filters=[StringFilter("shop A")]).get_filtered_data_set(mutations)
+    matrix = MonthMatrix(filtered_data_list=data)
+    _, ax = plt.subplots(figsize=(2, 2), dpi=100)
+    matrix.plot(ax, downsample=True)
+    assert len(ax.patches) < 240
+
+
+@pytest.fixture
+def category_tree():
+    shopping = Category("shopping")
+    return shopping, Category("groceries", parent=shopping), \
+        Category("clothes", parent=shopping), Category("rent")
+
+
+@pytest.fixture
+def classified_mutations(category_tree):
+    shopping, groceries, clothes, rent = category_tree
+
+    def mutation(amount, month, *categories):
+        return MutationFactory(amount=Decimal(amount), date=datetime.date(2018, month, 5),
+                               balance_after=Decimal(0), categories=set(categories))
+
+    return [mutation("-10.00", 1, groceries), mutation("-20.00", 1, clothes),
+            mutation("-5.00", 2, shopping), mutation("-0.01", 2, groceries, clothes),
+            mutation("-3.00", 3, groceries, shopping, rent), mutation("-500.00", 3, rent),
+            mutation("100.00", 3)]
+
+
+def test_category_matrix(classified_mutations, category_tree):
+    shopping, groceries, clothes, rent = category_tree
+    matrix = CategoryMatrix(classified_mutations, categories=[Category("gifts")])
+    assert matrix.descriptions() == ["<unclassified>", "gifts", "rent", "shopping"]
+    assert matrix.minor_units().tolist() == [
+        [0, 0, 10000], [0, 0, 0], [0, 0, -50150], [-3000, -501, -150]]
+    # the cent that can not be split goes to the first category by name
+    assert matrix.node(groceries).tolist() == [-1000, 0, -150]
+    assert matrix.node(shopping, layer="count").tolist() == [2, 3, 1]
+    assert matrix.totals().tolist() == [-30.0, -5.01, -403.0]
+    assert len(matrix[shopping]) == 1
+
+    matrix.expand(shopping)
+    assert matrix.descriptions() == [
+        "<unclassified>", "gifts", "rent", "clothes", "groceries", "shopping (other)"]
+    assert matrix.minor_units()[3:].tolist() == [
+        [-2000, -1, 0], [-1000, 0, -150], [0, -500, 0]]
+    matrix.collapse()
+    assert matrix.minor_units().shape == (4, 3)
+    matrix.expand_to(1)
+    assert len(matrix.rows()) == 6
+    matrix.plot()
+    plt.close("all")
+
+
+def test_category_matrix_is_not_a_month_matrix(classified_mutations, category_tree):
+    shopping, groceries, clothes, rent = category_tree
+    matrix = CategoryMatrix(classified_mutations)
+    # values are mutation lists, not MonthSeries. Only the dense arrays are shared
+    assert isinstance(matrix, MonthGrid) and not isinstance(matrix, MonthMatrix)
+    assert matrix.children() == [UNCLASSIFIED, rent, shopping]
+    assert matrix.children(shopping) == [clothes, groceries]
+    assert matrix.children(rent) == []
+
+
+def test_category_matrix_large_tree():
+    tops = [Category(f"top {i}") for i in range(50)]
+    leaves = [Category(f"leaf {i}", parent=x) for x in tops for i in range(40)]
+    mutations = [MutationFactory(amount=Decimal("-1.00"), date=datetime.date(2018, 1, 5),
+                                 categories={x}) for x in leaves]
+    matrix = CategoryMatrix(mutations)
+    matrix.expand_to(1)
+    assert len(matrix.rows()) == len(leaves)
+    assert matrix.totals().tolist() == [-len(leaves)]
+
+
+def test_category_matrix_allocation(classified_mutations, category_tree):
+    shopping, groceries, clothes, rent = category_tree
+    each = CategoryMatrix(classified_mutations, allocation="each")
+    assert each.node(groceries).tolist() == [-1000, -1, -300]
+    assert each.node(rent).tolist() == [0, 0, -50300]
+    first = CategoryMatrix(classified_mutations, allocation="first")
+    assert first.node(clothes).tolist() == [-2000, -1, 0]
+    assert first.node(groceries).tolist() == [-1000, 0, -300]
+    assert first.node(UNCLASSIFIED).tolist() == [0, 0, 10000]
+    with pytest.raises(ValueError):
+        CategoryMatrix(classified_mutations, allocation="random")
+    with pytest.raises(ValueError):
+        CategoryMatrix([])